@@ -0,0 +1,91 @@
+"""Microbenchmark of the JSON-RPC codecs.
+
+Compare stdlib json, orjson and msgpack (when installed) on payloads
+the size of typical `fs-list-dir` responses and `fs-set-content` requests.
+
+Usage: python benchmark/codec.py [--repeat N]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# pylint: disable=wrong-import-position
+import codec
+
+
+class StdlibJsonCodec(codec.Codec):
+    """The codec used before `codec.py` existed."""
+
+    name = "stdlib-json"
+
+    def encode(self, data):
+        return json.dumps(data)
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+def make_list_dir_payload(count: int):
+    """Response of `fs-list-dir` for a folder with `count` files and `count / 10` folders."""
+    return {
+        "jsonrpc": "2.0",
+        "id": "ID-1",
+        "result": {
+            "dirs": [f"folder-{index:06d}" for index in range(count // 10)],
+            "files": {
+                "names": [f"simulation-output-{index:06d}.h5" for index in range(count)],
+                "sizes": [index * 1024 for index in range(count)],
+            },
+        },
+    }
+
+
+def make_set_content_payload(size: int):
+    """Request of `fs-set-content` for a binary file of `size` bytes."""
+    return {
+        "jsonrpc": "2.0",
+        "id": "ID-2",
+        "method": "fs-set-content",
+        "params": {
+            "path": "/gpfs/project/mesh.obj",
+            "base64": True,
+            "content": base64.b64encode(os.urandom(size)).decode("ascii"),
+        },
+    }
+
+
+def bench(name: str, data, codecs, repeat: int):
+    print(f"{name}:")
+    for item in codecs:
+        encoded = item.encode(data)
+        encode_time = min(timeit.repeat(lambda: item.encode(data), number=1, repeat=repeat))
+        decode_time = min(timeit.repeat(lambda: item.decode(encoded), number=1, repeat=repeat))
+        print(
+            f"  {item.name:>12}: encode {encode_time * 1000:8.2f} ms,"
+            + f" decode {decode_time * 1000:8.2f} ms,"
+            + f" size {len(encoded) / 1024:10.1f} kB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the JSON-RPC codecs")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=20)
+    args = parser.parse_args()
+    codecs = [StdlibJsonCodec()] + list(codec.CODECS.values())
+    if codec.orjson is None:
+        print("orjson is not installed: the json codec uses the standard library.")
+    if codec.msgpack is None:
+        print("msgpack is not installed: the msgpack codec is not available.")
+    bench("fs-list-dir, 10k files", make_list_dir_payload(10_000), codecs, args.repeat)
+    bench("fs-list-dir, 200k files", make_list_dir_payload(200_000), codecs, args.repeat)
+    bench("fs-set-content, 1 MB", make_set_content_payload(1 << 20), codecs, args.repeat)
+    bench("fs-set-content, 32 MB", make_set_content_payload(32 << 20), codecs, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,44 @@
 """Application main module."""
 from api_version import VersionEntryPoint
+from api_fs_cache_info import FsCacheInfoEntryPoint
 from api_fs_exists import FsExistsEntryPoint
+from api_fs_get_content import FsGetContentEntryPoint
 from api_fs_get_root import FsGetRootEntryPoint
 from api_fs_list_dir import FsListDirEntryPoint
+from api_fs_search import FsSearchEntryPoint
 from api_fs_set_content import FsSetContentEntryPoint
+from api_fs_stat_batch import FsStatBatchEntryPoint
+from api_fs_upload_append import FsUploadAppendEntryPoint
+from api_fs_upload_begin import FsUploadBeginEntryPoint
+from api_fs_upload_commit import FsUploadCommitEntryPoint
+from api_metrics import MetricsEntryPoint
 from api_brayns_address import BraynsAddressEntryPoint
+from api_brayns_pool_info import BraynsPoolInfoEntryPoint
 from api_sonata_list_populations import SonataListPopulationsEntryPoint
+from api_sonata_node_attributes import SonataNodeAttributesEntryPoint
+from api_sonata_report_stats import SonataReportStatsEntryPoint
+from api_storage_session_delete import StorageSessionDeleteEntryPoint
 from api_storage_session_get import StorageSessionGetEntryPoint
+from api_storage_session_list import StorageSessionListEntryPoint
+from api_storage_session_patch import StorageSessionPatchEntryPoint
 from api_storage_session_set import StorageSessionSetEntryPoint
 from api_volume_parse_header import VolumeParseHeader
+from api_volume_read_level import VolumeReadLevel
+from api_volume_read_slab import VolumeReadSlab
 from backend import Server
+from brayns_pool import BraynsPool
+from fs_cache import FsCache
+from fs_index import FsIndex
+from log import LEVELS, setup as setup_logging
+from metrics import Metrics
+from session_storage import create_storage
+from sonata_cache import SonataCache
+from upload import Uploads
+from volume_pyramid import VolumePyramids
 from version import __version__
 import argparse
 import asyncio
+import os
 
 def main():
     """Application's main function.
@@ -31,7 +57,7 @@ def main():
     )
     parser.add_argument(
         "--brayns", 
-        help="name of a script that starts Brayns and accepts a PORT number as only argument",
+        help="name of a script that starts Brayns and accepts a PORT number and a VERSION as arguments",
         dest="brayns", 
         action="store",
         required=True,
@@ -45,6 +71,78 @@ def main():
         required=True,
         type=str
     )
+    parser.add_argument(
+        "--brayns-timeout",
+        help="seconds to wait for Brayns to accept connections after its launch",
+        dest="brayns_timeout",
+        action="store",
+        required=False,
+        type=float,
+        default=120
+    )
+    parser.add_argument(
+        "--brayns-version",
+        help="major version of Brayns of the pre-warmed instances",
+        dest="brayns_version",
+        action="store",
+        required=False,
+        type=int,
+        default=1
+    )
+    parser.add_argument(
+        "--brayns-pool-min",
+        help="number of pre-warmed Brayns instances waiting for a client",
+        dest="brayns_pool_min",
+        action="store",
+        required=False,
+        type=int,
+        default=1
+    )
+    parser.add_argument(
+        "--brayns-pool-max",
+        help="maximum number of Brayns instances, listening on the ports following --port",
+        dest="brayns_pool_max",
+        action="store",
+        required=False,
+        type=int,
+        default=4
+    )
+    parser.add_argument(
+        "--brayns-idle-timeout",
+        help="seconds after which a Brayns instance above --brayns-pool-min without client is stopped",
+        dest="brayns_idle_timeout",
+        action="store",
+        required=False,
+        type=float,
+        default=600
+    )
+    parser.add_argument(
+        "--brayns-max-memory",
+        help="resident memory, in megabytes, above which Brayns is restarted (0 means no limit)",
+        dest="brayns_max_memory",
+        action="store",
+        required=False,
+        type=float,
+        default=0
+    )
+    parser.add_argument(
+        "--brayns-lease-grace",
+        help="seconds during which a client connected with ?session=ID keeps its Brayns after disconnecting",
+        dest="brayns_lease_grace",
+        action="store",
+        required=False,
+        type=float,
+        default=60
+    )
+    parser.add_argument(
+        "--brayns-log-lines",
+        help="number of lines kept from the output of each Brayns instance",
+        dest="brayns_log_lines",
+        action="store",
+        required=False,
+        type=int,
+        default=200
+    )
     parser.add_argument(
         "--certificate",
         help="certificate filename",
@@ -63,31 +161,276 @@ def main():
         type=str,
         default=None
     )
+    parser.add_argument(
+        "--io-workers",
+        help="number of threads running the blocking work of IO-bound entrypoints",
+        dest="io_workers",
+        action="store",
+        required=False,
+        type=int,
+        default=32
+    )
+    parser.add_argument(
+        "--cpu-workers",
+        help="number of processes running the work of CPU-bound entrypoints",
+        dest="cpu_workers",
+        action="store",
+        required=False,
+        type=int,
+        default=os.cpu_count() or 1
+    )
+    parser.add_argument(
+        "--max-pending",
+        help="maximum number of calls waiting or running at the same time",
+        dest="max_pending",
+        action="store",
+        required=False,
+        type=int,
+        default=256
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="maximum number of simultaneous calls of an entrypoint, as NAME=COUNT "
+            + "(can be repeated)",
+        dest="concurrency",
+        action="append",
+        required=False,
+        type=parse_concurrency,
+        default=[]
+    )
+    parser.add_argument(
+        "--max-clients",
+        help="maximum number of clients connected at the same time (0 means no limit)",
+        dest="max_clients",
+        action="store",
+        required=False,
+        type=int,
+        default=64
+    )
+    parser.add_argument(
+        "--fs-cache-dirs",
+        help="maximum number of directory listings to keep in cache",
+        dest="fs_cache_dirs",
+        action="store",
+        required=False,
+        type=int,
+        default=256
+    )
+    parser.add_argument(
+        "--fs-cache-stats",
+        help="maximum number of stat results to keep in cache",
+        dest="fs_cache_stats",
+        action="store",
+        required=False,
+        type=int,
+        default=65536
+    )
+    parser.add_argument(
+        "--fs-cache-ttl",
+        help="number of seconds an item of the filesystem cache stays valid",
+        dest="fs_cache_ttl",
+        action="store",
+        required=False,
+        type=float,
+        default=30
+    )
+    parser.add_argument(
+        "--index-interval",
+        help="seconds between two refreshes of the index used by fs-search (0 disables it)",
+        dest="index_interval",
+        action="store",
+        required=False,
+        type=float,
+        default=900
+    )
+    parser.add_argument(
+        "--index-workers",
+        help="number of threads listing folders in parallel for the index",
+        dest="index_workers",
+        action="store",
+        required=False,
+        type=int,
+        default=8
+    )
+    parser.add_argument(
+        "--index-max-paths",
+        help="maximum number of paths in the index",
+        dest="index_max_paths",
+        action="store",
+        required=False,
+        type=int,
+        default=10_000_000
+    )
+    parser.add_argument(
+        "--sonata-cache-dir",
+        help="folder of the persistent cache of SONATA summaries (empty string disables it)",
+        dest="sonata_cache_dir",
+        action="store",
+        required=False,
+        type=str,
+        default=os.path.join(os.path.expanduser("~"), ".cache", "circuit-studio", "sonata")
+    )
+    parser.add_argument(
+        "--sonata-cache-size",
+        help="maximum number of SONATA summaries to keep in memory",
+        dest="sonata_cache_size",
+        action="store",
+        required=False,
+        type=int,
+        default=64
+    )
+    parser.add_argument(
+        "--sonata-cache-recheck",
+        help="seconds during which a SONATA summary is used without checking its files",
+        dest="sonata_cache_recheck",
+        action="store",
+        required=False,
+        type=float,
+        default=5
+    )
+    parser.add_argument(
+        "--volume-cache-dir",
+        help="folder of the downsampled levels of the volumes (empty string disables them)",
+        dest="volume_cache_dir",
+        action="store",
+        required=False,
+        type=str,
+        default=os.path.join(os.path.expanduser("~"), ".cache", "circuit-studio", "volumes")
+    )
+    parser.add_argument(
+        "--session-storage-file",
+        help="SQLite database keeping the sessions across restarts, on a local disk"
+        + " (by default, they are kept in memory)",
+        dest="session_storage_file",
+        action="store",
+        required=False,
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--session-storage-size",
+        help="maximum number of bytes of the sessions kept in memory",
+        dest="session_storage_size",
+        action="store",
+        required=False,
+        type=int,
+        default=64 * 1024 * 1024
+    )
+    parser.add_argument(
+        "--log-level",
+        help="minimum level of the logged messages",
+        dest="log_level",
+        action="store",
+        required=False,
+        type=str.lower,
+        choices=LEVELS,
+        default="info"
+    )
+    parser.add_argument(
+        "--log-rate",
+        help="maximum number of messages logged per second by each module, "
+            + "errors excepted (0 means no limit)",
+        dest="log_rate",
+        action="store",
+        required=False,
+        type=float,
+        default=50
+    )
     args = parser.parse_args()
+    setup_logging({
+        "log_level": args.log_level,
+        "log_rate": args.log_rate
+    })
     options = { 
         "port": args.port,
         "certificate": args.certificate,
-        "private_key": args.private_key
+        "private_key": args.private_key,
+        "max_clients": args.max_clients,
+        "io_workers": args.io_workers,
+        "cpu_workers": args.cpu_workers,
+        "max_pending": args.max_pending,
+        "concurrency": dict(args.concurrency)
     }
-    session_storage = {}
+    metrics = Metrics()
+    uploads = Uploads()
+    fs_cache = FsCache({
+        "fs_cache_dirs": args.fs_cache_dirs,
+        "fs_cache_stats": args.fs_cache_stats,
+        "fs_cache_ttl": args.fs_cache_ttl
+    })
+    fs_index = FsIndex(args.sandbox, {
+        "index_workers": args.index_workers,
+        "index_interval": args.index_interval,
+        "index_max_paths": args.index_max_paths
+    })
+    sonata_cache = SonataCache({
+        "sonata_cache_dir": args.sonata_cache_dir,
+        "sonata_cache_size": args.sonata_cache_size,
+        "sonata_cache_recheck": args.sonata_cache_recheck
+    })
+    pyramids = VolumePyramids({
+        "volume_cache_dir": args.volume_cache_dir
+    })
+    brayns_pool = BraynsPool({
+        "brayns_command": args.brayns,
+        "brayns_first_port": args.port + 1,
+        "brayns_pool_min": args.brayns_pool_min,
+        "brayns_pool_max": args.brayns_pool_max,
+        "brayns_idle_timeout": args.brayns_idle_timeout,
+        "brayns_timeout": args.brayns_timeout,
+        "brayns_version": args.brayns_version,
+        "brayns_max_memory": args.brayns_max_memory,
+        "brayns_log_lines": args.brayns_log_lines,
+        "brayns_lease_grace": args.brayns_lease_grace
+    })
+    session_storage = create_storage({
+        "session_storage_file": args.session_storage_file,
+        "session_storage_size": args.session_storage_size
+    })
     entrypoints = [
         VersionEntryPoint(__version__),
-        FsExistsEntryPoint(args.sandbox),
+        FsCacheInfoEntryPoint(fs_cache),
+        FsExistsEntryPoint(args.sandbox, fs_cache),
+        FsGetContentEntryPoint(args.sandbox),
         FsGetRootEntryPoint(args.sandbox),
-        FsListDirEntryPoint(args.sandbox),
-        FsSetContentEntryPoint(args.sandbox),
-        BraynsAddressEntryPoint(args.port + 1, args.brayns),
-        SonataListPopulationsEntryPoint(args.sandbox),
+        FsListDirEntryPoint(args.sandbox, fs_cache),
+        FsSearchEntryPoint(args.sandbox, fs_index),
+        FsSetContentEntryPoint(args.sandbox, fs_cache),
+        FsStatBatchEntryPoint(args.sandbox, fs_cache),
+        FsUploadBeginEntryPoint(args.sandbox, uploads, fs_cache),
+        FsUploadAppendEntryPoint(args.sandbox, uploads),
+        FsUploadCommitEntryPoint(args.sandbox, uploads, fs_cache),
+        MetricsEntryPoint(metrics),
+        BraynsAddressEntryPoint(brayns_pool),
+        BraynsPoolInfoEntryPoint(brayns_pool),
+        SonataListPopulationsEntryPoint(args.sandbox, sonata_cache),
+        SonataNodeAttributesEntryPoint(args.sandbox),
+        SonataReportStatsEntryPoint(args.sandbox, sonata_cache),
+        StorageSessionDeleteEntryPoint(session_storage),
         StorageSessionGetEntryPoint(session_storage),
+        StorageSessionListEntryPoint(session_storage),
+        StorageSessionPatchEntryPoint(session_storage),
         StorageSessionSetEntryPoint(session_storage),
-        VolumeParseHeader(args.sandbox)
+        VolumeParseHeader(args.sandbox),
+        VolumeReadLevel(args.sandbox, pyramids),
+        VolumeReadSlab(args.sandbox)
     ]
-    server = Server(options, entrypoints)
+    server = Server(options, entrypoints, metrics)
     loop = asyncio.get_event_loop()
     loop.run_until_complete(server.start())
     loop.run_forever()
 
 
+def parse_concurrency(value: str):
+    """Parse a "NAME=COUNT" argument into a `(name, count)` tuple."""
+    name, sep, count = value.rpartition("=")
+    if not sep or not name or not count.isdigit() or int(count) < 1:
+        raise argparse.ArgumentTypeError(
+            f"Expected NAME=COUNT with a positive COUNT, but got \"{value}\"!"
+        )
+    return (name, int(count))
+
+
 def print_box(line: str) -> None:
     """Surround `line` by a box."""
     print(f"+-{'-' * len(line)}-+")
@@ -0,0 +1,46 @@
+"""Entrypoint: brayns-pool-info() -> dict."""
+from entrypoint import EntryPoint
+from brayns_pool import BraynsPool
+
+
+class BraynsPoolInfoEntryPoint(EntryPoint):
+    """Entrypoint: brayns-pool-info() -> dict.
+
+    No input. Return the state of the pool of Brayns processes.
+
+    Output: `{
+        min: int,
+        max: int,
+        instances: Instance[]
+    }`
+
+    with `Instance = {
+        port: int, pid: int | null, version: int,
+        status: "starting" | "crashed" | "idle" | "leased",
+        healthy: boolean,
+        memory: int | null,
+        uptime: float,
+        idle: float,
+        restarts: int
+    }`
+
+    * healthy: the process is running and accepts connections.
+    * memory: resident memory in bytes, including the children processes.
+    * uptime: seconds since the launch of the current process.
+    * idle: seconds since the instance is waiting for a client.
+    * restarts: number of times the process has been restarted after a crash.
+    """
+
+    def __init__(self, pool: BraynsPool):
+        """Set the pool to inspect."""
+        self.pool = pool
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "brayns-pool-info"
+
+    async def exec(self, params):
+        """Return the state of the instances."""
+        del params  # Unused
+        return await self.pool.info()
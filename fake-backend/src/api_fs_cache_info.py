@@ -0,0 +1,38 @@
+"""Entrypoint: fs-cache-info() -> dict."""
+from entrypoint import EntryPoint
+from fs_cache import FsCache
+
+
+class FsCacheInfoEntryPoint(EntryPoint):
+    """Entrypoint: fs-cache-info() -> dict.
+
+    No input. Return the counters of the cache of directory listings
+    and stat results, to help tuning its size and TTL.
+
+    Output: `{
+        listings: CacheInfo,
+        stats: CacheInfo,
+        inotify: boolean,
+        watches: int
+    }`
+
+    with `CacheInfo = {
+        size: int, capacity: int,
+        hits: int, misses: int, hitRatio: float,
+        invalidations: int
+    }`
+    """
+
+    def __init__(self, cache: FsCache):
+        """Set the cache to inspect."""
+        self.cache = cache
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "fs-cache-info"
+
+    async def exec(self, params):
+        """Return the counters of the cache."""
+        del params  # Unused
+        return self.cache.info()
@@ -1,6 +1,8 @@
 """Entrypoint: fs-get-root() -> str."""
-from entrypoint import EntryPoint
+from entrypoint import EntryPoint, IO_BOUND
+from fs_cache import FsCache
 import os
+import stat
 
 class FsExistsEntryPoint(EntryPoint):
     """Entrypoint: fs-exists() -> str.
@@ -10,9 +12,12 @@ class FsExistsEntryPoint(EntryPoint):
     Output: `{ type: "none" | "file" | "directory" }
     """
 
-    def __init__(self, root):
-        """Set sandbox root folder."""
+    kind = IO_BOUND
+
+    def __init__(self, root, cache: FsCache):
+        """Set sandbox root folder and the cache of stat results."""
         self.root = root
+        self.cache = cache
 
     @property
     def name(self):
@@ -27,8 +32,14 @@ class FsExistsEntryPoint(EntryPoint):
             self.fatal(3, "Argument \"path\" is missing!")
         path = os.path.abspath(path)
         self.ensureSandbox(path, self.root)
-        if os.path.isdir(path):
+        return await self.offload(get_type, self.cache, path)
+
+def get_type(cache: FsCache, path: str):
+    """Return the type of `path`: "directory", "file" or "none"."""
+    info = cache.stat(path)
+    if info is not None:
+        if stat.S_ISDIR(info.st_mode):
             return { "type": "directory" }
-        if os.path.isfile(path):
+        if stat.S_ISREG(info.st_mode):
             return { "type": "file" }
-        return { "type": "none" }
+    return { "type": "none" }
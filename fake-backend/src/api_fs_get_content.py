@@ -0,0 +1,106 @@
+"""Entrypoint: fs-get-content(path: str, offset?: int, length?: int)."""
+from entrypoint import EntryPoint, EntryPointException, PARAMS_ERROR, IO_BOUND
+from typing import BinaryIO, Optional, Tuple
+import os
+
+# Size of the binary frames.
+CHUNK_SIZE = 512 * 1024
+
+NOT_A_FILE = 1
+INVALID_RANGE = 2
+
+class FsGetContentEntryPoint(EntryPoint):
+    """Entrypoint: fs-get-content() -> { size: int, offset: int, length: int }.
+
+    Stream the content of a file, or of a range of bytes of it.
+
+    Input: `{ path: string, offset?: int, length?: int }`
+
+    * offset: position of the first byte to read (default to 0).
+      A negative offset is relative to the end of the file.
+    * length: number of bytes to read (default to the end of the file).
+
+    The content is sent in binary frames, before the response.
+    Each frame has a "chunk" notification as header, with params
+    `{ id: string, offset: int }`, followed by the bytes read at `offset`.
+
+    Output: `{ size: int, offset: int, length: int }`
+
+    * size: size of the whole file.
+    * offset, length: range that has been sent.
+
+    Error:
+
+    * 1: not a file
+    * 2: invalid range
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, root):
+        """Set sandbox root folder."""
+        self.root = root
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "fs-get-content"
+
+    async def exec(self, params):
+        """Send the requested range of the file in chunks."""
+        self.ensureDict(params, ["path"])
+        path = os.path.abspath(params["path"])
+        self.ensureSandbox(path, self.root)
+        offset = params.get("offset", 0)
+        length = params.get("length")
+        if not is_integer(offset) or (length is not None and not is_integer(length)):
+            self.fatal(PARAMS_ERROR, "Arguments \"offset\" and \"length\" must be integers!")
+        (fd, size) = await self.offload(open_file, path)
+        try:
+            (offset, length) = get_range(size, offset, length)
+            # Only one chunk is in memory at a time: it has been sent
+            # when `send_chunk()` returns, so the buffer can be reused.
+            buffer = memoryview(bytearray(min(CHUNK_SIZE, length)))
+            position = offset
+            end = offset + length
+            while position < end:
+                view = buffer[:min(len(buffer), end - position)]
+                count = await self.offload(read_into, fd, position, view)
+                if count == 0:
+                    # The file has been truncated while we were reading it.
+                    break
+                await self.send_chunk({ "offset": position }, view[:count])
+                position += count
+            return { "size": size, "offset": offset, "length": position - offset }
+        finally:
+            fd.close()
+
+def open_file(path: str) -> Tuple[BinaryIO, int]:
+    """Open a file for reading and return it with its size."""
+    if not os.path.isfile(path):
+        raise EntryPointException(NOT_A_FILE, f"Path not found, or not a file: \"{path}\"")
+    fd = open(path, "rb", buffering=0)
+    return (fd, os.fstat(fd.fileno()).st_size)
+
+def get_range(size: int, offset: int, length: Optional[int]) -> Tuple[int, int]:
+    """Return the actual `(offset, length)` to read from a file of `size` bytes."""
+    if offset < 0:
+        offset = max(0, size + offset)
+    if offset > size:
+        raise EntryPointException(
+            INVALID_RANGE, f"Offset {offset} is beyond the end of the file ({size} bytes)!"
+        )
+    if length is None:
+        length = size - offset
+    if length < 0:
+        raise EntryPointException(INVALID_RANGE, f"Length cannot be negative: {length}!")
+    return (offset, min(length, size - offset))
+
+def is_integer(value) -> bool:
+    """Is `value` an int, but not a bool (which is an int for Python)?"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def read_into(fd: BinaryIO, position: int, view: memoryview) -> int:
+    """Read bytes from `position` into `view` and return how many have been read."""
+    fd.seek(position)
+    return fd.readinto(view)
@@ -1,23 +1,57 @@
 """Entrypoint: fs-list-dir() -> str."""
-from entrypoint import EntryPoint
-from typing import List
+from entrypoint import EntryPoint, EntryPointException, PARAMS_ERROR, IO_BOUND
+from fnmatch import fnmatch
+from fs_cache import FsCache
+from typing import Any, List, Optional, Tuple
+import base64
+import heapq
 import json
 import os
-from stat import S_IXUSR
+import stat
+
+SORT_KEYS = ("name", "size", "mtime")
+
+# Folders are always listed before files.
+RANK_DIR = 0
+RANK_FILE = 1
 
 
 class FsListDirEntryPoint(EntryPoint):
     """Entrypoint: fs-list-dir(path: str) -> str.
 
-    Input: `{ path: str }`
+    Input: `{
+        path: str,
+        pattern?: str,
+        extensions?: str[],
+        sort?: "name" | "size" | "mtime",
+        descending?: bool,
+        limit?: int,
+        cursor?: str
+    }`
 
     * path: the folder you want to get the content of.
+    * pattern: only list files matching this glob pattern (ex.: "*_config.json").
+    * extensions: only list files with one of these extensions (ex.: [".nrrd", ".obj"]).
+    * sort: sorting key (default to "name"). Folders always come first.
+    * descending: reverse the sort order.
+    * limit: maximum number of entries (folders and files) to return.
+    * cursor: the `cursor` returned by the previous page.
+
+    Filters only apply to files, since folders are needed for navigation.
 
-    Output: `{ dirs: str[], files: { names: str[], sizes: int[] } }`
+    Output: `{
+        dirs: str[],
+        files: { names: str[], sizes: int[], mtimes: float[] },
+        cursor?: str
+    }`
 
     * dirs: list of contained folders' names.
     * files.names: list of contained files' names.
     * files.sizes: list of files' sizes in bytes.
+    * files.mtimes: list of files' modification times in seconds since epoch.
+    * cursor: defined if there are more entries. Pass it to get the next page.
+      A page can have less than `limit` entries (folders without permission are
+      skipped): keep going while `cursor` is defined.
 
     Error:
 
@@ -27,8 +61,10 @@ class FsListDirEntryPoint(EntryPoint):
     * 4: path is not a directory
     """
 
-    def __init__(self, root):
-        """Set sandbox root folder.
+    kind = IO_BOUND
+
+    def __init__(self, root, cache: FsCache):
+        """Set sandbox root folder and the cache of listings.
         
         Make sure it does not end with a "/".
         """
@@ -36,6 +72,11 @@ class FsListDirEntryPoint(EntryPoint):
             self.root = root[:-1]
         else:
             self.root = root
+        self.cache = cache
+
+    async def initialize(self):
+        """Start watching the cached folders."""
+        self.cache.start()
 
     @property
     def name(self):
@@ -52,39 +93,158 @@ class FsListDirEntryPoint(EntryPoint):
         sandbox = self.root
         if path[:len(sandbox)] != sandbox:
             self.fatal(1, f"Path \"{path}\" is out of sandbox: \"{sandbox}\"!")
-        if not os.path.isdir(path):
-            self.fatal(4, f"Path not found, or not a directory: \"{path}\"")
-        try:
-            dirs: List(str) = []
-            file_names: List(str) = []
-            file_sizes: List(int) = []
-            with os.scandir(path) as entries:
-                for entry in entries:
-                    if entry.is_dir():
-                        if useful_dir(os.path.join(path, entry.name)):
-                            dirs.append(entry.name)
-                    else:
-                        stat = entry.stat(follow_symlinks=False)
-                        file_names.append(entry.name)
-                        file_sizes.append(stat.st_size)
-            return {
-                "dirs": dirs,
-                "files": {
-                    "names": file_names,
-                    "sizes": file_sizes
-                }
+        sort = params.get("sort", "name")
+        if sort not in SORT_KEYS:
+            self.fatal(PARAMS_ERROR, f"Argument \"sort\" must be one of {', '.join(SORT_KEYS)}!")
+        limit = params.get("limit")
+        if limit is not None and (not isinstance(limit, int) or limit < 1):
+            self.fatal(PARAMS_ERROR, "Argument \"limit\" must be a positive integer!")
+        extensions = params.get("extensions")
+        if extensions is not None and not isinstance(extensions, list):
+            self.fatal(PARAMS_ERROR, "Argument \"extensions\" must be a list of strings!")
+        cursor = params.get("cursor")
+        if cursor is not None:
+            cursor = decode_cursor(cursor)
+            if cursor is None:
+                self.fatal(PARAMS_ERROR, "Invalid cursor!")
+        return await self.offload(
+            list_dir,
+            self.cache,
+            path,
+            params.get("pattern"),
+            extensions,
+            sort,
+            params.get("descending", False) == True,
+            limit,
+            cursor
+        )
+
+def list_dir(
+    cache: FsCache,
+    path: str,
+    pattern: Optional[str] = None,
+    extensions: Optional[List[str]] = None,
+    sort: str = "name",
+    descending: bool = False,
+    limit: Optional[int] = None,
+    cursor: Optional[list] = None
+):
+    """Return one page of the folders and files contained in `path`.
+
+    Only the entries of the page are stat'ed, unless we sort by size or mtime.
+    Listings and stats come from the cache when possible.
+    """
+    info = cache.stat(path)
+    if info is None or not stat.S_ISDIR(info.st_mode):
+        raise EntryPointException(4, f"Path not found, or not a directory: \"{path}\"")
+    try:
+        candidates: List[Tuple[list, str]] = []
+        for (name, is_dir) in cache.list_dir(path):
+            rank = RANK_DIR if is_dir else RANK_FILE
+            if rank == RANK_FILE and not accept_file(name, pattern, extensions):
+                continue
+            key = get_sort_key(cache, path, name, rank, sort)
+            if key is not None:
+                candidates.append((key, name))
+        order = (lambda item: Descending(item[0])) if descending else (lambda item: item[0])
+        if cursor is not None:
+            after = Descending(cursor) if descending else cursor
+            candidates = [item for item in candidates if after < order(item)]
+        if limit is None:
+            page = sorted(candidates, key=order)
+            next_cursor = None
+        else:
+            page = heapq.nsmallest(limit + 1, candidates, key=order)
+            next_cursor = encode_cursor(page[limit - 1][0]) if len(page) > limit else None
+            page = page[:limit]
+        dirs: List[str] = []
+        file_names: List[str] = []
+        file_sizes: List[int] = []
+        file_mtimes: List[float] = []
+        for (key, name) in page:
+            if key[0] == RANK_DIR:
+                if useful_dir(os.path.join(path, name)):
+                    dirs.append(name)
+            else:
+                # No extra syscall if we sorted by size or mtime.
+                info = cache.stat(os.path.join(path, name))
+                if info is None:
+                    # The file has vanished.
+                    continue
+                file_names.append(name)
+                file_sizes.append(info.st_size)
+                file_mtimes.append(info.st_mtime)
+        result: Any = {
+            "dirs": dirs,
+            "files": {
+                "names": file_names,
+                "sizes": file_sizes,
+                "mtimes": file_mtimes
             }
-        except Exception as ex:
-            self.fatal(3, str(ex))
+        }
+        if next_cursor is not None:
+            result["cursor"] = next_cursor
+        return result
+    except Exception as ex:
+        raise EntryPointException(3, str(ex))
+
+def accept_file(name: str, pattern: Optional[str], extensions: Optional[List[str]]) -> bool:
+    """Does the file `name` pass the filters?"""
+    if pattern is not None and not fnmatch(name, pattern):
+        return False
+    if extensions is not None and not any(name.endswith(ext) for ext in extensions):
+        return False
+    return True
+
+def get_sort_key(
+    cache: FsCache, folder: str, name: str, rank: int, sort: str
+) -> Optional[list]:
+    """Return the key to sort an entry of `folder`, or `None` if it has vanished.
+
+    Keys are lists because they are serialized in JSON for the cursors.
+    """
+    if sort == "name":
+        return [rank, name]
+    if sort == "size" and rank == RANK_DIR:
+        return [rank, 0, name]
+    info = cache.stat(os.path.join(folder, name))
+    if info is None:
+        return None
+    if sort == "size":
+        return [rank, info.st_size, name]
+    return [rank, info.st_mtime, name]
+
+class Descending:
+    """Wrapper to sort keys in descending order, folders still coming first."""
+
+    def __init__(self, key: list):
+        self.key = key
+
+    def __lt__(self, other: "Descending") -> bool:
+        if self.key[0] != other.key[0]:
+            return self.key[0] < other.key[0]
+        return self.key[1:] > other.key[1:]
+
+def encode_cursor(key: list) -> str:
+    """Serialize the sort key of the last entry of a page."""
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: Any) -> Optional[list]:
+    """Return the sort key encoded in `cursor`, or `None` if it is invalid."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor))
+        if isinstance(key, list) and len(key) > 1 and key[0] in (RANK_DIR, RANK_FILE):
+            return key
+    except Exception:  # pylint: disable=broad-except
+        pass
+    return None
 
 def useful_dir(dir: str) -> bool:
     """Should we return this directory to the user?
     
     We want to skip folders if:
      - the user has no permission on them
+
+    `os.access()` is a single syscall: the folder's content is not listed.
     """
-    try:
-        content = os.listdir(dir)
-        return True
-    except:
-        return False
\ No newline at end of file
+    return os.access(dir, os.R_OK | os.X_OK)
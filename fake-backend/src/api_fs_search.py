@@ -0,0 +1,127 @@
+"""Entrypoint: fs-search(query: str) -> { paths: str[] }."""
+from entrypoint import EntryPoint, PARAMS_ERROR, IO_BOUND
+from fs_index import FsIndex, Snapshot, glob_to_regex
+from typing import List, Optional
+import os
+import re
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 100_000
+
+NOT_INDEXED = 1
+
+class FsSearchEntryPoint(EntryPoint):
+    """Entrypoint: fs-search() -> { paths: str[] }.
+
+    Search files and folders by name in the whole sandbox,
+    using an index which is refreshed in the background.
+
+    Input: `{
+        query: string,
+        glob?: boolean,
+        caseSensitive?: boolean,
+        folder?: string,
+        type?: "file" | "directory",
+        limit?: int
+    }`
+
+    * query: text to look for in the names (not in the full paths).
+    * glob: if true, `query` is a glob pattern that must match the whole name
+      (ex.: "*_config.json"). Default to true if `query` contains `*`, `?` or `[`.
+    * caseSensitive: default to true.
+    * folder: only search below this folder.
+    * type: only return files, or only folders.
+    * limit: maximum number of paths to return (default to 1000).
+
+    Output: `{ ready: boolean, paths: str[], truncated: boolean, indexed: int, updated: float }`
+
+    * ready: false if the first indexing is not done yet (`paths` is then empty).
+    * truncated: true if there are more than `limit` results.
+    * indexed: number of indexed paths.
+    * updated: time of the last refresh of the index, in seconds since epoch.
+
+    Error:
+
+    * 1: indexing is disabled
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, root, index: FsIndex):
+        """Set sandbox root folder and the index."""
+        self.root = root
+        self.index = index
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "fs-search"
+
+    async def initialize(self):
+        """Start the background indexer."""
+        self.index.start()
+
+    async def exec(self, params):
+        """Look for the query in the index."""
+        self.ensureDict(params, ["query"])
+        if not self.index.enabled:
+            self.fatal(NOT_INDEXED, "Indexing is disabled on this backend!")
+        query = params["query"]
+        if not isinstance(query, str) or len(query) == 0:
+            self.fatal(PARAMS_ERROR, "Argument \"query\" must be a non-empty string!")
+        glob = params.get("glob", any(char in query for char in "*?["))
+        case_sensitive = params.get("caseSensitive", True)
+        kind = params.get("type")
+        if kind not in (None, "file", "directory"):
+            self.fatal(PARAMS_ERROR, "Argument \"type\" must be \"file\" or \"directory\"!")
+        limit = params.get("limit", DEFAULT_LIMIT)
+        if not isinstance(limit, int) or limit < 1 or limit > MAX_LIMIT:
+            self.fatal(PARAMS_ERROR, f"Argument \"limit\" must be between 1 and {MAX_LIMIT}!")
+        folder = params.get("folder")
+        if folder is not None:
+            folder = os.path.abspath(folder)
+            self.ensureSandbox(folder, self.root)
+        snapshot = self.index.snapshot
+        if snapshot is None:
+            return { "ready": False, "paths": [], "truncated": False, "indexed": 0, "updated": 0 }
+        pattern = None
+        if glob:
+            pattern = glob_to_regex(query, case_sensitive)
+        elif not case_sensitive:
+            pattern = re.compile(re.escape(query), re.IGNORECASE)
+        (paths, truncated) = await self.offload(
+            search, snapshot, query, pattern, folder, kind, limit
+        )
+        return {
+            "ready": True,
+            "paths": paths,
+            "truncated": truncated,
+            "indexed": snapshot.count,
+            "updated": snapshot.built_at
+        }
+
+def search(
+    snapshot: Snapshot,
+    query: str,
+    pattern: Optional["re.Pattern[str]"],
+    folder: Optional[str],
+    kind: Optional[str],
+    limit: int
+):
+    """Return `(paths, truncated)` for the nodes matching `pattern`, or `query` if undefined."""
+    folder_node = None
+    if folder is not None:
+        folder_node = snapshot.find(folder)
+        if folder_node is None:
+            return ([], False)
+    nodes = snapshot.find_substring(query) if pattern is None else snapshot.search(pattern)
+    paths: List[str] = []
+    for node in nodes:
+        if kind is not None and snapshot.is_dir(node) != (kind == "directory"):
+            continue
+        if folder_node is not None and not snapshot.is_inside(node, folder_node):
+            continue
+        if len(paths) == limit:
+            return (paths, True)
+        paths.append(snapshot.path(node))
+    return (paths, False)
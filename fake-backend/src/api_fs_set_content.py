@@ -1,5 +1,6 @@
 """Entrypoint: fs-get-root() -> str."""
-from entrypoint import EntryPoint
+from entrypoint import EntryPoint, IO_BOUND
+from fs_cache import FsCache
 import os
 import base64
 
@@ -8,12 +9,18 @@ class FsSetContentEntryPoint(EntryPoint):
 
     Input: `{ path: string, base64: boolean, content: string }`
 
+    The whole content is held in memory: use `fs-upload-begin`,
+    `fs-upload-append` and `fs-upload-commit` for big files.
+
     Output: None
     """
 
-    def __init__(self, root):
-        """Set sandbox root folder."""
+    kind = IO_BOUND
+
+    def __init__(self, root, cache: FsCache):
+        """Set sandbox root folder and the cache to invalidate on writes."""
         self.root = root
+        self.cache = cache
 
     @property
     def name(self):
@@ -26,12 +33,17 @@ class FsSetContentEntryPoint(EntryPoint):
         path = params["path"]
         path = os.path.abspath(path)
         self.ensureSandbox(path, self.root)
-        content = params["content"]
-        print()
-        if params["base64"]:
-            with open(path, 'wb') as fd:
-                fd.write(base64.b64decode(content))
-        else:
-            with open(path, 'w') as fd:
-                fd.write(content)
+        try:
+            await self.offload(write_content, path, params["content"], params["base64"])
+        finally:
+            self.cache.invalidate(path)
         return {}
+
+def write_content(path: str, content: str, is_base64: bool):
+    """Write `content` into `path`, decoding it first if `is_base64`."""
+    if is_base64:
+        with open(path, 'wb') as fd:
+            fd.write(base64.b64decode(content))
+    else:
+        with open(path, 'w') as fd:
+            fd.write(content)
@@ -0,0 +1,94 @@
+"""Entrypoint: fs-stat-batch(paths: str[]) -> { stats: Stat[] }."""
+from entrypoint import EntryPoint, EntryPointException, PARAMS_ERROR, IO_BOUND
+from fs_cache import FsCache
+from typing import List
+import asyncio
+import os
+import stat
+
+# Number of paths stat'ed by the same job of the thread pool.
+# Bigger batches would let one call monopolize the pool.
+BATCH_SIZE = 64
+
+MAX_PATHS = 100_000
+
+class FsStatBatchEntryPoint(EntryPoint):
+    """Entrypoint: fs-stat-batch() -> { stats: Stat[] }.
+
+    Check many paths in a single round trip.
+
+    Input: `{ paths: string[] }`
+
+    Output: `{ stats: Stat[] }`, in the same order as `paths`, with
+
+    ```
+    Stat = {
+        type: "none" | "file" | "directory" | "other",
+        size?: int,
+        mtime?: float
+    } | {
+        error: { code: int, message: string }
+    }
+    ```
+
+    * size: in bytes (only for files).
+    * mtime: modification time in seconds since epoch.
+    * error: for instance if the path is out of sandbox.
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, root, cache: FsCache):
+        """Set sandbox root folder and the cache of stat results."""
+        self.root = root
+        self.cache = cache
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "fs-stat-batch"
+
+    async def exec(self, params):
+        """Stat all the paths concurrently on the thread pool."""
+        self.ensureDict(params, ["paths"])
+        paths = params["paths"]
+        if not isinstance(paths, list):
+            self.fatal(PARAMS_ERROR, "Argument \"paths\" must be a list of strings!")
+        if len(paths) > MAX_PATHS:
+            self.fatal(PARAMS_ERROR, f"Too many paths: {len(paths)} (max is {MAX_PATHS})!")
+        stats: List[dict] = [None] * len(paths)
+        indexes: List[int] = []
+        for (index, path) in enumerate(paths):
+            try:
+                if not isinstance(path, str):
+                    self.fatal(PARAMS_ERROR, "A path must be a string!")
+                path = os.path.abspath(path)
+                self.ensureSandbox(path, self.root)
+                paths[index] = path
+                indexes.append(index)
+            except EntryPointException as ex:
+                stats[index] = { "error": { "code": ex.code, "message": ex.message } }
+        batches = [indexes[i:i + BATCH_SIZE] for i in range(0, len(indexes), BATCH_SIZE)]
+        results = await asyncio.gather(*[
+            self.offload(stat_paths, self.cache, [paths[index] for index in batch])
+            for batch in batches
+        ])
+        for (batch, result) in zip(batches, results):
+            for (index, item) in zip(batch, result):
+                stats[index] = item
+        return { "stats": stats }
+
+def stat_paths(cache: FsCache, paths: List[str]) -> List[dict]:
+    """Return the type, size and mtime of each path."""
+    return [stat_path(cache, path) for path in paths]
+
+def stat_path(cache: FsCache, path: str) -> dict:
+    """Return the type, size and mtime of `path`."""
+    info = cache.stat(path)
+    if info is None:
+        return { "type": "none" }
+    if stat.S_ISREG(info.st_mode):
+        return { "type": "file", "size": info.st_size, "mtime": info.st_mtime }
+    if stat.S_ISDIR(info.st_mode):
+        return { "type": "directory", "mtime": info.st_mtime }
+    return { "type": "other", "mtime": info.st_mtime }
@@ -0,0 +1,54 @@
+"""Entrypoint: fs-upload-append(path: str, offset: int) -> { offset: int }."""
+from entrypoint import EntryPoint, PARAMS_ERROR, IO_BOUND
+from upload import Uploads, append
+import base64
+import os
+
+class FsUploadAppendEntryPoint(EntryPoint):
+    """Entrypoint: fs-upload-append() -> { offset: int }.
+
+    Write a chunk of a file whose upload has been started with `fs-upload-begin`.
+    The chunk is the binary data attached to the message. Clients that
+    can only send text can put it, encoded in base64, in `content`.
+
+    Input: `{ path: string, offset: int, content?: string }`
+
+    * offset: position of the chunk in the file. It cannot be greater than
+      the last acknowledged offset.
+
+    Output: `{ offset: int }`
+
+    * offset: number of bytes uploaded so far.
+
+    Error:
+
+    * 5: offset is beyond the uploaded data
+    * 6: no upload in progress for this path
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, root, uploads: Uploads):
+        """Set sandbox root folder and the uploads in progress."""
+        self.root = root
+        self.uploads = uploads
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "fs-upload-append"
+
+    async def exec(self, params):
+        """Append a chunk to the temporary file."""
+        self.ensureDict(params, ["path", "offset"])
+        path = os.path.abspath(params["path"])
+        self.ensureSandbox(path, self.root)
+        offset = params["offset"]
+        if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+            self.fatal(PARAMS_ERROR, "Argument \"offset\" must be a positive integer!")
+        data = self.chunk
+        if "content" in params:
+            data = base64.b64decode(params["content"])
+        async with self.uploads.lock(path):
+            offset = await self.offload(append, path, offset, data)
+        return { "offset": offset }
@@ -0,0 +1,45 @@
+"""Entrypoint: fs-upload-begin(path: str) -> { offset: int, chunkSize: int }."""
+from entrypoint import EntryPoint, IO_BOUND
+from fs_cache import FsCache
+from upload import CHUNK_SIZE, Uploads, begin, get_temp_path
+import os
+
+class FsUploadBeginEntryPoint(EntryPoint):
+    """Entrypoint: fs-upload-begin() -> { offset: int, chunkSize: int }.
+
+    Start, or resume, the chunked upload of a file.
+    Then send its content with `fs-upload-append` and finish with
+    `fs-upload-commit`.
+
+    Input: `{ path: string }`
+
+    Output: `{ offset: int, chunkSize: int }`
+
+    * offset: number of bytes already uploaded.
+      It is not 0 when an interrupted upload is resumed.
+    * chunkSize: recommended size of the chunks, in bytes.
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, root, uploads: Uploads, cache: FsCache):
+        """Set sandbox root folder, the uploads in progress and the cache to invalidate."""
+        self.root = root
+        self.uploads = uploads
+        self.cache = cache
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "fs-upload-begin"
+
+    async def exec(self, params):
+        """Create the temporary file if needed and return its size."""
+        self.ensureDict(params, ["path"])
+        path = os.path.abspath(params["path"])
+        self.ensureSandbox(path, self.root)
+        async with self.uploads.lock(path):
+            offset = await self.offload(begin, path)
+        # The temporary file may have been created.
+        self.cache.invalidate(get_temp_path(path))
+        return { "offset": offset, "chunkSize": CHUNK_SIZE }
@@ -0,0 +1,50 @@
+"""Entrypoint: fs-upload-commit(path: str, size?: int) -> { size: int }."""
+from entrypoint import EntryPoint, PARAMS_ERROR, IO_BOUND
+from fs_cache import FsCache
+from upload import Uploads, commit, get_temp_path
+import os
+
+class FsUploadCommitEntryPoint(EntryPoint):
+    """Entrypoint: fs-upload-commit() -> { size: int }.
+
+    Finish an upload: the uploaded content replaces the file atomically.
+
+    Input: `{ path: string, size?: int }`
+
+    * size: expected size of the file. If defined and different from the
+      uploaded size, the upload is not committed.
+
+    Output: `{ size: int }`
+
+    Error:
+
+    * 6: no upload in progress for this path
+    * 7: uploaded size differs from `size`
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, root, uploads: Uploads, cache: FsCache):
+        """Set sandbox root folder, the uploads in progress and the cache to invalidate."""
+        self.root = root
+        self.uploads = uploads
+        self.cache = cache
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "fs-upload-commit"
+
+    async def exec(self, params):
+        """Rename the temporary file."""
+        self.ensureDict(params, ["path"])
+        path = os.path.abspath(params["path"])
+        self.ensureSandbox(path, self.root)
+        size = params.get("size")
+        if size is not None and (isinstance(size, bool) or not isinstance(size, int) or size < 0):
+            self.fatal(PARAMS_ERROR, "Argument \"size\" must be a positive integer!")
+        async with self.uploads.lock(path):
+            size = await self.offload(commit, path, size)
+        self.cache.invalidate(get_temp_path(path))
+        self.cache.invalidate(path)
+        return { "size": size }
@@ -0,0 +1,64 @@
+"""Entrypoint: metrics(format?: str) -> dict | str."""
+from entrypoint import EntryPoint, PARAMS_ERROR
+from metrics import Metrics
+
+JSON_FORMAT = "json"
+PROMETHEUS_FORMAT = "prometheus"
+
+
+class MetricsEntryPoint(EntryPoint):
+    """Entrypoint: metrics(format?: str) -> dict | str.
+
+    Return the counters and histograms of the calls of the entrypoints.
+    The same metrics are served in Prometheus' format by HTTP on
+    the path `/metrics` of the websocket server.
+
+    Input: `{ format?: "json" | "prometheus" }` (default to "json")
+
+    Output: `{
+        uptime: float,
+        clients: int,
+        entrypoints: { [name: string]: EntrypointMetrics }
+    }`, or a string in Prometheus' text format.
+
+    with `EntrypointMetrics = {
+        calls: int, inFlight: int,
+        errors: int, errorCodes: { [code: string]: int },
+        latency: Histogram,
+        requestSize: Histogram,
+        responseSize: Histogram
+    }`
+
+    and `Histogram = {
+        count: int, sum: float, min: float, max: float,
+        p50: float, p95: float, p99: float
+    }`
+
+    * latency: seconds from the reception of a request to its response.
+    * requestSize, responseSize: in bytes. The response size includes
+      the chunks sent before the response.
+    """
+
+    def __init__(self, metrics: Metrics):
+        """Set the metrics to report."""
+        self.metrics = metrics
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "metrics"
+
+    async def exec(self, params):
+        """Return the metrics in the requested format."""
+        format = JSON_FORMAT
+        if params != None:
+            self.ensureDict(params, [])
+            format = params.get("format", JSON_FORMAT)
+        if format == PROMETHEUS_FORMAT:
+            return self.metrics.to_prometheus()
+        if format != JSON_FORMAT:
+            self.fatal(
+                PARAMS_ERROR,
+                f"Argument \"format\" must be \"{JSON_FORMAT}\" or \"{PROMETHEUS_FORMAT}\"!"
+            )
+        return self.metrics.to_dict()
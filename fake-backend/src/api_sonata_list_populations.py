@@ -1,8 +1,12 @@
 """Entrypoint: fs-get-root() -> str."""
-from entrypoint import EntryPoint
+from entrypoint import EntryPoint, EntryPointException, CPU_BOUND
+from sonata_cache import SonataCache
+import logging
 import os
 import libsonata
 
+logger = logging.getLogger("sonata")
+
 class SonataListPopulationsEntryPoint(EntryPoint):
     """Entrypoint: sonata-list-populations() -> str.
 
@@ -14,9 +18,12 @@ class SonataListPopulationsEntryPoint(EntryPoint):
     }> }
     """
 
-    def __init__(self, root):
+    kind = CPU_BOUND
+
+    def __init__(self, root, cache: SonataCache):
         """Get the list of all available populations names in a SONATA file."""
         self.root = root
+        self.cache = cache
 
     @property
     def name(self):
@@ -31,56 +38,69 @@ class SonataListPopulationsEntryPoint(EntryPoint):
             self.fatal(3, "Argument \"path\" is missing!")
         path = os.path.abspath(path)
         self.ensureSandbox(path, self.root)
-        if not os.path.isfile(path):
-            self.fatal(1, f"This file does not exist: {path}")
-        simulation = None
-        circuit_path = path
-        try:
-            simulation = libsonata.SimulationConfig.from_file(path)
-            circuit_path = simulation.network
-        except:
-            # This is not a Simulation.
-            print("This circuit has no simulation:", path)
-            pass
-        circuit = libsonata.CircuitConfig.from_file(circuit_path)
-        populations_before_filtering = list(circuit.node_populations)
-        populations = []
-        for population in populations_before_filtering:
-            props = circuit.node_population_properties(population)
-            type = props.type
-            print("Found population", population, "of type", type)
-            if type != "virtual":
-                node = circuit.node_population(population)
-                print("    Attribute names:", node.attribute_names)
-                populations.append({
-                    "name": population,
-                    "type": type,
-                    "size": node.size
-                })
-        reports = []
-        report_names = []
-        if simulation != None:
-            report_names = simulation.list_report_names
-        for report_name in list(report_names):
-            report = simulation.report(report_name)
-            reports.append({
-                "type": stringify_report_type(report.type),
-                "name": report_name,
-                "start": report.start_time,
-                "end": report.end_time,
-                "delta": report.dt,
-                "unit": report.unit,
-                "cells": report.cells
+        return await self.cache.get(
+            "populations", path, lambda: self.offload(list_populations, path)
+        )
+
+def list_populations(path: str):
+    """Parse a SONATA simulation/circuit config and list its populations and reports.
+
+    This runs in the CPU pool because parsing big circuits takes time.
+    Return `(summary, files)`, `files` being all the files the summary
+    has been computed from.
+    """
+    if not os.path.isfile(path):
+        raise EntryPointException(1, f"This file does not exist: {path}")
+    simulation = None
+    circuit_path = path
+    try:
+        simulation = libsonata.SimulationConfig.from_file(path)
+        circuit_path = simulation.network
+    except:
+        # This is not a Simulation.
+        logger.debug("This circuit has no simulation: %s", path)
+    circuit = libsonata.CircuitConfig.from_file(circuit_path)
+    files = [path, circuit_path]
+    populations_before_filtering = list(circuit.node_populations)
+    populations = []
+    for population in populations_before_filtering:
+        props = circuit.node_population_properties(population)
+        files.extend(filename for filename in (props.elements_path, props.types_path) if filename)
+        type = props.type
+        logger.debug("Found population %s of type %s", population, type)
+        if type != "virtual":
+            node = circuit.node_population(population)
+            logger.debug("    Attribute names: %s", node.attribute_names)
+            populations.append({
+                "name": population,
+                "type": type,
+                "size": node.size
             })
-        return { "populations": populations, "reports": reports }
+    reports = []
+    report_names = []
+    if simulation != None:
+        report_names = simulation.list_report_names
+    for report_name in list(report_names):
+        report = simulation.report(report_name)
+        files.append(report.file_name)
+        reports.append({
+            "type": stringify_report_type(report.type),
+            "name": report_name,
+            "start": report.start_time,
+            "end": report.end_time,
+            "delta": report.dt,
+            "unit": report.unit,
+            "cells": report.cells
+        })
+    return ({ "populations": populations, "reports": reports }, sorted(set(files)))
 
 def stringify_report_type(type) -> str:
-    Type = libsonata._libsonata.Report.Type
+    Type = libsonata.SimulationConfig.Report.Type
     if type == Type.compartment:
         return "compartment"
-    if Type == Type.summation:
+    if type == Type.summation:
         return "summation"
-    if Type == Type.synapse:
+    if type == Type.synapse:
         return "synapse"
     return str(type)
 
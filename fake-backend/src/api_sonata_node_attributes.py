@@ -0,0 +1,276 @@
+"""Entrypoint: sonata-node-attributes(path: str, population: str, attributes: str[])."""
+from entrypoint import EntryPoint, EntryPointException, PARAMS_ERROR, IO_BOUND
+from typing import Dict, List, Optional, Tuple
+import os
+import libsonata
+import numpy as np
+
+# Number of nodes per binary frame.
+# Positions of 64k nodes are 768 kB of float32.
+CHUNK_NODES = 64 * 1024
+
+# Virtual attribute made of "x", "y" and "z".
+POSITION = "position"
+
+FILE_NOT_FOUND = 1
+UNKNOWN_POPULATION = 2
+UNKNOWN_ATTRIBUTE = 3
+UNKNOWN_NODE_SET = 4
+
+class SonataNodeAttributesEntryPoint(EntryPoint):
+    """Entrypoint: sonata-node-attributes() -> { population, count, columns }.
+
+    Stream attributes of the nodes of a population as binary columns.
+
+    Input: `{
+        path: string
+        population: string
+        attributes: string[]
+        nodeSet?: string
+        ids?: number[]
+    }`
+
+    * path: SONATA circuit config, or simulation config.
+    * attributes: names of the attributes to read. `"position"` gives
+      the `x`, `y` and `z` attributes interleaved.
+    * nodeSet: name of a node set of the circuit (or of the simulation).
+    * ids: ids of the nodes to read.
+      Default to all the nodes of the population (or of `nodeSet`).
+
+    The nodes are read by slices of 65536. For each slice and for each
+    attribute, a binary frame is sent before the response. Its header is
+    a "chunk" notification with params `{
+        id: string
+        column: string
+        start: number
+        count: number
+        type: "float32" | "int32" | "int64" | "uint8" | "uint16" | "uint32"
+        newValues?: string[]
+    }` and the frame is followed by `count` little endian values of
+    `type` (3 per node for `"position"`), for the nodes at positions
+    `start` to `start + count - 1` of the selection.
+
+    Text attributes are dictionary encoded: the values are indices
+    in the `values` of the column, and `newValues` are the values to
+    append to this dictionary before decoding the frame.
+
+    Output: `{
+        population: string
+        count: number
+        columns: Array<{
+            name: string
+            type: string
+            components: number
+            values?: string[]
+        }>
+    }`
+
+    Error:
+
+    * 1: file not found
+    * 2: unknown population
+    * 3: unknown attribute
+    * 4: unknown node set
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, root):
+        """Set sandbox root folder."""
+        self.root = root
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "sonata-node-attributes"
+
+    async def exec(self, params):
+        """Send the requested columns slice by slice."""
+        self.ensureDict(params, ["path", "population", "attributes"])
+        path = os.path.abspath(params["path"])
+        self.ensureSandbox(path, self.root)
+        attributes = params["attributes"]
+        if not isinstance(attributes, list) or not all(isinstance(name, str) for name in attributes):
+            self.fatal(PARAMS_ERROR, "Argument \"attributes\" must be an array of strings!")
+        ids = params.get("ids")
+        if ids is not None and (
+            not isinstance(ids, list) or not all(isinstance(id, int) and id >= 0 for id in ids)
+        ):
+            self.fatal(PARAMS_ERROR, "Argument \"ids\" must be an array of positive integers!")
+        (population, selection) = await self.offload(
+            open_population, path, params["population"], params.get("nodeSet"), ids
+        )
+        columns = [Column(population, name) for name in attributes]
+        for start in range(0, len(selection), CHUNK_NODES):
+            chunk = selection[start:start + CHUNK_NODES]
+            for column in columns:
+                (data, new_values) = await self.offload(column.read, chunk)
+                header = {
+                    "column": column.name,
+                    "start": start,
+                    "count": len(chunk),
+                    "type": column.type
+                }
+                if new_values is not None:
+                    header["newValues"] = new_values
+                await self.send_chunk(header, memoryview(np.ascontiguousarray(data)).cast("B"))
+        return {
+            "population": population.name,
+            "count": len(selection),
+            "columns": [column.describe() for column in columns]
+        }
+
+class Column:
+    """Read an attribute and convert it to a compact type.
+
+    The type of an integer column can change from `int32` to `int64`
+    between two slices: the type of each slice is in its header.
+    """
+
+    def __init__(self, population: libsonata.NodePopulation, name: str):
+        """Check that the attribute exists and guess its type."""
+        self.population = population
+        self.name = name
+        self.components = 1
+        self.enumeration = False
+        # Values of a dictionary encoded column.
+        self.values: Optional[List[str]] = None
+        self.indices: Dict[str, int] = {}
+        names = population.attribute_names
+        if name == POSITION:
+            missing = [axis for axis in "xyz" if axis not in names]
+            if missing:
+                raise EntryPointException(
+                    UNKNOWN_ATTRIBUTE, f"Population \"{population.name}\" has no positions!"
+                )
+            self.type = "float32"
+            self.components = 3
+        elif name not in names:
+            raise EntryPointException(
+                UNKNOWN_ATTRIBUTE,
+                f"Population \"{population.name}\" has no attribute \"{name}\"!"
+            )
+        elif name in population.enumeration_names:
+            self.enumeration = True
+            self.values = list(population.enumeration_values(name))
+            self.type = get_index_type(len(self.values))
+        else:
+            # The type of the other attributes is known after the first read.
+            self.type = None
+
+    def read(self, ids: np.ndarray) -> Tuple[np.ndarray, Optional[List[str]]]:
+        """Read the values of nodes `ids`.
+
+        Return the values and the new items of the dictionary, if any.
+        `type` is the type of these values.
+        """
+        selection = libsonata.Selection(ids)
+        if self.name == POSITION:
+            data = np.empty((len(ids), 3), dtype="<f4")
+            for (index, axis) in enumerate("xyz"):
+                data[:, index] = self.population.get_attribute(axis, selection)
+            return (data, None)
+        if self.enumeration:
+            data = self.population.get_enumeration(self.name, selection)
+            return (data.astype(get_dtype(self.type)), None)
+        data = np.asarray(self.population.get_attribute(self.name, selection))
+        if data.dtype.kind in "USO":
+            # libsonata returns strings as objects.
+            return self.__encode(data)
+        if self.type != "int64":
+            # Once a slice needed 64 bits, all the next ones use them too.
+            self.type = get_numeric_type(data)
+        return (data.astype(get_dtype(self.type)), None)
+
+    def describe(self) -> dict:
+        """Description of the column for the response."""
+        description = {
+            "name": self.name,
+            "type": self.type if self.type is not None else "float32",
+            "components": self.components
+        }
+        if self.values is not None:
+            description["values"] = self.values
+        return description
+
+    def __encode(self, data: np.ndarray) -> Tuple[np.ndarray, List[str]]:
+        if self.values is None:
+            self.values = []
+            # There is no way to know how many distinct values there will be.
+            self.type = "uint32"
+        known = len(self.values)
+        indices = self.indices
+        # Faster than `numpy.unique()` on arrays of Python strings.
+        codes = np.fromiter(
+            (indices.setdefault(value, len(indices)) for value in data.tolist()),
+            dtype="<u4",
+            count=len(data)
+        )
+        new_values = list(indices)[known:]
+        self.values.extend(new_values)
+        return (codes, new_values)
+
+def open_population(
+    path: str, name: str, node_set: Optional[str], ids: Optional[List[int]]
+) -> Tuple[libsonata.NodePopulation, np.ndarray]:
+    """Open the population `name` of a circuit and return it with the ids of the selected nodes."""
+    if not os.path.isfile(path):
+        raise EntryPointException(FILE_NOT_FOUND, f"This file does not exist: {path}")
+    node_sets_path = ""
+    try:
+        simulation = libsonata.SimulationConfig.from_file(path)
+        circuit = libsonata.CircuitConfig.from_file(simulation.network)
+        node_sets_path = simulation.node_sets_file
+    except libsonata.SonataError:
+        # This is not a simulation.
+        circuit = libsonata.CircuitConfig.from_file(path)
+    if name not in circuit.node_populations:
+        raise EntryPointException(UNKNOWN_POPULATION, f"Unknown population: \"{name}\"!")
+    population = circuit.node_population(name)
+    if ids is not None:
+        selection = np.array(ids, dtype=np.uint64)
+        if len(selection) > 0 and int(selection.max()) >= population.size:
+            raise EntryPointException(
+                PARAMS_ERROR, f"Population \"{name}\" has only {population.size} nodes!"
+            )
+    elif node_set is not None:
+        selection = get_node_set(node_sets_path or circuit.node_sets_path, node_set, population)
+    else:
+        selection = np.arange(population.size, dtype=np.uint64)
+    return (population, selection)
+
+def get_node_set(path: str, name: str, population: libsonata.NodePopulation) -> np.ndarray:
+    """Ids of the nodes of `population` in the node set `name`."""
+    if not path or not os.path.isfile(path):
+        raise EntryPointException(UNKNOWN_NODE_SET, "This circuit has no node sets!")
+    node_sets = libsonata.NodeSets.from_file(path)
+    if name not in node_sets.names:
+        raise EntryPointException(UNKNOWN_NODE_SET, f"Unknown node set: \"{name}\"!")
+    return node_sets.materialize(name, population).flatten().astype(np.uint64)
+
+def get_index_type(count: int) -> str:
+    """Smallest type for the indices of a dictionary of `count` values."""
+    if count <= 0x100:
+        return "uint8"
+    if count <= 0x10000:
+        return "uint16"
+    return "uint32"
+
+def get_numeric_type(data: np.ndarray) -> str:
+    """Type in which the values of a numeric attribute are sent."""
+    if data.dtype.kind == "f":
+        return "float32"
+    if data.dtype.kind in "iub":
+        # Unsigned types of 4 bytes can hold values above the int32 range.
+        signed_size = data.dtype.itemsize * (2 if data.dtype.kind == "u" else 1)
+        return "int32" if signed_size <= 4 or is_int32(data) else "int64"
+    raise EntryPointException(UNKNOWN_ATTRIBUTE, f"Unsupported type: {data.dtype}!")
+
+def is_int32(data: np.ndarray) -> bool:
+    """Do all the values fit in a signed 32 bits integer?"""
+    info = np.iinfo(np.int32)
+    return len(data) == 0 or (int(data.min()) >= info.min and int(data.max()) <= info.max)
+
+def get_dtype(type: str) -> np.dtype:
+    """Little endian numpy type of a column type."""
+    return np.dtype(type).newbyteorder("<")
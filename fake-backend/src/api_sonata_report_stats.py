@@ -0,0 +1,170 @@
+"""Entrypoint: sonata-report-stats(path: str, report: str)."""
+from entrypoint import EntryPoint, EntryPointException, PARAMS_ERROR, CPU_BOUND
+from sonata_cache import SonataCache
+from typing import List, Optional, Tuple
+import os
+import libsonata
+import numpy as np
+
+DEFAULT_FRAMES = 64
+DEFAULT_CELLS = 1024
+DEFAULT_BINS = 64
+# The sample must stay small: bigger requests would read whole reports.
+MAX_FRAMES = 1000
+MAX_CELLS = 10000
+MAX_BINS = 1024
+PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+
+FILE_NOT_FOUND = 1
+UNKNOWN_REPORT = 2
+UNKNOWN_POPULATION = 3
+
+class SonataReportStatsEntryPoint(EntryPoint):
+    """Entrypoint: sonata-report-stats() -> { min, max, percentiles, histogram, ... }.
+
+    Statistics of a sample of the values of a report, to choose the range
+    of a transfer function without reading the whole report.
+
+    Input: `{
+        path: string
+        report: string
+        population?: string
+        frames?: number
+        cells?: number
+        bins?: number
+    }`
+
+    * path: SONATA simulation config.
+    * report: name of the report in the simulation config.
+    * population: default to the only population of the report.
+    * frames: maximum number of frames to read, evenly spaced (default to 64,
+      at most 1000).
+    * cells: maximum number of cells to read, evenly spaced (default to 1024,
+      at most 10000).
+    * bins: number of bins of the histogram (default to 64, at most 1024).
+
+    Output: `{
+        population: string
+        frames: number
+        cells: number
+        count: number
+        min: number
+        max: number
+        mean: number
+        percentiles: { [percent: string]: number }
+        histogram: number[]
+    }`
+
+    * frames, cells: number of frames and cells actually read.
+    * count: number of finite values in the sample.
+    * percentiles: for 1, 5, 25, 50, 75, 95 and 99 percent.
+    * histogram: number of values in each of the `bins` equal
+      intervals between `min` and `max`.
+
+    Error:
+
+    * 1: file not found
+    * 2: unknown report
+    * 3: unknown population
+    """
+
+    kind = CPU_BOUND
+
+    def __init__(self, root, cache: SonataCache):
+        """Set sandbox root folder."""
+        self.root = root
+        self.cache = cache
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "sonata-report-stats"
+
+    async def exec(self, params):
+        """Return the statistics of a sample of the report, from the cache if possible."""
+        self.ensureDict(params, ["path", "report"])
+        path = os.path.abspath(params["path"])
+        self.ensureSandbox(path, self.root)
+        report = params["report"]
+        population = params.get("population")
+        frames = params.get("frames", DEFAULT_FRAMES)
+        cells = params.get("cells", DEFAULT_CELLS)
+        bins = params.get("bins", DEFAULT_BINS)
+        for (name, value, maximum) in (
+            ("frames", frames, MAX_FRAMES), ("cells", cells, MAX_CELLS), ("bins", bins, MAX_BINS)
+        ):
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                self.fatal(PARAMS_ERROR, f"Argument \"{name}\" must be a positive integer!")
+            if value > maximum:
+                self.fatal(PARAMS_ERROR, f"Argument \"{name}\" must be {maximum} or less!")
+        return await self.cache.get(
+            f"report-stats/{report}/{population or ''}/{frames}/{cells}/{bins}",
+            path,
+            lambda: self.offload(get_report_stats, path, report, population, frames, cells, bins)
+        )
+
+def get_report_stats(
+    path: str, name: str, population: Optional[str], frames: int, cells: int, bins: int
+) -> Tuple[dict, List[str]]:
+    """Read a sample of a report and compute its statistics.
+
+    Return `(stats, files)`, `files` being the files the statistics
+    have been computed from.
+    """
+    if not os.path.isfile(path):
+        raise EntryPointException(FILE_NOT_FOUND, f"This file does not exist: {path}")
+    simulation = libsonata.SimulationConfig.from_file(path)
+    if name not in simulation.list_report_names:
+        raise EntryPointException(UNKNOWN_REPORT, f"Unknown report: \"{name}\"!")
+    filename = simulation.report(name).file_name
+    if not os.path.isfile(filename):
+        raise EntryPointException(FILE_NOT_FOUND, f"This file does not exist: {filename}")
+    reader = libsonata.ElementReportReader(filename)
+    names = reader.get_population_names()
+    if population is None and len(names) == 1:
+        population = names[0]
+    if population not in names:
+        raise EntryPointException(
+            UNKNOWN_POPULATION,
+            f"Unknown population \"{population}\", expected one of: {', '.join(names)}"
+        )
+    report = reader[population]
+    node_ids = sample(np.asarray(report.get_node_ids(), dtype=np.uint64), cells)
+    (start, end, delta) = report.times
+    frame_count = max(1, int(round((end - start) / delta)))
+    # libsonata reads only the frames it returns.
+    stride = max(1, -(-frame_count // frames))
+    frame = report.get(
+        node_ids=libsonata.Selection(node_ids), tstart=start, tstop=end, tstride=stride
+    )
+    data = np.asarray(frame.data, dtype=np.float64).ravel()
+    data = data[np.isfinite(data)]
+    stats = {
+        "population": population,
+        "frames": len(frame.times),
+        "cells": len(node_ids),
+        "count": len(data),
+        "min": 0.0,
+        "max": 0.0,
+        "mean": 0.0,
+        "percentiles": { str(percent): 0.0 for percent in PERCENTILES },
+        "histogram": [0] * bins
+    }
+    if len(data) > 0:
+        stats["min"] = float(data.min())
+        stats["max"] = float(data.max())
+        stats["mean"] = float(data.mean())
+        values = np.percentile(data, PERCENTILES)
+        stats["percentiles"] = {
+            str(percent): float(value) for (percent, value) in zip(PERCENTILES, values)
+        }
+        (histogram, _) = np.histogram(data, bins=bins, range=(stats["min"], stats["max"]))
+        stats["histogram"] = histogram.tolist()
+    return (stats, [path, filename])
+
+def sample(values: np.ndarray, count: int) -> np.ndarray:
+    """Return at most `count` evenly spaced items of `values`, sorted."""
+    values = np.sort(values)
+    if len(values) <= count:
+        return values
+    return values[np.linspace(0, len(values) - 1, count).astype(np.int64)]
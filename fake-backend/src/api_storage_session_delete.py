@@ -0,0 +1,37 @@
+"""Entrypoint: storage-session-delete(key?: str, prefix?: str) -> int."""
+from entrypoint import EntryPoint, IO_BOUND, PARAMS_ERROR
+from session_storage import SessionStorage
+
+
+class StorageSessionDeleteEntryPoint(EntryPoint):
+    """Entrypoint: storage-session-delete(key?: str, prefix?: str) -> int.
+
+    Delete the session variable `key`, or all the variables whose
+    name starts with `prefix`, and return the number of deleted
+    variables.
+    Each client has its own session storage.
+
+    Input: `{ key: string } | { prefix: string }`
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, storage: SessionStorage):
+        """Set the storage of the sessions."""
+        self.storage = storage
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "storage-session-delete"
+
+    async def exec(self, params):
+        """Delete `key` or the variables starting with `prefix`."""
+        self.ensureDict(params, [])
+        exact = "key" in params
+        if exact == ("prefix" in params):
+            self.fatal(PARAMS_ERROR, "Expected exactly one of the arguments \"key\" and \"prefix\"!")
+        name = params["key"] if exact else params["prefix"]
+        if not isinstance(name, str):
+            self.fatal(PARAMS_ERROR, f"Argument \"{'key' if exact else 'prefix'}\" must be a string!")
+        return await self.offload(self.storage.delete, self.connection.session_id, name, exact)
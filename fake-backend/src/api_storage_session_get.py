@@ -1,16 +1,20 @@
 """Entrypoint: storage-session-get(key: str) -> str."""
-from entrypoint import EntryPoint
+from entrypoint import EntryPoint, IO_BOUND, PARAMS_ERROR
+from session_storage import SessionStorage
 
 
 class StorageSessionGetEntryPoint(EntryPoint):
-    """Entrypoint: storage-session-get(key: str) -> str.
+    """Entrypoint: storage-session-get(key: str) -> any.
 
     Return the value of the given session variable,
-    or an empty string if not found.
+    or an empty string if not found (or expired).
+    Each client has its own session storage.
     """
 
-    def __init__(self, storage):
-        """Set session storage."""
+    kind = IO_BOUND
+
+    def __init__(self, storage: SessionStorage):
+        """Set the storage of the sessions."""
         self.storage = storage
 
     @property
@@ -25,6 +29,9 @@ class StorageSessionGetEntryPoint(EntryPoint):
         """
         self.ensureDict(params, ["key"])
         key = params["key"]
-        if key in self.storage:
-            return self.storage[key]
-        return ""
+        if not isinstance(key, str):
+            self.fatal(PARAMS_ERROR, "Argument \"key\" must be a string!")
+        value = await self.offload(self.storage.read, self.connection.session_id, key)
+        if value is None:
+            return ""
+        return value
@@ -0,0 +1,33 @@
+"""Entrypoint: storage-session-list(prefix?: str) -> str[]."""
+from entrypoint import EntryPoint, IO_BOUND, PARAMS_ERROR
+from session_storage import SessionStorage
+
+
+class StorageSessionListEntryPoint(EntryPoint):
+    """Entrypoint: storage-session-list(prefix?: str) -> str[].
+
+    Return the sorted names of the session variables which start with
+    `prefix` (default to all of them).
+    Each client has its own session storage.
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, storage: SessionStorage):
+        """Set the storage of the sessions."""
+        self.storage = storage
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "storage-session-list"
+
+    async def exec(self, params):
+        """Return the names of the variables starting with `prefix`."""
+        prefix = ""
+        if params != None:
+            self.ensureDict(params, [])
+            prefix = params.get("prefix", "")
+        if not isinstance(prefix, str):
+            self.fatal(PARAMS_ERROR, "Argument \"prefix\" must be a string!")
+        return await self.offload(self.storage.list, self.connection.session_id, prefix)
@@ -0,0 +1,80 @@
+"""Entrypoint: storage-session-patch(key: str, patch: list, ttl?: float)."""
+from entrypoint import EntryPoint, EntryPointException, IO_BOUND, PARAMS_ERROR
+from json_patch import INVALID_PATCH, apply_patch
+from session_storage import SessionStorage, get_ttl
+from codec import JSON
+from typing import Any
+from json import JSONDecodeError
+
+NOT_FOUND = 1
+
+
+class StorageSessionPatchEntryPoint(EntryPoint):
+    """Entrypoint: storage-session-patch(key: str, patch: list, ttl?: float).
+
+    Apply a JSON Patch (RFC 6902) to the value of the session variable
+    `key`, so that a small change of a big value does not need to send
+    the whole value again.
+    If the value is a string, it is parsed as JSON, patched, and stored
+    back as a string.
+    The operations are applied atomically: if one fails, the value is
+    not modified.
+
+    Input: `{ key: string, patch: Operation[], ttl?: number }`
+
+    with `Operation = {
+        op: "add" | "remove" | "replace" | "move" | "copy" | "test",
+        path: string,
+        from?: string,
+        value?: any
+    }`
+
+    * ttl: number of seconds after which the value is deleted
+      (default to keep the current expiration).
+
+    Error:
+
+    * 1: the key does not exist.
+    * 2: the patch cannot be applied.
+    * 3: the patched value is bigger than the storage.
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, storage: SessionStorage):
+        """Set the storage of the sessions."""
+        self.storage = storage
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "storage-session-patch"
+
+    async def exec(self, params):
+        """Patch the value of `key`."""
+        self.ensureDict(params, ["key", "patch"])
+        key = params["key"]
+        if not isinstance(key, str):
+            self.fatal(PARAMS_ERROR, "Argument \"key\" must be a string!")
+        patch = params["patch"]
+        ttl = get_ttl(params)
+        found = await self.offload(
+            self.storage.update,
+            self.connection.session_id,
+            key,
+            lambda value: patch_value(value, patch),
+            ttl
+        )
+        if not found:
+            self.fatal(NOT_FOUND, f"Session variable \"{key}\" does not exist!")
+
+
+def patch_value(value: Any, patch: Any) -> Any:
+    """Patch `value`, or the JSON it holds if it is a string."""
+    if not isinstance(value, str):
+        return apply_patch(value, patch)
+    try:
+        document = JSON.decode(value)
+    except JSONDecodeError:
+        raise EntryPointException(INVALID_PATCH, "The value is a string which is not JSON!")
+    return JSON.encode(apply_patch(document, patch))
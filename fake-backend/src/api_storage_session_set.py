@@ -1,15 +1,30 @@
-"""Entrypoint: storage-session-set(key: str, value: str)."""
-from entrypoint import EntryPoint
+"""Entrypoint: storage-session-set(key: str, value: any, ttl?: float)."""
+from entrypoint import EntryPoint, IO_BOUND, PARAMS_ERROR
+from session_storage import SessionStorage, get_expiration, get_ttl
+from codec import JSON
 
 
 class StorageSessionSetEntryPoint(EntryPoint):
-    """Entrypoint: storage-session-set(key: str, value: str).
+    """Entrypoint: storage-session-set(key: str, value: any, ttl?: float).
 
     Store a `value` with name `key`.
+    Each client has its own session storage.
+
+    Input: `{ key: string, value: any, ttl?: number }`
+
+    * value: any JSON value.
+    * ttl: number of seconds after which the value is deleted
+      (default to never).
+
+    Error:
+
+    * 3: the value is bigger than the storage.
     """
 
-    def __init__(self, storage):
-        """Set session storage."""
+    kind = IO_BOUND
+
+    def __init__(self, storage: SessionStorage):
+        """Set the storage of the sessions."""
         self.storage = storage
 
     @property
@@ -21,5 +36,13 @@ class StorageSessionSetEntryPoint(EntryPoint):
         """Store a `value` with name `key`."""
         self.ensureDict(params, ["key", "value"])
         key = params["key"]
-        value = params["value"]
-        self.storage[key] = value
+        if not isinstance(key, str):
+            self.fatal(PARAMS_ERROR, "Argument \"key\" must be a string!")
+        try:
+            value = JSON.encode(params["value"])
+        except TypeError as ex:
+            self.fatal(PARAMS_ERROR, f"Argument \"value\" cannot be stored as JSON: {ex}")
+        expiration = get_expiration(get_ttl(params))
+        connection = self.connection
+        self.storage.watch(connection)
+        await self.offload(self.storage.set, connection.session_id, key, value, expiration)
@@ -0,0 +1,129 @@
+"""Entrypoint: volume-read-level(path: str, level: int)."""
+from entrypoint import EntryPoint, PARAMS_ERROR, IO_BOUND
+from nrrd import read_header, read_slab
+from volume_pyramid import DENSITY, LABELS, VolumePyramids, ensure_3d, read_level
+import os
+import numpy as np
+
+# Size of the binary frames.
+CHUNK_SIZE = 512 * 1024
+
+# Biggest level we accept to hold in memory.
+MAX_LEVEL_SIZE = 256 * 1024 * 1024
+
+INVALID_LEVEL = 3
+DISABLED = 4
+
+class VolumeReadLevel(EntryPoint):
+    """Entrypoint: volume-read-level() -> { ready: boolean, ... }.
+
+    Stream a downsampled version of a NRRD volume.
+
+    Input: `{
+        path: string
+        level: number
+        reduction?: "labels" | "density"
+        wait?: boolean
+    }`
+
+    * level: 0 for the volume itself, then each level halves the sizes
+      of the spatial axes, until they are all 16 or smaller.
+    * reduction: how 2x2x2 voxels are merged. "labels" keeps the most
+      frequent value, "density" computes the mean (as float32).
+      Default to "labels" for integers and "density" for floats.
+    * wait: if false and the levels are not built yet, return
+      `{ ready: false, progress: number }` at once (default to true).
+
+    The levels are built in the background the first time a volume is
+    used, then read from the cache.
+    The samples are sent in binary frames, before the response, in the
+    order of NRRD files. Each frame has a "chunk" notification as header,
+    with params `{ id: string, offset: int }`, followed by the bytes
+    at `offset` in the level.
+
+    Output: `{
+        ready: true
+        level: number
+        levels: number
+        scale: number
+        type: string
+        sizes: number[]
+        length: number
+    }`
+
+    * levels: number of available levels.
+    * scale: size of a voxel of this level relative to the volume's ones.
+    * type: numpy name of the type of the samples, which are little endian.
+    * sizes: number of samples along each axis, fastest first.
+    * length: number of bytes.
+
+    Error:
+
+    * 1: not a NRRD file
+    * 2: unsupported type, encoding or dimension
+    * 3: invalid level
+    * 4: pyramids are disabled
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, root, pyramids: VolumePyramids):
+        """Set sandbox root folder."""
+        self.root = root
+        self.pyramids = pyramids
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "volume-read-level"
+
+    async def exec(self, params):
+        """Send a level of the pyramid of the volume, building it if needed."""
+        self.ensureDict(params, ["path", "level"])
+        path = os.path.abspath(params["path"])
+        self.ensureSandbox(path, self.root)
+        level = params["level"]
+        if not isinstance(level, int) or level < 0:
+            self.fatal(PARAMS_ERROR, "Argument \"level\" must be a positive integer!")
+        reduction = params.get("reduction")
+        if reduction not in (None, LABELS, DENSITY):
+            self.fatal(PARAMS_ERROR, f"Argument \"reduction\" must be \"{LABELS}\" or \"{DENSITY}\"!")
+        header = await self.offload(read_header, path)
+        for data_file in header.data_files:
+            self.ensureSandbox(data_file, self.root)
+        ensure_3d(header.sizes)
+        if reduction is None:
+            reduction = DENSITY if header.dtype.kind == "f" else LABELS
+        if not self.pyramids.enabled:
+            self.fatal(DISABLED, "Volume pyramids are disabled on this backend!")
+        info = await self.pyramids.get(path, reduction, params.get("wait", True))
+        if info is None:
+            return { "ready": False, "progress": self.pyramids.get_progress(path, reduction) }
+        levels = info["levels"]
+        if level >= len(levels):
+            self.fatal(INVALID_LEVEL, f"Level {level} does not exist, there are {len(levels)} levels!")
+        length = np.dtype(levels[level]["type"]).itemsize
+        for size in levels[level]["sizes"]:
+            length *= size
+        if length > MAX_LEVEL_SIZE:
+            self.fatal(
+                INVALID_LEVEL,
+                f"Level {level} is too big: {length} bytes, the maximum is {MAX_LEVEL_SIZE}!"
+            )
+        if level == 0:
+            sizes = header.sizes
+            data = await self.offload(read_slab, header, [0] * len(sizes), sizes, [1] * len(sizes))
+        else:
+            data = await self.offload(read_level, self.pyramids.get_folder(path, reduction), level)
+        view = memoryview(data.reshape(-1)).cast("B")
+        for offset in range(0, len(view), CHUNK_SIZE):
+            await self.send_chunk({ "offset": offset }, view[offset:offset + CHUNK_SIZE])
+        return {
+            "ready": True,
+            "level": level,
+            "levels": len(levels),
+            "scale": 2 ** level,
+            "type": data.dtype.name,
+            "sizes": levels[level]["sizes"],
+            "length": len(view)
+        }
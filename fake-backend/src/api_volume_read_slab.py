@@ -0,0 +1,107 @@
+"""Entrypoint: volume-read-slab(path: str, start?: int[], size?: int[], step?: int[])."""
+from entrypoint import EntryPoint, PARAMS_ERROR, IO_BOUND
+from nrrd import INVALID_SLAB, read_header, read_slab
+from typing import Any, List
+import os
+
+# Size of the binary frames.
+CHUNK_SIZE = 512 * 1024
+
+# Biggest slab we accept to hold in memory.
+MAX_SLAB_SIZE = 256 * 1024 * 1024
+
+class VolumeReadSlab(EntryPoint):
+    """Entrypoint: volume-read-slab() -> { type: string, sizes: number[], length: number }.
+
+    Stream an axis-aligned block of the samples of a NRRD volume.
+
+    Input: `{
+        path: string
+        start?: number[]
+        size?: number[]
+        step?: number[]
+    }`
+
+    One item per axis, in the order of the "sizes" field of the header
+    (the first axis is the fastest).
+
+    * start: index of the first sample along each axis (default to 0).
+    * size: number of samples along each axis (default to the end).
+    * step: distance between two samples along each axis (default to 1).
+
+    The samples are sent in binary frames, before the response, in the
+    order of the file. Each frame has a "chunk" notification as header,
+    with params `{ id: string, offset: int }`, followed by the bytes
+    at `offset` in the slab.
+
+    Output: `{ type: string, sizes: number[], length: number }`
+
+    * type: numpy name of the type of the samples, which are little endian
+      ("uint8", "int16", "float32", ...).
+    * sizes: number of samples along each axis.
+    * length: number of bytes.
+
+    Error:
+
+    * 1: not a NRRD file
+    * 2: unsupported type or encoding
+    * 3: invalid slab
+    """
+
+    kind = IO_BOUND
+
+    def __init__(self, root):
+        """Set sandbox root folder."""
+        self.root = root
+
+    @property
+    def name(self):
+        """Name of this entrypoint."""
+        return "volume-read-slab"
+
+    async def exec(self, params):
+        """Read the slab and send it in chunks."""
+        self.ensureDict(params, ["path"])
+        path = os.path.abspath(params["path"])
+        self.ensureSandbox(path, self.root)
+        header = await self.offload(read_header, path)
+        for data_file in header.data_files:
+            self.ensureSandbox(data_file, self.root)
+        sizes = header.sizes
+        start = self.__get_vector(params, "start", [0] * len(sizes), 0)
+        step = self.__get_vector(params, "step", [1] * len(sizes), 1)
+        size = self.__get_vector(
+            params,
+            "size",
+            [-(-(axis - first) // stride) for (axis, first, stride) in zip(sizes, start, step)],
+            1
+        )
+        for (axis, first, count, stride) in zip(sizes, start, size, step):
+            if first + (count - 1) * stride >= axis:
+                self.fatal(INVALID_SLAB, f"Slab is out of the volume of sizes {sizes}!")
+        length = header.dtype.itemsize
+        for count in size:
+            length *= count
+        if length > MAX_SLAB_SIZE:
+            self.fatal(
+                INVALID_SLAB, f"Slab is too big: {length} bytes, the maximum is {MAX_SLAB_SIZE}!"
+            )
+        slab = await self.offload(read_slab, header, start, size, step)
+        view = memoryview(slab.reshape(-1)).cast("B")
+        for offset in range(0, len(view), CHUNK_SIZE):
+            await self.send_chunk({ "offset": offset }, view[offset:offset + CHUNK_SIZE])
+        return { "type": slab.dtype.name, "sizes": size, "length": len(view) }
+
+    def __get_vector(self, params: Any, name: str, default: List[int], minimum: int) -> List[int]:
+        value = params.get(name, default)
+        if (
+            not isinstance(value, list)
+            or len(value) != len(default)
+            or not all(isinstance(item, int) and item >= minimum for item in value)
+        ):
+            self.fatal(
+                PARAMS_ERROR,
+                f"Argument \"{name}\" must be an array of {len(default)} integers"
+                + f" greater than or equal to {minimum}!"
+            )
+        return value
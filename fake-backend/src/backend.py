@@ -1,23 +1,52 @@
 """Websocket server.
 
-This server will accept only one client and will communicate with
-jsonrpc protocol version 2.0.
+This server accepts several clients (up to `max_clients`) and communicates
+with jsonrpc protocol version 2.0. Each client has its own send queue and
+its own session.
 This is an asynchronous protocol. The client sends a request with a unique ID.
-Later the server send back a result with this same ID.
+Later the server send back a result with this same ID. A request without
+ID is a notification: it is executed, but nothing is sent back.
+
+A client can also send an array of requests (a batch). They are executed
+concurrently and their responses are sent back in a single array, in
+the order of the requests. Notifications have no item in this array,
+and nothing is sent for a batch of notifications. Invalid items get an
+error in the array, like invalid requests sent alone.
+
+Every call is measured (see `metrics.py`). Besides websockets, the server
+answers plain HTTP requests on `/metrics` with the metrics in Prometheus'
+text format.
 """
 import asyncio
+import functools
+import http
+import logging
 import ssl
-import json
 import socket
-import traceback
 from json import JSONDecodeError
-from typing import Any, Dict, List, Optional, TypedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 import websockets
+from codec import JSON, Codec, decode_frame, encode_frame, get_subprotocols
+from connection import Connection, current_connection
+from dispatcher import Dispatcher, DispatcherOptions
 from entrypoint import EntryPoint
+from metrics import Call, Metrics, current_call
+
+# Path of the metrics for Prometheus.
+METRICS_PATH = "/metrics"
+
+logger = logging.getLogger("backend")
+
+# Receives the response of a request and returns the size of what it has sent.
+Reply = Callable[[dict], Awaitable[int]]
 
 
-class Options(TypedDict):
+class Options(DispatcherOptions):
     port: int
+    certificate: Optional[str]
+    private_key: Optional[str]
+    # Maximum number of simultaneous clients (0 means no limit).
+    max_clients: int
 
 class Server:
     """Websocket server.
@@ -28,28 +57,37 @@ class Server:
     list of all available entrypoint names (except "help").
     If a name if given as unique parameter, the docstring of this
     entrypoint is returned.
+
+    Calls are executed by a `Dispatcher` which limits their concurrency.
     """
 
-    client = None
+    clients: Dict[str, Connection] = {}
     entrypoints: Dict[str, EntryPoint] = {}
     entrypoint_names: List[str] = []
 
-    def __init__(self, options: Options, entrypoints: List[EntryPoint]):
+    def __init__(self, options: Options, entrypoints: List[EntryPoint], metrics: Metrics):
         """Constructor.
 
         Args:
+            options: network options and dispatcher limits.
             entrypoints: list of available entrypoints.
+            metrics: where the calls are measured.
         """
         self.options = options
+        self.metrics = metrics
         self.entrypoint_names = [x.name for x in entrypoints]
         self.entrypoints = dict(zip(self.entrypoint_names, entrypoints))
         self.entrypoint_names.sort()
+        self.clients = {}
+        self.dispatcher = Dispatcher(options, entrypoints)
+        # Tasks waiting for the calls of a batch to send its response.
+        self.batches: Set[asyncio.Task] = set()
 
     async def start(self):
-        print("Initializing entry points...")
-        print("  * help")
+        logger.info("Initializing entry points...")
+        logger.info("  * help")
         for name in self.entrypoint_names:
-            print(f"  * {name}")
+            logger.info("  * %s", name)
             entrypoint = self.entrypoints[name]
             await entrypoint.initialize()
         host = socket.getfqdn()
@@ -58,125 +96,302 @@ class Server:
         certificate = self.options["certificate"]
         private_key = self.options["private_key"]
         if certificate != None:
-            print("Connection will be secured by SSL.")
-            print("    Certificate:", certificate)
+            logger.info("Connection will be secured by SSL.")
+            logger.info("    Certificate: %s", certificate)
             ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
             ssl_context.load_cert_chain(certificate, private_key)
         # pylint: disable=no-member
-        start_server = websockets.serve(self.__server, host, port, ssl=ssl_context)
-        print(f"Listening on {host}:{port}")
-        print(f"      ... on ({socket.gethostbyname(socket.gethostname())}:{port})")
+        subprotocols = get_subprotocols()
+        start_server = websockets.serve(
+            self.__server,
+            host,
+            port,
+            ssl=ssl_context,
+            subprotocols=subprotocols if len(subprotocols) > 0 else None,
+            process_request=self.__process_request
+        )
+        logger.info("Listening on %s:%s", host, port)
+        if len(subprotocols) > 0:
+            logger.info("      ... with optional subprotocols: %s", ", ".join(subprotocols))
+        logger.info("      ... on (%s:%s)", socket.gethostbyname(socket.gethostname()), port)
         await start_server
 
+    async def __process_request(self, path: str, _headers):
+        """Answer HTTP requests for the metrics, let the other ones become websockets."""
+        if path.split("?")[0] != METRICS_PATH:
+            return None
+        body = self.metrics.to_prometheus().encode("utf-8")
+        return (
+            http.HTTPStatus.OK,
+            [("Content-Type", "text/plain; version=0.0.4; charset=utf-8")],
+            body
+        )
+
     async def __send(
         self,
-        websocket=None,
+        connection: Connection,
         query_id: str = None,
-        method: str = None,
         result=None,
         err_num: int = None,
         err_msg: str = None,
-    ):
+    ) -> int:
         """Send a message in JSON-RPC format.
 
         Args:
-            websocket (WebSocketClientProtocol): if undefined, we use the currently connected client
+            connection: the client to send the message to
             query_id (string): id of the request this message is an answer of
-            method (string): name of the method we are replying to
             result (any): data produced by the called method
             err_num (int): error code
             err_msg (string): error message
+
+        Return the size of the message.
         """
-        data = {"jsonrpc": "2.0"}
-        if id is not None:
-            data["id"] = query_id
-        if method is not None:
-            data["method"] = method
+        return await self.__reply(
+            connection, self.__response(query_id, result, err_num, err_msg)
+        )
+
+    def __response(
+        self, query_id: str = None, result=None, err_num: int = None, err_msg: str = None
+    ) -> dict:
+        """Build a response in JSON-RPC format."""
+        data = {"jsonrpc": "2.0", "id": query_id}
         if result is not None:
             data["result"] = result
         if err_num is not None:
             data["error"] = {"code": err_num, "message": str(err_msg)}
-        websocket = self.client if websocket is None else websocket
-        if websocket is None:
-            print("[ERROR] No client connected yet!")
-            return
-        await websocket.send(json.dumps(data))
+        return data
 
-    async def __callback_success(self, query_id: str, result: Any):
-        await self.__send(query_id=query_id, result=result)
+    async def __reply(self, connection: Connection, response: dict) -> int:
+        """Send `response` to `connection` and return the size of the message."""
+        codec = connection.codec
+        message = codec.encode(response)
+        if codec.binary:
+            message = encode_frame(message)
+        await connection.send(message)
+        return len(message)
 
-    async def __callback_failure(self, query_id: str, code: int, message: str):
-        await self.__send(query_id=query_id, err_num=code, err_msg=message)
+    async def __store(
+        self, codec: Codec, responses: List[Any], index: int, response: dict
+    ) -> int:
+        """Keep the encoded `response` of the item `index` of a batch."""
+        message = codec.encode(response)
+        responses[index] = message
+        return len(message)
+
+    async def __callback_success(
+        self, reply: Optional[Reply], call: Call, query_id: str, result: Any
+    ):
+        if reply is not None:
+            call.response_size += await reply(self.__response(query_id, result=result))
+
+    async def __callback_failure(
+        self, reply: Optional[Reply], call: Call, query_id: str, code: int, message: str
+    ):
+        call.error = code
+        if reply is None:
+            logger.debug("Notification failed (%d): %s", code, message)
+            return
+        call.response_size += await reply(
+            self.__response(query_id, err_num=code, err_msg=message)
+        )
+
+    async def __measure(self, call: Call, coroutine: Awaitable, done: asyncio.Future) -> None:
+        """Run the call of an entrypoint, record its metrics and resolve `done`."""
+        # This runs in the task of the call: the entrypoint sees this value.
+        current_call.set(call)
+        try:
+            await coroutine
+        finally:
+            call.finish()
+            if not done.done():
+                done.set_result(None)
 
     async def __server(self, websocket, path):
-        send = self.__send
-        if self.client is not None and self.client.open:
-            await send(
-                websocket=websocket, err_num=-1, err_msg="There is already a client connected!"
-            )
+        max_clients = self.options["max_clients"]
+        if max_clients > 0 and len(self.clients) >= max_clients:
+            await websocket.send(JSON.encode({
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {
+                    "code": -1,
+                    "message": f"Too many clients connected (max is {max_clients})!"
+                }
+            }))
             return
-        self.client = websocket
-        print("[LOG] Client connected:", path)
+        connection = Connection(websocket, path)
+        self.clients[connection.id] = connection
+        self.metrics.clients = len(self.clients)
+        # Every task created from now on in this handler (see `Dispatcher.submit()`)
+        # inherits this value.
+        current_connection.set(connection)
+        logger.info(
+            "Client connected: %s (%d clients, codec %s)",
+            path, len(self.clients), connection.codec.name
+        )
+        try:
+            await self.__serve(connection)
+        finally:
+            del self.clients[connection.id]
+            self.metrics.clients = len(self.clients)
+            connection.close()
+            logger.info("Client disconnected: %s (%d clients)", path, len(self.clients))
+
+    async def __serve(self, connection: Connection):
+        """Process the messages of a client until it disconnects."""
+        websocket = connection.websocket
+        send = functools.partial(self.__send, connection)
         while True:
             try:
                 msg = await websocket.recv()
                 if type(msg) != str:
-                    size = int(msg[0]) + 256 * int(msg[1]) + 256 * 256 * int(msg[2])
-                    print("[MSG] Binary message of size:", size)
-                    msg = msg[4:].decode("utf-8")
-                print(f"[MSG] {msg}")
-                data = json.loads(msg)
-                if not isinstance(data, dict):
-                    await send(err_num=-2, err_msg="A JSON object was expected!")
-                elif "jsonrpc" not in data or data["jsonrpc"] != "2.0":
-                    await send(err_num=-3, err_msg="JSON-RPC version 2.0 was expected!")
+                    # Binary frame: the header is encoded with the codec of the connection.
+                    (header, chunk) = decode_frame(msg)
+                    data = connection.codec.decode(header)
                 else:
-                    query_id = None if "id" not in data else data["id"]
-                    method = None if "method" not in data else data["method"]
-                    params = None if "params" not in data else data["params"]
-                    if not isinstance(query_id, str):
-                        await send(err_num=-4, err_msg="Invalid format: attribute 'id' is missing!")
-                        continue
-                    if not isinstance(method, str):
-                        await send(
-                            err_num=-4, err_msg="Invalid format: attribute 'method' is missing!"
-                        )
-                        continue
-                    if method == "help":
-                        await self.__callback_help(query_id, params)
-                        continue
-                    if method not in self.entrypoints:
-                        await send(err_num=-6, err_msg=f'Unknown entrypoint "{method}"!')
-                        continue
-                    entrypoint = self.entrypoints[method]
-                    asyncio.create_task(
-                        entrypoint.callback(
-                            query_id=query_id,
-                            params=params,
-                            success=self.__callback_success,
-                            failure=self.__callback_failure,
-                        )
-                    )
+                    data = JSON.decode(msg)
+                    chunk = b""
+                if isinstance(data, list):
+                    await self.__serve_batch(connection, data, chunk, len(msg))
+                    continue
+                error = self.__validate(data)
+                if error is not None:
+                    (err_num, err_msg) = error
+                    await send(query_id=get_query_id(data), err_num=err_num, err_msg=err_msg)
+                    continue
+                reply = functools.partial(self.__reply, connection) if "id" in data else None
+                await self.__submit(data, chunk, len(msg), reply)
+            except websockets.exceptions.ConnectionClosed:
+                return
             except JSONDecodeError as ex:
-                print(f"[ERROR] {str(ex)}")
+                logger.warning("%s", ex)
                 await send(
                     err_num=-5,
                     err_msg=f"Invalid JSON at line {ex.lineno} and pos {ex.colno}: {ex.msg}",
                 )
+            except ValueError as ex:
+                logger.warning("%s", ex)
+                await send(err_num=-5, err_msg=str(ex))
             except Exception as ex:  # pylint: disable=broad-except
-                print(f"[ERROR] Unknown exception: {str(ex)}")
-                print(traceback.format_exc())
+                logger.exception("Unknown exception: %s", ex)
                 await send(err_num=-9, err_msg="Unknown exception!")
 
-    async def __callback_help(self, query_id: str, entrypoint_name: Optional[str]):
-        """Send back API documentation.
+    async def __serve_batch(
+        self, connection: Connection, batch: List[Any], chunk: bytes, size: int
+    ):
+        """Dispatch the requests of a batch and answer them in a single message.
+
+        The requests run concurrently, under the limits of the dispatcher,
+        and the response is sent by another task once they are all done:
+        the next messages of the client are read in the meantime.
+        """
+        if len(batch) == 0:
+            await self.__send(connection, err_num=-2, err_msg="A batch cannot be empty!")
+            return
+        if len(chunk) > 0:
+            await self.__send(
+                connection, err_num=-2, err_msg="Binary data cannot be attached to a batch!"
+            )
+            return
+        codec = connection.codec
+        # Encoded responses, in the order of the requests (`None` for notifications).
+        responses: List[Any] = [None] * len(batch)
+        calls: List[Awaitable] = []
+        # The size of each request is unknown: they share the size of the batch.
+        request_size = size // len(batch)
+        for (index, data) in enumerate(batch):
+            error = self.__validate(data)
+            if error is not None:
+                (err_num, err_msg) = error
+                responses[index] = codec.encode(
+                    self.__response(get_query_id(data), err_num=err_num, err_msg=err_msg)
+                )
+                continue
+            reply = None
+            if "id" in data:
+                reply = functools.partial(self.__store, codec, responses, index)
+            calls.append(await self.__submit(data, b"", request_size, reply))
+        task = asyncio.create_task(self.__answer_batch(connection, responses, calls))
+        # Keep a reference to prevent the task from being garbage collected.
+        self.batches.add(task)
+        task.add_done_callback(self.batches.discard)
+
+    async def __answer_batch(
+        self, connection: Connection, responses: List[Any], calls: List[Awaitable]
+    ):
+        """Wait for the `calls` of a batch and send their `responses` as an array."""
+        await asyncio.gather(*calls)
+        items = [response for response in responses if response is not None]
+        if len(items) == 0:
+            # Notifications only.
+            return
+        codec = connection.codec
+        message = codec.join(items)
+        if codec.binary:
+            message = encode_frame(message)
+        await connection.send(message)
+
+    def __validate(self, data: Any) -> Optional[Tuple[int, str]]:
+        """Return the error code and message of an invalid request, or `None`."""
+        if not isinstance(data, dict):
+            return (-2, "A JSON object was expected!")
+        if "jsonrpc" not in data or data["jsonrpc"] != "2.0":
+            return (-3, "JSON-RPC version 2.0 was expected!")
+        if "id" in data and not isinstance(data["id"], str):
+            return (-4, "Invalid format: attribute 'id' must be a string!")
+        method = data.get("method")
+        if not isinstance(method, str):
+            return (-4, "Invalid format: attribute 'method' is missing!")
+        if method != "help" and method not in self.entrypoints:
+            return (-6, f'Unknown entrypoint "{method}"!')
+        return None
+
+    async def __submit(
+        self, data: dict, chunk: bytes, size: int, reply: Optional[Reply]
+    ) -> Awaitable:
+        """Dispatch a valid request and return an awaitable resolved once it is done.
+
+        The response is given to `reply`, unless the request is a notification
+        (`reply` is `None`).
+        """
+        query_id = data.get("id")
+        method = data["method"]
+        params = data.get("params")
+        # Never log the whole message: it can be huge (fs-set-content).
+        logger.debug("%s #%s (%d bytes)", method, query_id, size)
+        done = asyncio.get_running_loop().create_future()
+        if method == "help":
+            if reply is not None:
+                await reply(self.__response(query_id, result=self.__help(params)))
+            done.set_result(None)
+            return done
+        entrypoint = self.entrypoints[method]
+        call = self.metrics.begin(method, size)
+        await self.dispatcher.submit(
+            entrypoint,
+            self.__measure(call, entrypoint.callback(
+                query_id=query_id,
+                params=params,
+                success=functools.partial(self.__callback_success, reply, call),
+                failure=functools.partial(self.__callback_failure, reply, call),
+                chunk=chunk,
+            ), done)
+        )
+        return done
+
+    def __help(self, entrypoint_name: Optional[str]) -> Any:
+        """API documentation.
 
         If `entrypoint_name` is not defined or if it is not the name of
         an available entrypoint, we return the list of available entrypoints.
         Otherwise, we return the docstring of the entrypoint.
         """
         if entrypoint_name is None or entrypoint_name not in self.entrypoints:
-            await self.__callback_success(query_id, self.entrypoint_names)
-        else:
-            entrypoint = self.entrypoints[entrypoint_name]
-            await self.__callback_success(query_id, entrypoint.__doc__)
+            return self.entrypoint_names
+        return self.entrypoints[entrypoint_name].__doc__
+
+
+def get_query_id(data: Any) -> Optional[str]:
+    """Id of a request, if it has a valid one."""
+    if isinstance(data, dict) and isinstance(data.get("id"), str):
+        return data["id"]
+    return None
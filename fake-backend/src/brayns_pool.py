@@ -0,0 +1,443 @@
+"""Pool of Brayns processes, each one leased to a single session.
+
+Loading the plugins of Brayns takes tens of seconds. To give a new
+session a Brayns at once, the pool keeps `min` spare processes ready
+(pre-warmed), on ports taken from a range starting at `first_port`.
+
+* A session (see `Connection.session_id`) leases a spare process for as
+  long as it is connected. Asking again returns the same process, also
+  from a new connection resuming the session.
+* When the session ends, its process is killed, because it holds the
+  scene of this session, and a fresh one takes its place if needed.
+  A session without id ends with its connection. A session with an id
+  ends `lease_grace` seconds after its last connection has closed, to
+  let a client that reconnects find its scene again.
+* When all the spare processes are leased, new ones are started, up to
+  `max` processes. Above `min`, the spare processes idle for more than
+  `idle_timeout` seconds are stopped.
+
+Each instance is supervised: a leased process which exits, or which
+uses more than `max_memory`, is restarted on the same port after a
+delay that doubles after each crash. Its client is notified of the
+crash ("brayns-crashed", with the last lines of the log) and of the
+restart ("brayns-restarted").
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set, TypedDict
+from brayns_process import BraynsProcess, get_memory
+from connection import Connection
+from entrypoint import EntryPointException
+
+# Seconds between two checks of the idle processes.
+CHECK_INTERVAL = 10.0
+
+# Seconds between two checks of the memory of a process.
+MEMORY_INTERVAL = 5.0
+
+# Seconds before the first restart of a crashed process.
+RESTART_DELAY = 1.0
+
+# Maximum number of seconds before a restart.
+MAX_RESTART_DELAY = 60.0
+
+# A process running for this number of seconds before crashing is
+# restarted after `RESTART_DELAY` again.
+STABLE_UPTIME = 300.0
+
+POOL_FULL = 2
+
+STARTING = "starting"
+CRASHED = "crashed"
+IDLE = "idle"
+LEASED = "leased"
+
+logger = logging.getLogger("brayns_pool")
+
+
+class BraynsPoolOptions(TypedDict):
+    # Script starting Brayns, called with a port and a version.
+    brayns_command: str
+    # First port of the range used by the processes.
+    brayns_first_port: int
+    # Number of spare processes kept ready.
+    brayns_pool_min: int
+    # Maximum number of processes.
+    brayns_pool_max: int
+    # Seconds after which a spare process above `min` is stopped.
+    brayns_idle_timeout: float
+    # Seconds to wait for a process to be ready.
+    brayns_timeout: float
+    # Version of Brayns of the spare processes.
+    brayns_version: int
+    # Resident memory, in megabytes, above which a process is restarted (0 means no limit).
+    brayns_max_memory: float
+    # Number of lines kept from the output of each process.
+    brayns_log_lines: int
+    # Seconds during which a session with an id keeps its process after disconnecting.
+    brayns_lease_grace: float
+
+
+class BraynsInstance:
+    """A Brayns process of the pool and its lease."""
+
+    def __init__(self, process: BraynsProcess):
+        """Start the process in the background."""
+        self.process = process
+        self.session: Optional[str] = None
+        self.connection: Optional[Connection] = None
+        self.created = time.monotonic()
+        self.launched = self.created
+        self.released = self.created
+        # Has the first process been ready?
+        self.ready = False
+        self.restarts = 0
+        self.start = asyncio.ensure_future(process.start())
+        self.supervisor: Optional[asyncio.Task] = None
+
+    def restart(self, process: BraynsProcess) -> None:
+        """Replace the process of this instance, which has crashed."""
+        self.process = process
+        self.restarts += 1
+        self.launched = time.monotonic()
+        self.start = asyncio.ensure_future(process.start())
+
+    @property
+    def port(self) -> int:
+        """Port on which this instance listens."""
+        return self.process.port
+
+    @property
+    def version(self) -> int:
+        """Major version of Brayns."""
+        return self.process.version
+
+    @property
+    def status(self) -> str:
+        """Starting, crashed, idle or leased."""
+        if not self.start.done():
+            return STARTING
+        if not self.process.alive:
+            return CRASHED
+        return IDLE if self.session is None else LEASED
+
+    @property
+    def spare(self) -> bool:
+        """Can this instance be leased to a new session?"""
+        return self.session is None and (not self.start.done() or self.process.alive)
+
+    async def info(self, memory: Optional[int]) -> dict:
+        """Health and uptime of this instance, with its resident `memory`."""
+        now = time.monotonic()
+        return {
+            "port": self.port,
+            "pid": self.process.pid,
+            "version": self.version,
+            "status": self.status,
+            "healthy": self.start.done() and await self.process.is_healthy(),
+            "memory": memory,
+            "uptime": now - self.launched,
+            "idle": now - self.released if self.status == IDLE else 0,
+            "restarts": self.restarts
+        }
+
+    async def notify(self, method: str, params: dict) -> None:
+        """Send a notification to the client of this instance, if any."""
+        if self.connection is not None and self.connection.open:
+            await self.connection.notify(method, params)
+
+
+class BraynsPool:
+    """Start, lease and stop the Brayns processes."""
+
+    def __init__(self, options: BraynsPoolOptions):
+        """Define how to start Brayns and the size of the pool."""
+        self.command = options["brayns_command"]
+        self.first_port = options["brayns_first_port"]
+        self.min = options["brayns_pool_min"]
+        self.max = max(1, self.min, options["brayns_pool_max"])
+        self.idle_timeout = options["brayns_idle_timeout"]
+        self.timeout = options["brayns_timeout"]
+        self.version = options["brayns_version"]
+        self.max_memory = int(options["brayns_max_memory"] * 1024 * 1024)
+        self.log_lines = options["brayns_log_lines"]
+        self.lease_grace = options["brayns_lease_grace"]
+        # Instances by port.
+        self.instances: Dict[int, BraynsInstance] = {}
+        # Instances by session.
+        self.leases: Dict[str, BraynsInstance] = {}
+        # Leases being acquired, by session.
+        self.pending: Dict[str, asyncio.Future] = {}
+        # Releases of the sessions whose connections have closed, by session.
+        self.expirations: Dict[str, asyncio.TimerHandle] = {}
+        # Ids of the connections whose closing we watch.
+        self.connections: Set[str] = set()
+        # Notified each time an instance is released or removed.
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the spare processes. Must be called from the event loop."""
+        if self.task is not None:
+            return
+        self.__replenish()
+        self.task = asyncio.create_task(self.__check())
+
+    async def lease(
+        self, connection: Connection, version: Optional[int] = None
+    ) -> BraynsInstance:
+        """Return the instance leased to the session of `connection`, leasing one if needed.
+
+        Concurrent calls for the same session wait for the same lease.
+        A session whose instance has crashed gets a new one at once.
+        The lease ends when the session does (see `disconnect()`).
+        """
+        session = connection.session_id
+        if connection.id not in self.connections:
+            self.connections.add(connection.id)
+            connection.on_close(self.disconnect)
+        expiration = self.expirations.pop(session, None)
+        if expiration is not None:
+            expiration.cancel()
+        if version is None:
+            version = self.version
+        instance = self.leases.get(session)
+        if instance is not None:
+            if instance.version == version and instance.process.alive:
+                # The notifications go to the last connection of the session.
+                instance.connection = connection
+                # Wait for the end of its start, if needed.
+                await asyncio.shield(instance.start)
+                return instance
+            self.release(session)
+        future = self.pending.get(session)
+        if future is None:
+            future = asyncio.ensure_future(self.__acquire(connection, version))
+            self.pending[session] = future
+            future.add_done_callback(lambda _: self.pending.pop(session, None))
+        # A call being cancelled must not cancel the lease of the others.
+        return await asyncio.shield(future)
+
+    def disconnect(self, connection: Connection) -> None:
+        """End the session of `connection`, which has closed, or schedule its end.
+
+        A session with an id keeps its instance for `lease_grace` seconds,
+        unless another connection of this session still uses it.
+        """
+        self.connections.discard(connection.id)
+        session = connection.session_id
+        instance = self.leases.get(session)
+        if instance is None:
+            return
+        if instance.connection is not connection and instance.connection is not None \
+                and instance.connection.open:
+            return
+        if session == connection.id or self.lease_grace <= 0:
+            self.release(session)
+            return
+        if session not in self.expirations:
+            self.expirations[session] = asyncio.get_event_loop().call_later(
+                self.lease_grace, self.__expire, session, instance
+            )
+
+    def release(self, session: str) -> None:
+        """Kill the instance leased to `session`, if any."""
+        expiration = self.expirations.pop(session, None)
+        if expiration is not None:
+            expiration.cancel()
+        instance = self.leases.pop(session, None)
+        if instance is None:
+            return
+        logger.info("Brayns on port %d released", instance.port)
+        self.__remove(instance)
+        self.__replenish()
+
+    async def info(self) -> dict:
+        """Health, memory and uptime of the instances."""
+        instances = list(self.instances.values())
+        pids = [instance.process.pid for instance in instances]
+        loop = asyncio.get_running_loop()
+        memory = await loop.run_in_executor(None, get_memory, pids)
+        return {
+            "min": self.min,
+            "max": self.max,
+            "instances": await asyncio.gather(*[
+                instance.info(memory.get(pid)) for (instance, pid) in zip(instances, pids)
+            ])
+        }
+
+    def __expire(self, session: str, instance: BraynsInstance) -> None:
+        self.expirations.pop(session, None)
+        if self.leases.get(session) is not instance:
+            return
+        if instance.connection is not None and instance.connection.open:
+            return
+        logger.info("Session of Brayns on port %d has not come back", instance.port)
+        self.release(session)
+
+    async def __acquire(self, connection: Connection, version: int) -> BraynsInstance:
+        session = connection.session_id
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        while True:
+            instance = self.__claim(version)
+            if instance is not None:
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise EntryPointException(
+                    POOL_FULL, f"All the {self.max} Brayns instances are in use!"
+                )
+            async with self.changed:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        instance.session = session
+        instance.connection = connection
+        self.leases[session] = instance
+        self.__replenish()
+        try:
+            await asyncio.shield(instance.start)
+        except EntryPointException:
+            if self.leases.get(session) is instance:
+                del self.leases[session]
+            raise
+        logger.info("Brayns on port %d leased", instance.port)
+        return instance
+
+    def __claim(self, version: int) -> Optional[BraynsInstance]:
+        """Find an instance for a new session, or start one.
+
+        Ready instances are preferred over the ones still starting.
+        """
+        spares = [
+            instance for instance in self.instances.values()
+            if instance.spare and instance.version == version
+        ]
+        spares.sort(key=lambda instance: instance.status != IDLE)
+        if spares:
+            return spares[0]
+        if len(self.instances) >= self.max:
+            # Make room by stopping a spare instance of another version.
+            others = [instance for instance in self.instances.values() if instance.spare]
+            if not others:
+                return None
+            self.__remove(others[0])
+        return self.__spawn(version)
+
+    def __spawn(self, version: int) -> BraynsInstance:
+        port = self.first_port
+        while port in self.instances:
+            port += 1
+        instance = BraynsInstance(self.__create_process(port, version))
+        self.instances[port] = instance
+        instance.supervisor = asyncio.ensure_future(self.__supervise(instance))
+        return instance
+
+    def __create_process(self, port: int, version: int) -> BraynsProcess:
+        return BraynsProcess(self.command, port, version, self.timeout, self.log_lines)
+
+    def __contains(self, instance: BraynsInstance) -> bool:
+        return self.instances.get(instance.port) is instance
+
+    def __remove(self, instance: BraynsInstance) -> None:
+        instance.process.kill()
+        if self.__contains(instance):
+            del self.instances[instance.port]
+            asyncio.ensure_future(self.__notify())
+
+    async def __supervise(self, instance: BraynsInstance) -> None:
+        """Restart the process of a leased instance each time it crashes.
+
+        Spare instances, and instances whose first start failed, are
+        removed instead.
+        """
+        delay = RESTART_DELAY
+        while True:
+            try:
+                await instance.start
+            except EntryPointException as ex:
+                failure = f"failed to start: {ex.message}"
+            else:
+                if not instance.ready:
+                    instance.ready = True
+                    instance.released = time.monotonic()
+                if instance.restarts > 0:
+                    logger.info("Brayns on port %d restarted", instance.port)
+                    await instance.notify(
+                        "brayns-restarted", { "port": instance.port, "restarts": instance.restarts }
+                    )
+                failure = await self.__watch(instance)
+            if not self.__contains(instance):
+                return
+            if instance.session is None or not instance.ready:
+                logger.error("Brayns on port %d removed: %s", instance.port, failure)
+                self.__remove(instance)
+                return
+            if time.monotonic() - instance.launched > STABLE_UPTIME:
+                delay = RESTART_DELAY
+            logger.error("Brayns on port %d %s, restart in %s s", instance.port, failure, delay)
+            await instance.notify("brayns-crashed", {
+                "port": instance.port,
+                "error": failure,
+                "restartDelay": delay,
+                "log": instance.process.get_log()
+            })
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, MAX_RESTART_DELAY)
+            if not self.__contains(instance):
+                return
+            instance.restart(self.__create_process(instance.port, instance.version))
+
+    async def __watch(self, instance: BraynsInstance) -> str:
+        """Wait until the process exits or uses too much memory, and tell why."""
+        process = instance.process
+        exit = asyncio.ensure_future(process.wait())
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                (done, _) = await asyncio.wait([exit], timeout=MEMORY_INTERVAL)
+                if done:
+                    return f"exited with code {exit.result()}"
+                if self.max_memory <= 0:
+                    continue
+                memory = (await loop.run_in_executor(None, get_memory, [process.pid])).get(
+                    process.pid, 0
+                )
+                if memory > self.max_memory:
+                    process.kill()
+                    await exit
+                    return (
+                        f"used {memory // (1024 * 1024)} MB,"
+                        + f" more than the limit of {self.max_memory // (1024 * 1024)} MB"
+                    )
+        finally:
+            exit.cancel()
+
+    def __replenish(self) -> None:
+        """Start processes until `min` spare ones are available."""
+        spares = sum(1 for instance in self.instances.values() if instance.spare)
+        while spares < self.min and len(self.instances) < self.max:
+            self.__spawn(self.version)
+            spares += 1
+
+    async def __notify(self) -> None:
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def __check(self) -> None:
+        """Stop the spare processes idle for too long."""
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            now = time.monotonic()
+            idle: List[BraynsInstance] = [
+                instance for instance in self.instances.values()
+                if instance.status == IDLE and now - instance.released > self.idle_timeout
+            ]
+            idle.sort(key=lambda instance: instance.released)
+            spares = sum(1 for instance in self.instances.values() if instance.spare)
+            for instance in idle[:max(0, spares - self.min)]:
+                logger.info("Brayns on port %d stopped after being idle", instance.port)
+                self.__remove(instance)
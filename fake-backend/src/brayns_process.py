@@ -0,0 +1,231 @@
+"""Launch of a Brayns process.
+
+Brayns is started with `asyncio`, so the event loop keeps serving the
+other requests while it loads its plugins. It is considered ready as
+soon as its websocket port accepts connections, or as soon as it logs
+that its server has started, whichever comes first.
+
+The last lines printed by Brayns are kept in a ring buffer, to explain
+a failed start or a crash without holding its whole log in memory.
+"""
+import asyncio
+import collections
+import logging
+import os
+import re
+import signal
+import socket
+from asyncio.subprocess import PIPE, Process
+from typing import Deque, Dict, List, Optional, Tuple
+from entrypoint import EntryPointException
+
+# Log line of Brayns telling that it accepts connections.
+RX_READY = re.compile(r"Server started")
+
+# Seconds between two attempts to connect to Brayns.
+PROBE_INTERVAL = 0.5
+
+# Seconds to wait for Brayns to accept a connection during a health check.
+HEALTH_TIMEOUT = 1.0
+
+# Default number of lines kept from the output of Brayns.
+LOG_LINES = 200
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+logger = logging.getLogger("brayns_process")
+
+# The lines printed by Brayns.
+output_logger = logging.getLogger("brayns")
+
+LAUNCH_FAILED = 1
+
+
+def get_children() -> Dict[int, List[int]]:
+    """Pids of the children of each process, read from `/proc` (Linux only)."""
+    children: Dict[int, List[int]] = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as fd:
+                stat = fd.read()
+        except OSError:
+            continue
+        # The command name, between parentheses, can contain spaces.
+        parent = int(stat[stat.rindex(")") + 2:].split()[1])
+        children.setdefault(parent, []).append(int(name))
+    return children
+
+
+def get_memory(pids: List[Optional[int]]) -> Dict[int, int]:
+    """Resident memory, in bytes, of each process and all its descendants.
+
+    The command starting Brayns is usually a script: Brayns itself is one
+    of its descendants. The processes which cannot be read in `/proc`
+    are missing from the result.
+    """
+    try:
+        children = get_children()
+    except OSError:
+        return {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    memory = {}
+    for pid in pids:
+        if pid is None:
+            continue
+        total = None
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            pending.extend(children.get(current, []))
+            try:
+                with open(f"/proc/{current}/statm", "r") as fd:
+                    total = (total or 0) + int(fd.read().split()[1]) * page_size
+            except (OSError, ValueError, IndexError):
+                continue
+        if total is not None:
+            memory[pid] = total
+    return memory
+
+
+class BraynsProcess:
+    """A Brayns process listening on a given port."""
+
+    def __init__(
+        self, command: str, port: int, version: int, timeout: float, log_lines: int = LOG_LINES
+    ):
+        """Define how to start Brayns.
+
+        Args:
+            command: script starting Brayns, called with `port` and
+                     `version` as arguments.
+            port: port on which Brayns will listen.
+            version: major version of Brayns.
+            timeout: seconds to wait for Brayns to be ready.
+            log_lines: number of lines kept from its output.
+        """
+        self.command = command
+        self.port = port
+        self.version = version
+        self.timeout = timeout
+        self.host = socket.getfqdn()
+        self.process: Optional[Process] = None
+        # Last lines of the output, as `(stream, text)`.
+        self.lines: Deque[Tuple[str, str]] = collections.deque(maxlen=max(1, log_lines))
+        self.readers: List[asyncio.Task] = []
+        self.ready: Optional[asyncio.Future] = None
+
+    async def start(self) -> None:
+        """Start Brayns and wait until it is ready.
+
+        Raise an `EntryPointException` if it exits or does not get ready in time.
+        """
+        logger.info("> %s %d %d", self.command, self.port, self.version)
+        loop = asyncio.get_running_loop()
+        self.ready = loop.create_future()
+        self.process = await asyncio.create_subprocess_exec(
+            self.command, str(self.port), str(self.version), stdout=PIPE, stderr=PIPE,
+            # Its own process group, to kill the children of the script too.
+            start_new_session=True
+        )
+        self.readers = [
+            asyncio.create_task(self.__read(self.process.stdout, STDOUT)),
+            asyncio.create_task(self.__read(self.process.stderr, STDERR))
+        ]
+        probe = asyncio.create_task(self.__probe())
+        exit = asyncio.create_task(self.process.wait())
+        try:
+            (done, _) = await asyncio.wait(
+                [self.ready, probe, exit], timeout=self.timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            probe.cancel()
+        if exit in done:
+            # Let the readers get the last lines.
+            await asyncio.gather(*self.readers)
+            raise EntryPointException(LAUNCH_FAILED, self.__get_error())
+        exit.cancel()
+        if not done:
+            self.kill()
+            raise EntryPointException(
+                LAUNCH_FAILED, f"Brayns did not start within {self.timeout} seconds!"
+            )
+
+    @property
+    def pid(self) -> Optional[int]:
+        """Id of the process, if it has been started."""
+        return None if self.process is None else self.process.pid
+
+    @property
+    def alive(self) -> bool:
+        """Has the process been started without exiting since?"""
+        return self.process is not None and self.process.returncode is None
+
+    async def is_healthy(self) -> bool:
+        """Is the process running and accepting connections?"""
+        if not self.alive:
+            return False
+        try:
+            (_, writer) = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), HEALTH_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        await writer.wait_closed()
+        return True
+
+    async def wait(self) -> int:
+        """Wait for the process to exit and return its exit code."""
+        code = await self.process.wait()
+        # Let the readers get the last lines.
+        await asyncio.gather(*self.readers)
+        return code
+
+    def get_log(self) -> List[dict]:
+        """Last lines printed by Brayns, as `{ stream, text }`, the oldest first."""
+        return [{ "stream": stream, "text": text } for (stream, text) in self.lines]
+
+    def kill(self) -> None:
+        """Kill the process and its children if it is running."""
+        if self.process is not None and self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def __get_error(self) -> str:
+        """Text of the error of a process which exited during its start."""
+        errors = [
+            text for (stream, text) in self.lines
+            if stream == STDERR and not text.startswith("Autoloading ")
+        ]
+        output = [text for (stream, text) in self.lines if stream == STDOUT]
+        error = "\n".join(errors) or f"Brayns exited with code {self.process.returncode}!"
+        return error + "\n\n" + "\n".join(output)
+
+    async def __read(self, stream: asyncio.StreamReader, name: str) -> None:
+        """Print the lines of `stream` and look for the readiness message."""
+        level = logging.WARNING if name == STDERR else logging.INFO
+        while True:
+            line = await stream.readline()
+            if not line:
+                return
+            text = line.decode("utf-8", "replace").rstrip()
+            output_logger.log(level, "%d: %s", self.port, text)
+            self.lines.append((name, text))
+            if not self.ready.done() and RX_READY.search(text):
+                self.ready.set_result(None)
+
+    async def __probe(self) -> None:
+        """Return as soon as Brayns accepts connections."""
+        while True:
+            try:
+                (_, writer) = await asyncio.open_connection(self.host, self.port)
+                writer.close()
+                await writer.wait_closed()
+                return
+            except OSError:
+                await asyncio.sleep(PROBE_INTERVAL)
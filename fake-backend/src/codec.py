@@ -0,0 +1,126 @@
+"""Encoding of JSON-RPC messages.
+
+Text frames always hold JSON. `orjson` is used when it is installed,
+otherwise we fall back to the standard `json` module.
+
+A client can also ask for the `msgpack` codec by requesting the websocket
+subprotocol of the same name. Messages are then sent as binary frames:
+
+* 4 bytes: little endian size of the header.
+* header: the JSON-RPC message, encoded with the codec of the connection.
+* chunk: optional raw data attached to the message.
+
+This is the same framing the client already uses to attach binary data
+to a JSON message.
+"""
+import json
+import struct
+from typing import Any, Dict, List, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+HEADER_SIZE = struct.Struct("<I")
+
+
+class Codec:
+    """Serialize JSON-RPC messages."""
+
+    name = ""
+    # If True, messages are sent in binary frames.
+    binary = False
+
+    def encode(self, data: Any) -> Union[str, bytes]:
+        """Serialize `data`."""
+        raise NotImplementedError()
+
+    def decode(self, payload: Union[str, bytes]) -> Any:
+        """Deserialize `payload`. Raise a `ValueError` if it is invalid."""
+        raise NotImplementedError()
+
+    def join(self, items: List[Union[str, bytes]]) -> Union[str, bytes]:
+        """Serialize an array from its already encoded `items`."""
+        return self.encode([self.decode(item) for item in items])
+
+
+class JsonCodec(Codec):
+    """JSON in text frames, with `orjson` if available."""
+
+    name = "json"
+
+    def encode(self, data: Any) -> str:
+        if orjson is not None:
+            return orjson.dumps(data).decode("utf-8")
+        return json.dumps(data, separators=(",", ":"))
+
+    def decode(self, payload: Union[str, bytes]) -> Any:
+        # orjson.JSONDecodeError inherits json.JSONDecodeError.
+        if orjson is not None:
+            return orjson.loads(payload)
+        return json.loads(payload)
+
+    def join(self, items: List[str]) -> str:
+        return "[" + ",".join(items) + "]"
+
+
+class MsgpackCodec(Codec):
+    """MessagePack in binary frames."""
+
+    name = "msgpack"
+    binary = True
+
+    def encode(self, data: Any) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, payload: Union[str, bytes]) -> Any:
+        try:
+            return msgpack.unpackb(payload, raw=False)
+        except Exception as ex:  # pylint: disable=broad-except
+            # msgpack raises different kinds of exceptions for invalid data.
+            raise ValueError(f"Invalid MessagePack data: {ex}") from ex
+
+    def join(self, items: List[bytes]) -> bytes:
+        packer = msgpack.Packer(use_bin_type=True)
+        return packer.pack_array_header(len(items)) + b"".join(items)
+
+
+JSON = JsonCodec()
+CODECS: Dict[str, Codec] = {JSON.name: JSON}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+
+def get_subprotocols() -> List[str]:
+    """Names of the websocket subprotocols a client can ask for."""
+    return [name for name in CODECS if name != JSON.name]
+
+
+def get_codec(subprotocol: str) -> Codec:
+    """Return the codec negotiated through the websocket `subprotocol`."""
+    return CODECS.get(subprotocol, JSON)
+
+
+def encode_frame(header: bytes, chunk: bytes = b"") -> bytes:
+    """Build a binary frame from an encoded `header` and an optional `chunk`."""
+    return HEADER_SIZE.pack(len(header)) + header + chunk
+
+
+def decode_frame(frame: bytes) -> Tuple[bytes, bytes]:
+    """Split a binary frame into its header and its chunk."""
+    if len(frame) < HEADER_SIZE.size:
+        raise ValueError(f"Binary frame is too small ({len(frame)} bytes)!")
+    (size,) = HEADER_SIZE.unpack_from(frame)
+    start = HEADER_SIZE.size
+    end = start + size
+    if end > len(frame):
+        raise ValueError(
+            f"Binary frame header announces {size} bytes, but only {len(frame) - start} are available!"
+        )
+    return (frame[start:end], frame[end:])
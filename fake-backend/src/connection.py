@@ -0,0 +1,147 @@
+"""A client connected to the websocket server."""
+import asyncio
+import logging
+import re
+import urllib.parse
+import uuid
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional, Union
+import websockets
+from codec import Codec, encode_frame, get_codec
+
+# Maximum number of messages waiting to be sent to a client.
+SEND_QUEUE_SIZE = 256
+
+# Session ids chosen by the clients must be hard to guess.
+RX_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{16,128}$")
+
+logger = logging.getLogger("connection")
+
+
+class Connection:
+    """One connected client.
+
+    Each connection has its own send queue, consumed by a dedicated
+    writer task, so a slow client never delays the others.
+    It also has its own codec, which has been negotiated through the
+    websocket subprotocol, and its own session.
+
+    A client connecting with `?session=ID` in the URL (ID being 16 to
+    128 letters, digits, "-" or "_") gets the session of this ID, which
+    survives disconnections. Otherwise, the session lasts as long as
+    the connection.
+    """
+
+    def __init__(self, websocket, path: str):
+        """Start the writer task of this connection.
+
+        Args:
+            websocket (WebSocketServerProtocol): the client's socket.
+            path: the path of the URL the client connected to.
+        """
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.path = path
+        self.session_id = get_session_id(path) or self.id
+        self.codec: Codec = get_codec(websocket.subprotocol)
+        self.queue: asyncio.Queue = asyncio.Queue(SEND_QUEUE_SIZE)
+        self.writer = asyncio.create_task(self.__write())
+        self.close_callbacks: List[Callable[["Connection"], None]] = []
+
+    @property
+    def open(self) -> bool:
+        """Is the client still connected?"""
+        return self.websocket.open
+
+    async def send(self, message: Union[str, bytes]) -> None:
+        """Queue a message for this client.
+
+        Wait if too many messages are already waiting to be sent.
+        Messages for a closed connection are dropped.
+        """
+        if self.writer.done():
+            return
+        await self.__put(message, None)
+
+    async def notify(self, method: str, params: Any) -> None:
+        """Send a JSON-RPC notification (a message without id) to this client."""
+        message = self.codec.encode({ "jsonrpc": "2.0", "method": method, "params": params })
+        if self.codec.binary:
+            message = encode_frame(message)
+        await self.send(message)
+
+    async def send_frame(self, header: Any, chunk: bytes) -> None:
+        """Send `header` and `chunk` in a binary frame and wait until it is written.
+
+        The header is encoded with the codec of this connection.
+        Waiting lets a producer of big data hold only one chunk in memory.
+        """
+        if self.writer.done():
+            return
+        header = self.codec.encode(header)
+        if isinstance(header, str):
+            header = header.encode("utf-8")
+        written = asyncio.get_running_loop().create_future()
+        await self.__put(encode_frame(header, chunk), written)
+        await asyncio.wait({written, self.writer}, return_when=asyncio.FIRST_COMPLETED)
+        if not written.done():
+            # The connection was closed while the frame was being written.
+            written.cancel()
+        await written
+
+    def on_close(self, callback: Callable[["Connection"], None]) -> None:
+        """Call `callback(connection)` once the client has disconnected."""
+        self.close_callbacks.append(callback)
+
+    def close(self) -> None:
+        """Stop sending messages to this client and release its resources."""
+        self.writer.cancel()
+        for callback in self.close_callbacks:
+            try:
+                callback(self)
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.error("Cleanup of connection %s failed: %s", self.id, ex)
+        self.close_callbacks.clear()
+
+    async def __write(self):
+        written = None
+        try:
+            while True:
+                (message, written) = await self.queue.get()
+                await self.websocket.send(message)
+                if written is not None:
+                    written.set_result(None)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            # Don't let any producer wait forever for a closed connection.
+            if written is not None and not written.done():
+                written.cancel()
+            self.__drop_queued()
+
+    async def __put(self, message: Union[str, bytes], written: Optional[asyncio.Future]):
+        await self.queue.put((message, written))
+        if self.writer.done():
+            # The connection was closed while we were waiting for room in
+            # the queue: nobody will send this message.
+            self.__drop_queued()
+
+    def __drop_queued(self):
+        while not self.queue.empty():
+            (_message, written) = self.queue.get_nowait()
+            if written is not None and not written.done():
+                written.cancel()
+
+
+def get_session_id(path: str) -> Optional[str]:
+    """Session id given in the query string of the URL, if any."""
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+    session_ids = query.get("session", [])
+    if len(session_ids) != 1 or not RX_SESSION_ID.match(session_ids[0]):
+        return None
+    return session_ids[0]
+
+
+# The connection of the client whose request is being processed.
+# Each request runs in its own task, with its own copy of this variable.
+current_connection: ContextVar[Connection] = ContextVar("current_connection")
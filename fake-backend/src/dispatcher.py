@@ -0,0 +1,112 @@
+"""Bounded dispatch of entrypoint calls.
+
+The server used to start one task per incoming message, without any limit.
+The dispatcher queues the calls instead, and runs the blocking work of the
+entrypoints in thread/process pools, according to their `kind`.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Awaitable, Dict, List, Optional, Set, TypedDict
+from entrypoint import CPU_BOUND, IO_BOUND, EntryPoint
+
+
+class DispatcherOptions(TypedDict):
+    # Number of threads for IO-bound entrypoints.
+    io_workers: int
+    # Number of processes for CPU-bound entrypoints.
+    cpu_workers: int
+    # Maximum number of calls waiting or running at the same time.
+    max_pending: int
+    # Maximum number of simultaneous calls, per entrypoint name.
+    concurrency: Dict[str, int]
+
+
+class Dispatcher:
+    """Run entrypoint calls with bounded concurrency.
+
+    * At most `max_pending` calls can be waiting or running. When this limit
+      is reached, `submit()` waits for a slot: the server stops reading from
+      the websocket and the client gets backpressure.
+    * Each entrypoint runs at most `concurrency` calls at the same time.
+      The limit comes from the options, then from `entrypoint.concurrency`,
+      and defaults to the size of the pool matching the entrypoint's kind
+      (pure-async entrypoints are only bounded by `max_pending`).
+    * IO-bound entrypoints offload their blocking work to a thread pool,
+      and CPU-bound ones to a process pool.
+    """
+
+    def __init__(self, options: DispatcherOptions, entrypoints: List[EntryPoint]):
+        """Create the pools and bind them to the entrypoints.
+
+        Args:
+            options: pools sizes and concurrency limits.
+            entrypoints: all the entrypoints the calls can be dispatched to.
+        """
+        self.io_pool = ThreadPoolExecutor(
+            max_workers=options["io_workers"], thread_name_prefix="io-worker"
+        )
+        self.cpu_pool: Optional[ProcessPoolExecutor] = None
+        if any(entrypoint.kind == CPU_BOUND for entrypoint in entrypoints):
+            # Forked workers would inherit the listening socket and keep
+            # the port busy if the backend is killed.
+            self.cpu_pool = ProcessPoolExecutor(
+                max_workers=options["cpu_workers"],
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        self.pending = asyncio.Semaphore(options["max_pending"])
+        self.limits: Dict[str, asyncio.Semaphore] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        concurrency = options["concurrency"]
+        for entrypoint in entrypoints:
+            entrypoint.executor = self.__get_executor(entrypoint.kind)
+            limit = concurrency.get(entrypoint.name, entrypoint.concurrency)
+            if limit is None:
+                limit = self.__get_default_limit(entrypoint.kind, options)
+            if limit is not None:
+                self.limits[entrypoint.name] = asyncio.Semaphore(limit)
+
+    async def submit(self, entrypoint: EntryPoint, call: Awaitable) -> None:
+        """Schedule `call` (a call of `entrypoint`) and return immediately.
+
+        If too many calls are already pending, wait until one of them is done.
+        """
+        await self.pending.acquire()
+        task = asyncio.create_task(self.__run(entrypoint, call))
+        # Keep a reference to prevent the task from being garbage collected.
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def shutdown(self) -> None:
+        """Cancel pending calls and stop the pools."""
+        for task in self.tasks:
+            task.cancel()
+        self.io_pool.shutdown(wait=False)
+        if self.cpu_pool is not None:
+            self.cpu_pool.shutdown(wait=False)
+
+    async def __run(self, entrypoint: EntryPoint, call: Awaitable) -> None:
+        try:
+            limit = self.limits.get(entrypoint.name)
+            if limit is None:
+                await call
+            else:
+                async with limit:
+                    await call
+        finally:
+            self.pending.release()
+
+    def __get_executor(self, kind: str) -> Optional[Executor]:
+        if kind == IO_BOUND:
+            return self.io_pool
+        if kind == CPU_BOUND:
+            return self.cpu_pool
+        return None
+
+    @staticmethod
+    def __get_default_limit(kind: str, options: DispatcherOptions) -> Optional[int]:
+        if kind == IO_BOUND:
+            return options["io_workers"]
+        if kind == CPU_BOUND:
+            return options["cpu_workers"]
+        return None
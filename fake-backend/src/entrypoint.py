@@ -1,20 +1,55 @@
 """EntryPoint abstract class and related exception."""
 from abc import abstractmethod
-from typing import Any, Awaitable, Callable, List
-import traceback
+from concurrent.futures import Executor
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, List, NamedTuple, Optional
+import asyncio
+import functools
+import logging
 import os
+from connection import Connection, current_connection
+from metrics import current_call
 
 UNKNOWN_ERROR = -9
 PARAMS_ERROR = -8
 OUT_OF_SANDBOX = -7
 
+# Kinds of work an entrypoint can do.
+# They tell the dispatcher in which pool the blocking parts must run.
+ASYNC = "async"
+IO_BOUND = "io"
+CPU_BOUND = "cpu"
+
+
+class Request(NamedTuple):
+    """The request being executed."""
+
+    query_id: str
+    # Binary data attached to the request (see `codec.decode_frame()`).
+    chunk: bytes
+
+
+current_request: ContextVar[Request] = ContextVar("current_request")
+
+logger = logging.getLogger("entrypoint")
+
 class EntryPoint:
     """Abstract class to define entry points.
 
     To create a new entry point, you should inherit this abstract class
     and implement the `name` property and the `exec` method.
+
+    Set `kind` to `IO_BOUND` or `CPU_BOUND` if `exec` has blocking work
+    to do, and run this work through `offload()`. `concurrency` is the
+    maximum number of simultaneous calls of this entrypoint (`None` means
+    the dispatcher's default for this kind).
     """
 
+    kind = ASYNC
+    concurrency: Optional[int] = None
+    # Set by the dispatcher: the pool in which `offload()` runs its work.
+    executor: Optional[Executor] = None
+
     @abstractmethod
     async def exec(self, params: Any) -> Awaitable:
         """Asynchronous execution of this entry point.
@@ -28,6 +63,40 @@ class EntryPoint:
     def name(self) -> str:
         """Name of this entrypoint."""
 
+    @property
+    def connection(self) -> Connection:
+        """Connection of the client whose request is being executed."""
+        return current_connection.get()
+
+    @property
+    def query_id(self) -> str:
+        """Id of the request being executed."""
+        return current_request.get().query_id
+
+    @property
+    def chunk(self) -> bytes:
+        """Binary data attached to the request being executed (can be empty)."""
+        return current_request.get().chunk
+
+    async def send_chunk(self, params: dict, chunk: bytes) -> None:
+        """Send a piece of the result before the response of the request being executed.
+
+        The client receives a binary frame with a "chunk" notification as
+        header, followed by `chunk`. The notification's params are
+        `params` plus the `id` of the request.
+        Wait until the frame is written, so the memory used by a stream
+        does not depend on its total size.
+        """
+        header = {
+            "jsonrpc": "2.0",
+            "method": "chunk",
+            "params": { **params, "id": self.query_id }
+        }
+        call = current_call.get()
+        if call is not None:
+            call.response_size += len(chunk)
+        await self.connection.send_frame(header, chunk)
+
     async def initialize(self):
         """Override this method if the entrypoint needs some initialization."""
         pass
@@ -38,21 +107,34 @@ class EntryPoint:
         params: Any,
         success: Callable[[str, Any], Awaitable],
         failure: Callable[[str, int, str], Awaitable],
+        chunk: bytes = b"",
     ):
         """Send back the result of this entry point given some params."""
+        # Each call runs in its own task: this does not leak to other calls.
+        current_request.set(Request(query_id, chunk))
         try:
             result = await self.exec(params)
             await success(query_id, result)
         except EntryPointException as ex:
             await failure(query_id, ex.code, ex.message)
         except Exception as ex:  # pylint: disable=broad-except
-            print()
-            print("#" * 80)
-            traceback.print_exc()
-            print("=" * 80)
-            print()
+            logger.exception("Call of %s failed", self.name)
             await failure(query_id, UNKNOWN_ERROR, str(ex))
 
+    async def offload(self, func: Callable, *args) -> Any:
+        """Run the blocking `func(*args)` without freezing the event loop.
+
+        The function is executed in the thread pool for IO-bound
+        entrypoints and in the process pool for CPU-bound ones.
+        In the latter case, `func`, its arguments and its result must be
+        picklable: use module level functions.
+        Raise `EntryPointException` from `func` to return an error.
+        """
+        if self.executor is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
     def fatal(self, code: int, message: str):
         """Raise an exception than will be returned back to the client."""
         raise EntryPointException(code, message)
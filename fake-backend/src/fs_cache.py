@@ -0,0 +1,314 @@
+"""Cache of directory listings and stat results.
+
+Metadata operations are expensive on parallel filesystems, and users of
+the file browser keep visiting the same folders.
+
+* A cached listing is checked against the modification time of its folder
+  before being used: one `stat` instead of a whole `scandir`.
+  If `inotify_simple` is installed, the cached folders are also watched,
+  and a listing of a watched folder is used without any syscall.
+* A cached stat result is checked the same way, against the modification
+  time of the folder containing it, which changes when a file is created,
+  deleted or renamed in it. The stat of a watched folder's file is used
+  without any check: inotify also reports the changes of the files.
+  Without inotify, the size and mtime of a file modified in place can be
+  outdated until the stat expires (see `ttl`). Missing paths are never
+  cached.
+
+The cache is used from the IO threads and from the event loop.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+# A folder modified less than this number of seconds before being listed
+# can still change without its mtime changing (mtime granularity).
+MTIME_GRANULARITY = 1.0
+
+# Entry of a listing: (name, is_dir).
+ListingEntry = Tuple[str, bool]
+
+logger = logging.getLogger("fs_cache")
+
+
+class CacheOptions(TypedDict):
+    # Maximum number of cached directory listings.
+    fs_cache_dirs: int
+    # Maximum number of cached stat results.
+    fs_cache_stats: int
+    # Seconds before a cached item expires.
+    fs_cache_ttl: float
+
+
+class LruCache:
+    """Thread-safe LRU cache whose items expire after `ttl` seconds."""
+
+    def __init__(
+        self,
+        capacity: int,
+        ttl: float,
+        on_evict: Optional[Callable[[Any], None]] = None
+    ):
+        """Set the limits of the cache.
+
+        Args:
+            capacity: maximum number of items.
+            ttl: number of seconds an item stays valid.
+            on_evict: called with the key of every item leaving the cache.
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.items: "OrderedDict[Any, Tuple[Any, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Any, validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Return the value of `key`, or `None` if it is missing or not valid anymore.
+
+        `validate` is called without holding the lock, so it can do IO.
+        """
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and item[1] < time.monotonic():
+                self.__remove(key)
+                item = None
+            if item is not None:
+                self.items.move_to_end(key)
+        if item is not None and validate is not None and not validate(item[0]):
+            self.invalidate(key)
+            item = None
+        with self.lock:
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Any, value: Any) -> None:
+        """Add or replace an item, evicting the least recently used ones if needed."""
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.ttl)
+            self.items.move_to_end(key)
+            while len(self.items) > self.capacity:
+                self.__remove(next(iter(self.items)))
+
+    def invalidate(self, key: Any) -> None:
+        """Remove `key` from the cache, if present."""
+        with self.lock:
+            if key in self.items:
+                self.invalidations += 1
+                self.__remove(key)
+
+    def clear(self) -> None:
+        """Remove all the items."""
+        with self.lock:
+            for key in list(self.items):
+                self.__remove(key)
+
+    def info(self) -> dict:
+        """Counters of the cache."""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.items),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRatio": self.hits / total if total > 0 else 0,
+                "invalidations": self.invalidations
+            }
+
+    def __remove(self, key: Any) -> None:
+        del self.items[key]
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+
+class FsCache:
+    """Directory listings and stat results, keyed by absolute path."""
+
+    def __init__(self, options: CacheOptions):
+        """Create empty caches."""
+        ttl = options["fs_cache_ttl"]
+        self.listings = LruCache(options["fs_cache_dirs"], ttl, self.__unwatch)
+        self.stats = LruCache(options["fs_cache_stats"], ttl)
+        self.lock = threading.Lock()
+        # Incremented each time a folder is invalidated. A listing is only
+        # stored if no invalidation occured while it was computed.
+        self.generations: Dict[str, int] = {}
+        self.inotify = None
+        self.watches: Dict[str, int] = {}
+        self.watched_paths: Dict[int, str] = {}
+
+    def start(self) -> None:
+        """Watch the cached folders with inotify, if available.
+
+        Must be called from the event loop.
+        """
+        if inotify_simple is None or self.inotify is not None:
+            return
+        try:
+            self.inotify = inotify_simple.INotify()
+        except OSError as ex:
+            logger.warning("inotify is not available: %s", ex)
+            return
+        asyncio.get_running_loop().add_reader(self.inotify.fileno(), self.__read_events)
+
+    def list_dir(self, path: str) -> List[ListingEntry]:
+        """Return the `(name, is_dir)` entries of the folder `path`."""
+        cached = self.listings.get(path, lambda cached: self.__is_listing_valid(path, cached))
+        if cached is not None:
+            return cached[1]
+        generation = self.__get_generation(path)
+        watched = self.__watch(path)
+        started = time.time()
+        mtime = os.stat(path).st_mtime_ns
+        with os.scandir(path) as items:
+            entries = [(entry.name, entry.is_dir()) for entry in items]
+        recent = started - mtime / 1e9 < MTIME_GRANULARITY
+        if (watched or not recent) and self.__get_generation(path) == generation:
+            self.listings.put(path, (mtime, entries))
+        elif watched:
+            self.__unwatch(path)
+        return entries
+
+    def stat(self, path: str) -> Optional[os.stat_result]:
+        """Return the stat of `path` (following symlinks), or `None` if it does not exist.
+
+        The stat of a broken symlink is the one of the link itself.
+        """
+        cached = self.stats.get(path, lambda cached: self.__is_stat_valid(path, cached))
+        if cached is not None:
+            return cached[1]
+        folder = os.path.dirname(path)
+        started = time.time()
+        try:
+            folder_mtime: Optional[int] = os.stat(folder).st_mtime_ns
+        except OSError:
+            folder_mtime = None
+        try:
+            result = os.stat(path)
+        except OSError:
+            try:
+                result = os.lstat(path)
+            except OSError:
+                return None
+        if folder_mtime is not None and started - folder_mtime / 1e9 >= MTIME_GRANULARITY:
+            self.stats.put(path, (folder_mtime, result))
+        return result
+
+    def invalidate(self, path: str) -> None:
+        """Forget what we know about `path` and about the listing of its folder.
+
+        Call this after writing `path`.
+        """
+        self.stats.invalidate(path)
+        self.__invalidate_dir(os.path.dirname(path))
+
+    def info(self) -> dict:
+        """Counters of the caches."""
+        return {
+            "listings": self.listings.info(),
+            "stats": self.stats.info(),
+            "inotify": self.inotify is not None,
+            "watches": len(self.watches)
+        }
+
+    def __invalidate_dir(self, path: str) -> None:
+        with self.lock:
+            self.generations[path] = self.generations.get(path, 0) + 1
+        self.listings.invalidate(path)
+
+    def __get_generation(self, path: str) -> int:
+        with self.lock:
+            return self.generations.get(path, 0)
+
+    def __is_listing_valid(self, path: str, cached: Tuple[int, List[ListingEntry]]) -> bool:
+        with self.lock:
+            if path in self.watches:
+                # Any change would have invalidated this listing.
+                return True
+        try:
+            return os.stat(path).st_mtime_ns == cached[0]
+        except OSError:
+            return False
+
+    def __is_stat_valid(self, path: str, cached: Tuple[int, os.stat_result]) -> bool:
+        folder = os.path.dirname(path)
+        with self.lock:
+            if folder in self.watches:
+                # Any change would have invalidated this stat.
+                return True
+        try:
+            return os.stat(folder).st_mtime_ns == cached[0]
+        except OSError:
+            return False
+
+    def __watch(self, path: str) -> bool:
+        """Try to watch `path` and return True on success."""
+        if self.inotify is None:
+            return False
+        with self.lock:
+            if path in self.watches:
+                return True
+        flags = inotify_simple.flags
+        mask = (
+            flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO
+            | flags.MODIFY | flags.ATTRIB | flags.CLOSE_WRITE
+            | flags.DELETE_SELF | flags.MOVE_SELF | flags.ONLYDIR
+        )
+        try:
+            descriptor = self.inotify.add_watch(path, mask)
+        except OSError:
+            # Probably too many watches: the mtime check will be used.
+            return False
+        with self.lock:
+            self.watches[path] = descriptor
+            self.watched_paths[descriptor] = path
+        return True
+
+    def __unwatch(self, path: str) -> None:
+        with self.lock:
+            descriptor = self.watches.pop(path, None)
+            if descriptor is None:
+                return
+            self.watched_paths.pop(descriptor, None)
+        try:
+            self.inotify.rm_watch(descriptor)
+        except OSError:
+            # The folder does not exist anymore.
+            pass
+
+    def __read_events(self) -> None:
+        flags = inotify_simple.flags
+        for event in self.inotify.read(timeout=0):
+            if event.mask & flags.Q_OVERFLOW:
+                # Some events have been lost.
+                self.listings.clear()
+                self.stats.clear()
+                continue
+            with self.lock:
+                folder = self.watched_paths.get(event.wd)
+                if event.mask & flags.IGNORED:
+                    self.watched_paths.pop(event.wd, None)
+                    if folder is not None and self.watches.get(folder) == event.wd:
+                        del self.watches[folder]
+            if folder is None:
+                continue
+            if event.name:
+                self.stats.invalidate(os.path.join(folder, event.name))
+            else:
+                self.stats.invalidate(folder)
+            self.__invalidate_dir(folder)
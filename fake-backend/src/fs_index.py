@@ -0,0 +1,312 @@
+"""In-memory index of all the paths of the sandbox, for `fs-search`.
+
+The index is a tree stored in flat arrays: each node only knows its name
+and its parent, so the components of the paths are stored only once.
+All the names are concatenated in a single string, separated by "\\0",
+which lets us search them with `str.find()` or a regular expression
+instead of looping on millions of Python objects.
+
+The tree is built by a background task which walks the sandbox with
+parallel `os.scandir` workers, and refreshed periodically. A refresh only
+lists again the folders whose mtime has changed: the children of the
+other ones are copied from the previous index.
+"""
+import asyncio
+import io
+import logging
+import os
+import re
+import time
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Deque, Iterator, List, Optional, Tuple, TypedDict
+
+SEPARATOR = "\0"
+
+# A folder modified less than this number of seconds before being listed
+# can still change without its mtime changing (mtime granularity).
+MTIME_GRANULARITY = 1.0
+
+logger = logging.getLogger("fs_index")
+
+
+class IndexOptions(TypedDict):
+    # Number of threads listing folders in parallel.
+    index_workers: int
+    # Seconds between two refreshes (0 disables the index).
+    index_interval: float
+    # Maximum number of paths in the index.
+    index_max_paths: int
+
+
+class Snapshot:
+    """Immutable index of a tree of paths.
+
+    Node 0 is the root and its name is the root's absolute path.
+    """
+
+    def __init__(self, root: str):
+        """Create an index with only the root folder."""
+        self.root = root
+        self.blob = ""
+        # Position in `blob` of the name of each node.
+        self.offsets = array("q")
+        self.parents = array("i")
+        # Index of the node in the folders arrays, or -1 for files.
+        self.dir_index = array("i")
+        # For folders only.
+        self.child_start = array("i")
+        self.child_count = array("i")
+        self.mtimes = array("q")
+        self.truncated = False
+        self.built_at = 0.0
+        self.duration = 0.0
+
+    @property
+    def count(self) -> int:
+        """Number of indexed paths."""
+        return len(self.parents)
+
+    def name(self, node: int) -> str:
+        """Name of a node."""
+        start = self.offsets[node]
+        return self.blob[start:self.blob.index(SEPARATOR, start)]
+
+    def path(self, node: int) -> str:
+        """Absolute path of a node."""
+        names: List[str] = []
+        while node > 0:
+            names.append(self.name(node))
+            node = self.parents[node]
+        names.append(self.root)
+        return os.path.join(*reversed(names))
+
+    def is_dir(self, node: int) -> bool:
+        """Is this node a folder?"""
+        return self.dir_index[node] > -1
+
+    def children(self, node: int) -> range:
+        """Nodes contained in a folder."""
+        index = self.dir_index[node]
+        if index < 0:
+            return range(0)
+        start = self.child_start[index]
+        return range(start, start + self.child_count[index])
+
+    def find(self, path: str) -> Optional[int]:
+        """Return the node of an absolute path, or `None` if it is not indexed."""
+        relative = os.path.relpath(path, self.root)
+        if relative.startswith(".."):
+            return None
+        node = 0
+        if relative == ".":
+            return node
+        for name in relative.split(os.sep):
+            node = next((child for child in self.children(node) if self.name(child) == name), None)
+            if node is None:
+                return None
+        return node
+
+    def is_inside(self, node: int, folder: int) -> bool:
+        """Is `node` somewhere below `folder`?"""
+        while node > folder:
+            node = self.parents[node]
+        return node == folder
+
+    def search(self, pattern: "re.Pattern[str]") -> Iterator[int]:
+        """Yield the nodes whose name contains a match of `pattern`."""
+        # Name of node 0 (the root) is not searchable.
+        position = self.offsets[1] if self.count > 1 else len(self.blob)
+        while True:
+            match = pattern.search(self.blob, position)
+            if match is None:
+                return
+            node = bisect_right(self.offsets, match.start()) - 1
+            yield node
+            # Only one match per node.
+            position = self.offsets[node + 1] if node + 1 < self.count else len(self.blob)
+
+    def find_substring(self, text: str) -> Iterator[int]:
+        """Yield the nodes whose name contains `text` (case sensitive)."""
+        position = self.offsets[1] if self.count > 1 else len(self.blob)
+        find = self.blob.find
+        while True:
+            start = find(text, position)
+            if start < 0:
+                return
+            node = bisect_right(self.offsets, start) - 1
+            yield node
+            position = self.offsets[node + 1] if node + 1 < self.count else len(self.blob)
+
+
+def glob_to_regex(glob: str, case_sensitive: bool) -> "re.Pattern[str]":
+    """Compile a glob pattern into a regex matching whole names in `Snapshot.blob`.
+
+    Supported: `*`, `?` and `[...]` (with `!` or `^` for negation).
+    """
+    parts: List[str] = []
+    index = 0
+    while index < len(glob):
+        char = glob[index]
+        index += 1
+        if char == "*":
+            parts.append("[^\\0]*")
+        elif char == "?":
+            parts.append("[^\\0]")
+        elif char == "[":
+            end = glob.find("]", index + 1)
+            if end < 0:
+                parts.append("\\[")
+                continue
+            content = glob[index:end].replace("\\", "\\\\")
+            if content[0] in "!^":
+                # Like `*` and `?`, never match the separator of the names.
+                content = "^\\0" + content[1:]
+            parts.append(f"[{content}]")
+            index = end + 1
+        else:
+            parts.append(re.escape(char))
+    flags = 0 if case_sensitive else re.IGNORECASE
+    return re.compile(f"(?<=\\0){''.join(parts)}(?=\\0)", flags)
+
+
+def scan(path: str, old_mtime: Optional[int]) -> Tuple[int, Optional[List[Tuple[str, bool]]]]:
+    """List a folder, unless its mtime is still `old_mtime`.
+
+    Return `(mtime, entries)`. `entries` is `None` if the folder did not change.
+    A recorded mtime of 0 forces the next refresh to list the folder again.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return (0, [])
+    if old_mtime is not None and mtime == old_mtime:
+        return (mtime, None)
+    if time.time() - mtime / 1e9 < MTIME_GRANULARITY:
+        mtime = 0
+    try:
+        with os.scandir(path) as entries:
+            return (mtime, [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in entries])
+    except OSError:
+        return (mtime, [])
+
+
+def build(root: str, previous: Optional[Snapshot], workers: int, max_paths: int) -> Snapshot:
+    """Walk `root` with parallel workers and return its index.
+
+    Folders which did not change since `previous` are not listed again.
+    """
+    started = time.time()
+    snapshot = Snapshot(root)
+    blob = io.StringIO()
+    blob.write(SEPARATOR)
+    length = 1
+
+    def add_node(name: str, parent: int, is_dir: bool) -> int:
+        nonlocal length
+        node = len(snapshot.parents)
+        snapshot.offsets.append(length)
+        blob.write(name)
+        blob.write(SEPARATOR)
+        length += len(name) + 1
+        snapshot.parents.append(parent)
+        if is_dir:
+            snapshot.dir_index.append(len(snapshot.child_start))
+            snapshot.child_start.append(0)
+            snapshot.child_count.append(0)
+            snapshot.mtimes.append(0)
+        else:
+            snapshot.dir_index.append(-1)
+        return node
+
+    add_node(root, -1, True)
+    # Folders to list: (node, path, node in the previous index or -1).
+    pending: Deque[Tuple[int, str, int]] = deque([(0, root, 0 if previous is not None else -1)])
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="indexer") as pool:
+        running = {}
+        while pending or running:
+            while pending and len(running) < workers * 2:
+                (node, path, old) = pending.popleft()
+                old_mtime = None
+                if old > -1:
+                    old_mtime = previous.mtimes[previous.dir_index[old]]
+                running[pool.submit(scan, path, old_mtime)] = (node, path, old)
+            (done, _) = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                (node, path, old) = running.pop(future)
+                (mtime, entries) = future.result()
+                if entries is None:
+                    # Unchanged folder: reuse the previous listing.
+                    children = [
+                        (previous.name(child), previous.is_dir(child), child)
+                        for child in previous.children(old)
+                    ]
+                else:
+                    old_dirs = {}
+                    if old > -1:
+                        old_dirs = {
+                            previous.name(child): child
+                            for child in previous.children(old)
+                            if previous.is_dir(child)
+                        }
+                    children = [(name, is_dir, old_dirs.get(name, -1)) for (name, is_dir) in entries]
+                index = snapshot.dir_index[node]
+                snapshot.child_start[index] = len(snapshot.parents)
+                snapshot.mtimes[index] = mtime
+                for (name, is_dir, old_child) in children:
+                    if len(snapshot.parents) >= max_paths:
+                        snapshot.truncated = True
+                        # The listing is incomplete: force a new one next time.
+                        snapshot.mtimes[index] = 0
+                        break
+                    child = add_node(name, node, is_dir)
+                    if is_dir:
+                        pending.append((child, os.path.join(path, name), old_child))
+                snapshot.child_count[index] = len(snapshot.parents) - snapshot.child_start[index]
+    snapshot.blob = blob.getvalue()
+    snapshot.built_at = time.time()
+    snapshot.duration = snapshot.built_at - started
+    return snapshot
+
+
+class FsIndex:
+    """Keep an up-to-date index of the sandbox."""
+
+    def __init__(self, root: str, options: IndexOptions):
+        """Set the root folder to index."""
+        self.root = os.path.abspath(root)
+        self.workers = options["index_workers"]
+        self.interval = options["index_interval"]
+        self.max_paths = options["index_max_paths"]
+        self.snapshot: Optional[Snapshot] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Is the indexer running?"""
+        return self.interval > 0
+
+    def start(self) -> None:
+        """Start the background indexer. Must be called from the event loop."""
+        if not self.enabled or self.task is not None:
+            return
+        self.task = asyncio.create_task(self.__run())
+
+    async def __run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                snapshot = await loop.run_in_executor(
+                    None, build, self.root, self.snapshot, self.workers, self.max_paths
+                )
+                # Readers keep the snapshot they started with.
+                self.snapshot = snapshot
+                logger.info(
+                    "Indexed %d paths in %.1f s%s",
+                    snapshot.count, snapshot.duration, " (truncated)" if snapshot.truncated else ""
+                )
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.error("Indexing of %s failed: %s", self.root, ex)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,166 @@
+"""JSON Patch (RFC 6902) applied to decoded JSON documents.
+
+A patch is a list of operations, applied in order. A failing operation
+(including a failing "test") leaves the original document untouched,
+because the operations are applied to a copy.
+"""
+import copy
+from typing import Any, List, Tuple, Union
+from entrypoint import EntryPointException
+
+INVALID_PATCH = 2
+
+Container = Union[dict, list]
+
+
+def apply_patch(document: Any, patch: Any) -> Any:
+    """Return a patched copy of `document`."""
+    if not isinstance(patch, list):
+        raise EntryPointException(INVALID_PATCH, "A JSON patch must be an array of operations!")
+    document = copy.deepcopy(document)
+    for (index, operation) in enumerate(patch):
+        try:
+            document = apply_operation(document, operation)
+        except EntryPointException as ex:
+            raise EntryPointException(
+                INVALID_PATCH, f"Operation #{index} of the patch failed: {ex.message}"
+            )
+    return document
+
+
+def apply_operation(document: Any, operation: Any) -> Any:
+    """Apply one operation to `document` (which can be modified) and return the result."""
+    if not isinstance(operation, dict):
+        fail("an operation must be an object")
+    op = operation.get("op")
+    path = get_string(operation, "path")
+    if op == "add":
+        return add(document, path, copy.deepcopy(get_value(operation)))
+    if op == "remove":
+        (document, _) = remove(document, path)
+        return document
+    if op == "replace":
+        (document, _) = remove(document, path)
+        return add(document, path, copy.deepcopy(get_value(operation)))
+    if op == "move":
+        source = get_string(operation, "from")
+        if path != source and path.startswith(source + "/"):
+            fail(f"cannot move \"{source}\" into one of its children")
+        (document, value) = remove(document, source)
+        return add(document, path, value)
+    if op == "copy":
+        value = copy.deepcopy(get(document, get_string(operation, "from")))
+        return add(document, path, value)
+    if op == "test":
+        if not equal(get(document, path), get_value(operation)):
+            fail(f"value at \"{path}\" is not the expected one")
+        return document
+    fail(f"unknown operation \"{op}\"")
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Tokens of a JSON pointer (RFC 6901)."""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        fail(f"invalid JSON pointer \"{pointer}\"")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def get(document: Any, pointer: str) -> Any:
+    """Value at `pointer` in `document`."""
+    value = document
+    for token in parse_pointer(pointer):
+        (value, key) = resolve(value, token, pointer)
+        if not contains(value, key):
+            fail(f"path \"{pointer}\" does not exist")
+        value = value[key]
+    return value
+
+
+def add(document: Any, pointer: str, value: Any) -> Any:
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        return value
+    (parent, token) = locate(document, pointer)
+    if isinstance(parent, list):
+        if token == "-":
+            parent.append(value)
+            return document
+        (_, index) = resolve(parent, token, pointer)
+        if index > len(parent):
+            fail(f"index of \"{pointer}\" is out of range")
+        parent.insert(index, value)
+    else:
+        parent[token] = value
+    return document
+
+
+def remove(document: Any, pointer: str) -> Tuple[Any, Any]:
+    """Remove the value at `pointer` and return `(document, value)`."""
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        return (None, document)
+    (parent, token) = locate(document, pointer)
+    (_, key) = resolve(parent, token, pointer)
+    if not contains(parent, key):
+        fail(f"path \"{pointer}\" does not exist")
+    return (document, parent.pop(key))
+
+
+def locate(document: Any, pointer: str) -> Tuple[Container, str]:
+    """Container of the value at `pointer`, and the last token of `pointer`."""
+    tokens = parse_pointer(pointer)
+    parent = get(document, "".join("/" + escape(token) for token in tokens[:-1]))
+    if not isinstance(parent, (dict, list)):
+        fail(f"parent of \"{pointer}\" is neither an object nor an array")
+    return (parent, tokens[-1])
+
+
+def resolve(container: Any, token: str, pointer: str) -> Tuple[Container, Union[str, int]]:
+    """Check that `container` can hold `token` and return the key or index to use."""
+    if isinstance(container, dict):
+        return (container, token)
+    if isinstance(container, list):
+        if not token.isdigit() or (token != "0" and token.startswith("0")):
+            fail(f"invalid array index in \"{pointer}\"")
+        return (container, int(token))
+    fail(f"path \"{pointer}\" goes through a value which is neither an object nor an array")
+
+
+def contains(container: Container, key: Union[str, int]) -> bool:
+    if isinstance(container, list):
+        return key < len(container)
+    return key in container
+
+
+def escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def equal(a: Any, b: Any) -> bool:
+    """JSON equality: unlike Python's, `1 == True` is false."""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) == type(b) and a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(equal(a[key], b[key]) for key in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(equal(x, y) for (x, y) in zip(a, b))
+    return a == b
+
+
+def get_string(operation: dict, name: str) -> str:
+    value = operation.get(name)
+    if not isinstance(value, str):
+        fail(f"attribute \"{name}\" must be a string")
+    return value
+
+
+def get_value(operation: dict) -> Any:
+    if "value" not in operation:
+        fail("attribute \"value\" is missing")
+    return operation["value"]
+
+
+def fail(message: str) -> None:
+    raise EntryPointException(INVALID_PATCH, message)
@@ -0,0 +1,82 @@
+"""Leveled and rate-limited logging.
+
+The modules log through the standard `logging` module, with a logger
+per module. The records are only queued by the caller: a background
+thread formats and writes them, so a slow terminal or pipe never blocks
+the event loop.
+
+Each logger emits at most `log_rate` records per second, with bursts of
+the same size. The records above this rate are dropped and counted, and
+the count is appended to the next record of this logger. Errors are
+never dropped.
+"""
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, TypedDict
+
+LEVELS = ["debug", "info", "warning", "error"]
+
+FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+
+class LogOptions(TypedDict):
+    # Minimum level of the records: "debug", "info", "warning" or "error".
+    log_level: str
+    # Maximum number of records per second and per logger (0 means no limit).
+    log_rate: float
+
+
+class RateLimiter(logging.Filter):
+    """Token bucket per logger."""
+
+    def __init__(self, rate: float):
+        """Set the number of records per second of each logger."""
+        super().__init__()
+        self.rate = rate
+        # Tokens, time of the last update and number of dropped records, by logger.
+        self.buckets: Dict[str, List[float]] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.ERROR:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(record.name)
+            if bucket is None:
+                bucket = [self.rate, now, 0]
+                self.buckets[record.name] = bucket
+            bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            dropped = int(bucket[2])
+            bucket[2] = 0
+        if dropped > 0:
+            record.msg = f"{record.getMessage()} ({dropped} previous messages dropped)"
+            record.args = None
+        return True
+
+
+def setup(options: LogOptions) -> logging.handlers.QueueListener:
+    """Send the records of all the loggers to a background writer."""
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(RateLimiter(options["log_rate"]))
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter(FORMAT))
+    listener = logging.handlers.QueueListener(records, output)
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(options["log_level"].upper())
+    # The websockets library logs every connection at the "info" level.
+    logging.getLogger("websockets").setLevel(max(root.level, logging.WARNING))
+    listener.start()
+    return listener
+
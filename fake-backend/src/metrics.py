@@ -0,0 +1,197 @@
+"""Counters and histograms of the calls of the entrypoints.
+
+For each entrypoint, we count the calls, the errors and the calls in
+flight, and we record the latencies and the sizes of the requests and
+responses in histograms with fixed buckets. The percentiles are
+interpolated inside the buckets (and kept between the smallest and the
+biggest values), which is precise enough for buckets growing by a
+factor of 2 and never needs to keep the samples.
+
+All the updates happen in the event loop: no lock is needed.
+"""
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# Upper bounds of the buckets of the latencies, in seconds (0.1 ms to 105 s).
+LATENCY_BUCKETS = [0.0001 * 2 ** i for i in range(21)]
+
+# Upper bounds of the buckets of the payload sizes, in bytes (64 B to 1 GB).
+SIZE_BUCKETS = [64 * 4 ** i for i in range(13)]
+
+PERCENTILES = [50, 95, 99]
+
+
+class Histogram:
+    """Number of values falling in each bucket."""
+
+    def __init__(self, bounds: List[float]):
+        """Set the upper bounds of the buckets, in increasing order."""
+        self.bounds = bounds
+        # The last bucket holds the values above the last bound.
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add a value."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Estimate of the value below which `percent` % of the values fall."""
+        if self.count == 0:
+            return None
+        rank = self.count * percent / 100
+        seen = 0
+        for (index, count) in enumerate(self.counts):
+            if count > 0 and seen + count >= rank:
+                lower = max(self.min, 0 if index == 0 else self.bounds[index - 1])
+                upper = self.max if index == len(self.bounds) else min(self.max, self.bounds[index])
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def to_dict(self) -> dict:
+        """Count, sum and percentiles, as JSON."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count > 0 else None,
+            "max": self.max if self.count > 0 else None,
+            **{f"p{percent}": self.percentile(percent) for percent in PERCENTILES}
+        }
+
+    def to_prometheus(self, name: str, labels: str) -> List[str]:
+        """Lines of this histogram in Prometheus' text format."""
+        lines = []
+        total = 0
+        for (bound, count) in zip(self.bounds + [float("inf")], self.counts):
+            total += count
+            bound = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class EntrypointMetrics:
+    """Metrics of the calls of one entrypoint."""
+
+    def __init__(self):
+        self.calls = 0
+        self.in_flight = 0
+        # Number of errors, by code.
+        self.errors: Dict[int, int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.request_size = Histogram(SIZE_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "inFlight": self.in_flight,
+            "errors": sum(self.errors.values()),
+            "errorCodes": { str(code): count for (code, count) in self.errors.items() },
+            "latency": self.latency.to_dict(),
+            "requestSize": self.request_size.to_dict(),
+            "responseSize": self.response_size.to_dict()
+        }
+
+
+class Call:
+    """A call being measured."""
+
+    def __init__(self, metrics: EntrypointMetrics, request_size: int):
+        """Count the call as in flight."""
+        self.metrics = metrics
+        self.start = time.perf_counter()
+        self.request_size = request_size
+        # Bytes of the response and of the chunks sent before it.
+        self.response_size = 0
+        self.error: Optional[int] = None
+        self.finished = False
+        metrics.calls += 1
+        metrics.in_flight += 1
+
+    def finish(self) -> None:
+        """Record the call, which is done (a second call does nothing)."""
+        if self.finished:
+            return
+        self.finished = True
+        metrics = self.metrics
+        metrics.in_flight -= 1
+        if self.error is not None:
+            metrics.errors[self.error] = metrics.errors.get(self.error, 0) + 1
+        metrics.latency.observe(time.perf_counter() - self.start)
+        metrics.request_size.observe(self.request_size)
+        metrics.response_size.observe(self.response_size)
+
+
+# The call whose request is being processed, if it is measured.
+current_call: ContextVar[Optional[Call]] = ContextVar("current_call", default=None)
+
+
+class Metrics:
+    """Metrics of all the entrypoints."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.entrypoints: Dict[str, EntrypointMetrics] = {}
+        self.clients = 0
+
+    def begin(self, name: str, request_size: int) -> Call:
+        """Start measuring a call of the entrypoint `name`."""
+        metrics = self.entrypoints.get(name)
+        if metrics is None:
+            metrics = EntrypointMetrics()
+            self.entrypoints[name] = metrics
+        return Call(metrics, request_size)
+
+    def to_dict(self) -> dict:
+        """All the metrics, as JSON."""
+        return {
+            "uptime": time.time() - self.started,
+            "clients": self.clients,
+            "entrypoints": {
+                name: metrics.to_dict() for (name, metrics) in sorted(self.entrypoints.items())
+            }
+        }
+
+    def to_prometheus(self) -> str:
+        """All the metrics, in Prometheus' text format."""
+        lines = [
+            "# TYPE circuit_studio_uptime_seconds gauge",
+            f"circuit_studio_uptime_seconds {time.time() - self.started}",
+            "# TYPE circuit_studio_clients gauge",
+            f"circuit_studio_clients {self.clients}"
+        ]
+        entrypoints = sorted(self.entrypoints.items())
+        lines.append("# TYPE circuit_studio_calls_total counter")
+        for (name, metrics) in entrypoints:
+            lines.append(f'circuit_studio_calls_total{{entrypoint="{name}"}} {metrics.calls}')
+        lines.append("# TYPE circuit_studio_errors_total counter")
+        for (name, metrics) in entrypoints:
+            for (code, count) in sorted(metrics.errors.items()):
+                lines.append(
+                    f'circuit_studio_errors_total{{entrypoint="{name}",code="{code}"}} {count}'
+                )
+        lines.append("# TYPE circuit_studio_in_flight gauge")
+        for (name, metrics) in entrypoints:
+            lines.append(f'circuit_studio_in_flight{{entrypoint="{name}"}} {metrics.in_flight}')
+        for (metric, attribute) in (
+            ("circuit_studio_latency_seconds", "latency"),
+            ("circuit_studio_request_bytes", "request_size"),
+            ("circuit_studio_response_bytes", "response_size")
+        ):
+            lines.append(f"# TYPE {metric} histogram")
+            for (name, metrics) in entrypoints:
+                histogram: Histogram = getattr(metrics, attribute)
+                lines.extend(histogram.to_prometheus(metric, f'entrypoint="{name}"'))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,346 @@
+"""Reader of NRRD volumes (http://teem.sourceforge.net/nrrd/format.html).
+
+Only the header is parsed in full. The data is never loaded as a whole:
+`read_slab()` extracts an axis-aligned block of voxels, through a memory
+map for raw data in a single file, or by decompressing the data as a
+stream and keeping only the planes we need for the other encodings.
+
+Axes are given in the order of the file: the first one is the fastest.
+"""
+import bz2
+import gzip
+import os
+import re
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from entrypoint import EntryPointException
+
+# A header bigger than this is probably not a header.
+MAX_HEADER_SIZE = 1024 * 1024
+
+# Size of the reads when skipping decompressed data.
+SKIP_SIZE = 1024 * 1024
+
+NOT_NRRD = 1
+UNSUPPORTED = 2
+INVALID_SLAB = 3
+
+TYPES = {
+    "int8": ["signed char", "int8", "int8_t"],
+    "uint8": ["uchar", "unsigned char", "uint8", "uint8_t"],
+    "int16": ["short", "short int", "signed short", "signed short int", "int16", "int16_t"],
+    "uint16": ["ushort", "unsigned short", "unsigned short int", "uint16", "uint16_t"],
+    "int32": ["int", "signed int", "int32", "int32_t"],
+    "uint32": ["uint", "unsigned int", "uint32", "uint32_t"],
+    "int64": [
+        "longlong", "long long", "long long int", "signed long long",
+        "signed long long int", "int64", "int64_t"
+    ],
+    "uint64": [
+        "ulonglong", "unsigned long long", "unsigned long long int", "uint64", "uint64_t"
+    ],
+    "float32": ["float"],
+    "float64": ["double"],
+}
+DTYPES = { alias: name for (name, aliases) in TYPES.items() for alias in aliases }
+
+ENCODINGS = {
+    "raw": "raw",
+    "gzip": "gzip",
+    "gz": "gzip",
+    "bzip2": "bzip2",
+    "bz2": "bzip2",
+}
+
+RX_KEY_VALUE = re.compile(r"^([^:]*):=(.*)$")
+RX_FIELD = re.compile(r"^([^:]+):\s(.*)$")
+
+
+class NrrdHeader:
+    """Parsed header of a NRRD file."""
+
+    def __init__(self, path: str):
+        """Create an empty header for the file `path`."""
+        self.path = path
+        self.version = ""
+        # Field names are lower case, as they are case insensitive.
+        self.fields: Dict[str, str] = {}
+        self.key_values: Dict[str, str] = {}
+        # Position of the data in `path` (meaningful if the data is attached).
+        self.offset = 0
+        self.data_files: List[str] = []
+
+    @property
+    def detached(self) -> bool:
+        """Is the data stored in other files?"""
+        return "data file" in self.fields
+
+    @property
+    def sizes(self) -> List[int]:
+        """Number of samples along each axis, fastest first."""
+        return [int(size) for size in self.fields.get("sizes", "").split()]
+
+    @property
+    def encoding(self) -> str:
+        """Normalized encoding of the data."""
+        encoding = self.fields.get("encoding", "")
+        if encoding not in ENCODINGS:
+            raise EntryPointException(UNSUPPORTED, f"Unsupported NRRD encoding: \"{encoding}\"!")
+        return ENCODINGS[encoding]
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Type of the samples, with the endianness of the file."""
+        name = self.fields.get("type", "")
+        if name not in DTYPES:
+            raise EntryPointException(UNSUPPORTED, f"Unsupported NRRD type: \"{name}\"!")
+        dtype = np.dtype(DTYPES[name])
+        if dtype.itemsize > 1:
+            endian = self.fields.get("endian", "little")
+            dtype = dtype.newbyteorder("<" if endian == "little" else ">")
+        return dtype
+
+    @property
+    def line_skip(self) -> int:
+        """Number of lines to skip at the beginning of each data file."""
+        return int(self.fields.get("line skip", "0"))
+
+    @property
+    def byte_skip(self) -> int:
+        """Number of bytes to skip after the lines (-1 means data is at the end)."""
+        return int(self.fields.get("byte skip", "0"))
+
+    def to_dict(self) -> Dict[str, str]:
+        """All the fields and key/value pairs, as they appear in the file."""
+        return { "NRRD version": self.version, **self.fields, **self.key_values }
+
+
+def read_header(path: str) -> NrrdHeader:
+    """Parse the header of a NRRD file (`.nrrd` or detached `.nhdr`).
+
+    The file is read line by line until the blank line ending the header,
+    so the size of the header does not matter.
+    """
+    header = NrrdHeader(path)
+    with open(path, "rb") as fd:
+        magic = fd.readline(64).decode("ascii", "replace").strip()
+        if not magic.startswith("NRRD"):
+            raise EntryPointException(NOT_NRRD, f"This is not a NRRD file: {path}")
+        header.version = magic[4:]
+        while True:
+            if fd.tell() > MAX_HEADER_SIZE:
+                raise EntryPointException(
+                    NOT_NRRD, f"The header is bigger than {MAX_HEADER_SIZE} bytes: {path}"
+                )
+            raw_line = fd.readline(MAX_HEADER_SIZE)
+            line = raw_line.decode("utf-8", "replace").rstrip("\r\n")
+            if not line:
+                # Blank line or end of file.
+                break
+            if line.startswith("#"):
+                continue
+            match = RX_KEY_VALUE.match(line)
+            if match is not None:
+                header.key_values[match.group(1)] = match.group(2)
+                continue
+            match = RX_FIELD.match(line)
+            if match is None:
+                raise EntryPointException(NOT_NRRD, f"Invalid NRRD header line: \"{line}\"")
+            name = match.group(1).strip().lower()
+            # "datafile" is an older spelling of "data file".
+            name = "data file" if name == "datafile" else name
+            header.fields[name] = match.group(2).strip()
+            if name == "data file" and header.fields[name].split()[0] == "LIST":
+                # The file names are the remaining lines of the header.
+                header.data_files = [
+                    item.decode("utf-8").strip() for item in fd.read().splitlines() if item.strip()
+                ]
+                break
+        header.offset = fd.tell()
+    if header.detached:
+        header.data_files = get_data_files(header)
+    else:
+        header.data_files = [path]
+    return header
+
+
+def get_data_files(header: NrrdHeader) -> List[str]:
+    """Absolute paths of the files holding the data of a detached header."""
+    folder = os.path.dirname(header.path)
+    spec = header.fields["data file"].split()
+    if spec[0] == "LIST":
+        names = header.data_files
+    elif "%" in spec[0] and len(spec) >= 4:
+        (pattern, start, stop, step) = spec[:4]
+        (start, stop, step) = (int(start), int(stop), int(step))
+        if step == 0:
+            raise EntryPointException(NOT_NRRD, "Invalid \"data file\" step: 0!")
+        names = [pattern % index for index in range(start, stop + (1 if step > 0 else -1), step)]
+    else:
+        names = [header.fields["data file"]]
+    return [os.path.abspath(os.path.join(folder, name)) for name in names]
+
+
+def read_slab(
+    header: NrrdHeader, start: List[int], size: List[int], step: List[int]
+) -> np.ndarray:
+    """Read the samples `start + k * step` for `k` in `[0, size)` along each axis.
+
+    The returned array is little endian, with numpy's order of axes
+    (the reverse of NRRD's): its bytes are in the order of the file.
+    """
+    shape = tuple(reversed(header.sizes))
+    slices = tuple(
+        slice(first, first + (count - 1) * stride + 1, stride)
+        for (first, count, stride) in reversed(list(zip(start, size, step)))
+    )
+    volume = open_memmap(header)
+    if volume is not None:
+        slab = np.array(volume[slices])
+    else:
+        slab = read_slab_from_stream(header, shape, slices)
+    return slab.astype(slab.dtype.newbyteorder("<"), copy=False)
+
+
+def iter_blocks(header: NrrdHeader, count: int) -> Iterator[np.ndarray]:
+    """Yield the whole volume by blocks of `count` planes of the slowest axis.
+
+    The arrays are little endian, with numpy's order of axes.
+    """
+    shape = tuple(reversed(header.sizes))
+    volume = open_memmap(header)
+    if volume is not None:
+        for first in range(0, shape[0], count):
+            block = np.array(volume[first:first + count])
+            yield block.astype(block.dtype.newbyteorder("<"), copy=False)
+        return
+    dtype = header.dtype
+    plane_size = int(np.prod(shape[1:])) * dtype.itemsize
+    with DataStream(header) as stream:
+        for first in range(0, shape[0], count):
+            planes = min(count, shape[0] - first)
+            block = np.frombuffer(stream.read(planes * plane_size), dtype=dtype)
+            block = block.reshape((planes,) + shape[1:])
+            yield block.astype(dtype.newbyteorder("<"), copy=False)
+
+
+def open_memmap(header: NrrdHeader) -> Optional[np.memmap]:
+    """Map the data in memory, or return `None` if it is not raw data in a single file."""
+    if header.encoding != "raw" or len(header.data_files) != 1 or header.line_skip != 0:
+        return None
+    sizes = header.sizes
+    dtype = header.dtype
+    data_file = header.data_files[0]
+    offset = header.byte_skip if header.detached else header.offset + max(0, header.byte_skip)
+    if header.byte_skip == -1:
+        offset = os.path.getsize(data_file) - int(np.prod(sizes)) * dtype.itemsize
+    return np.memmap(data_file, dtype=dtype, mode="r", offset=offset, shape=tuple(reversed(sizes)))
+
+
+def read_slab_from_stream(
+    header: NrrdHeader, shape: Tuple[int, ...], slices: Tuple[slice, ...]
+) -> np.ndarray:
+    """Read a slab by decompressing the data as a stream.
+
+    Only one plane (all the samples for an index of the slowest axis) is
+    in memory at a time, and the decompression stops after the last
+    plane of the slab.
+    """
+    dtype = header.dtype
+    plane_shape = shape[1:]
+    plane_size = int(np.prod(plane_shape)) * dtype.itemsize
+    outer = slices[0]
+    planes = []
+    position = 0
+    with DataStream(header) as stream:
+        for index in range(outer.start, outer.stop, outer.step):
+            stream.skip((index - position) * plane_size)
+            buffer = stream.read(plane_size)
+            plane = np.frombuffer(buffer, dtype=dtype).reshape(plane_shape)
+            planes.append(np.array(plane[slices[1:]]))
+            position = index + 1
+    return np.stack(planes)
+
+
+class DataStream:
+    """Decompressed data of a NRRD file, read sequentially across data files."""
+
+    def __init__(self, header: NrrdHeader):
+        """Prepare the reading of the data files of `header`."""
+        self.header = header
+        self.files: Iterator[str] = iter(header.data_files)
+        self.current: Optional[BinaryIO] = None
+        self.raw: Optional[BinaryIO] = None
+
+    def __enter__(self) -> "DataStream":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def read(self, size: int) -> bytes:
+        """Read exactly `size` bytes."""
+        chunks = []
+        while size > 0:
+            data = self.__read_some(size)
+            chunks.append(data)
+            size -= len(data)
+        return b"".join(chunks)
+
+    def skip(self, size: int) -> None:
+        """Skip `size` bytes."""
+        while size > 0:
+            size -= len(self.__read_some(min(size, SKIP_SIZE)))
+
+    def close(self) -> None:
+        """Close the current data file."""
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        if self.raw is not None:
+            self.raw.close()
+            self.raw = None
+
+    def __read_some(self, size: int) -> bytes:
+        while True:
+            if self.current is None:
+                self.__open_next()
+            data = self.current.read(size)
+            if data:
+                return data
+            self.close()
+
+    def __open_next(self) -> None:
+        header = self.header
+        path = next(self.files, None)
+        if path is None:
+            raise EntryPointException(INVALID_SLAB, "Unexpected end of the NRRD data!")
+        self.raw = open(path, "rb")
+        if not header.detached:
+            self.raw.seek(header.offset)
+        for _ in range(header.line_skip):
+            self.raw.readline()
+        encoding = header.encoding
+        if encoding == "gzip":
+            self.current = gzip.GzipFile(fileobj=self.raw, mode="rb")
+        elif encoding == "bzip2":
+            self.current = bz2.BZ2File(self.raw, mode="rb")
+        else:
+            self.current = self.raw
+            self.raw = None
+        skip = header.byte_skip
+        if skip == -1:
+            if encoding != "raw":
+                raise EntryPointException(
+                    UNSUPPORTED, "\"byte skip: -1\" is only supported with raw encoding!"
+                )
+            count = len(header.data_files)
+            file_size = int(np.prod(header.sizes)) * header.dtype.itemsize // count
+            self.current.seek(-file_size, os.SEEK_END)
+        else:
+            # For compressed data, the bytes are skipped after decompression.
+            while skip > 0:
+                data = self.current.read(min(skip, SKIP_SIZE))
+                if not data:
+                    raise EntryPointException(INVALID_SLAB, f"Data file is too small: {path}")
+                skip -= len(data)
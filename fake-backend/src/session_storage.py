@@ -0,0 +1,262 @@
+"""Storage of the session variables of the clients.
+
+Each session has its own namespace of keys. The values are any JSON
+data, stored encoded, and can expire after a given number of seconds.
+Two stores are available:
+
+* `MemoryStorage`: an LRU whose size is bounded by a number of bytes.
+  Its content is lost when the backend restarts. This is the default.
+* `SqliteStorage`: a SQLite database, which survives restarts. It uses
+  WAL journaling, which is not safe on network filesystems: keep the
+  database on a local disk, for one backend.
+
+The stores are blocking: the entrypoints use them from the IO threads.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Set, Tuple, TypedDict
+from codec import JSON
+from connection import Connection
+from entrypoint import EntryPointException, PARAMS_ERROR
+
+# Number of writes between two purges of the expired items of a database.
+PURGE_INTERVAL = 256
+
+TOO_BIG = 3
+
+
+class SessionStorageOptions(TypedDict):
+    # SQLite database of the sessions (empty string to keep them in memory).
+    session_storage_file: str
+    # Maximum number of bytes of the sessions kept in memory.
+    session_storage_size: int
+
+
+def get_ttl(params: dict) -> Optional[float]:
+    """Optional "ttl" param of a request: seconds during which a value is kept."""
+    ttl = params.get("ttl")
+    if ttl is not None and (
+        isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0
+    ):
+        raise EntryPointException(PARAMS_ERROR, "Argument \"ttl\" must be a positive number!")
+    return ttl
+
+
+def get_expiration(ttl: Optional[float]) -> Optional[float]:
+    """Wall clock time at which an item with `ttl` seconds to live expires."""
+    return None if ttl is None else time.time() + ttl
+
+
+class SessionStorage:
+    """Keys and values of all the sessions."""
+
+    def __init__(self):
+        # Serializes the read-modify-write operations with the writes, so a
+        # write cannot happen between the read and the write of an update.
+        # Reentrant because `update()` writes while holding it.
+        self.update_lock = threading.RLock()
+        # Ids of the connections whose session is deleted when they close.
+        self.watched: Set[str] = set()
+
+    def get(self, session: str, key: str) -> Tuple[Optional[str], Optional[float]]:
+        """Return `(value, expiration)`, with `value` being `None` if the key is missing."""
+        raise NotImplementedError()
+
+    def set(self, session: str, key: str, value: str, expiration: Optional[float]) -> None:
+        """Store the encoded `value`, which will expire at time `expiration`.
+
+        Implementations hold `update_lock` while writing, like `delete()`.
+        """
+        raise NotImplementedError()
+
+    def delete(self, session: str, prefix: str, exact: bool) -> int:
+        """Delete `prefix` if `exact`, or all the keys starting with `prefix`."""
+        raise NotImplementedError()
+
+    def list(self, session: str, prefix: str) -> List[str]:
+        """Sorted keys starting with `prefix`."""
+        raise NotImplementedError()
+
+    def read(self, session: str, key: str) -> Any:
+        """Decoded value of `key`, or `None` if it is missing."""
+        (value, _) = self.get(session, key)
+        return None if value is None else JSON.decode(value)
+
+    def write(self, session: str, key: str, value: Any, expiration: Optional[float]) -> None:
+        """Encode and store `value`."""
+        self.set(session, key, JSON.encode(value), expiration)
+
+    def update(
+        self, session: str, key: str, update: Callable[[Any], Any], ttl: Optional[float]
+    ) -> bool:
+        """Replace the value of `key` by `update(value)`.
+
+        The expiration does not change, unless `ttl` is defined.
+        Return False if the key is missing.
+        """
+        with self.update_lock:
+            (value, expiration) = self.get(session, key)
+            if value is None:
+                return False
+            if ttl is not None:
+                expiration = get_expiration(ttl)
+            self.write(session, key, update(JSON.decode(value)), expiration)
+            return True
+
+    def watch(self, connection: Connection) -> None:
+        """Forget the session of `connection` when it closes, unless it can be resumed."""
+        if connection.session_id != connection.id or connection.id in self.watched:
+            return
+        self.watched.add(connection.id)
+        connection.on_close(self.__forget)
+
+    def __forget(self, connection: Connection) -> None:
+        self.watched.discard(connection.id)
+        # The callbacks of a connection run in the event loop.
+        asyncio.get_event_loop().run_in_executor(
+            None, self.delete, connection.session_id, "", False
+        )
+
+
+class MemoryStorage(SessionStorage):
+    """Sessions in memory, the least recently used items being evicted first."""
+
+    def __init__(self, capacity: int):
+        """Set the maximum number of bytes of the keys and values."""
+        super().__init__()
+        self.capacity = capacity
+        self.size = 0
+        self.items: "OrderedDict[Tuple[str, str], Tuple[str, Optional[float]]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session: str, key: str) -> Tuple[Optional[str], Optional[float]]:
+        with self.lock:
+            item = self.items.get((session, key))
+            if item is None:
+                return (None, None)
+            if item[1] is not None and item[1] < time.time():
+                self.__remove((session, key))
+                return (None, None)
+            self.items.move_to_end((session, key))
+            return item
+
+    def set(self, session: str, key: str, value: str, expiration: Optional[float]) -> None:
+        size = get_size(session, key, value)
+        if size > self.capacity:
+            raise EntryPointException(
+                TOO_BIG, f"Value is too big: {size} bytes, the maximum is {self.capacity}!"
+            )
+        with self.update_lock, self.lock:
+            self.__remove((session, key))
+            self.items[(session, key)] = (value, expiration)
+            self.size += size
+            while self.size > self.capacity:
+                self.__remove(next(iter(self.items)))
+
+    def delete(self, session: str, prefix: str, exact: bool) -> int:
+        with self.update_lock, self.lock:
+            if exact:
+                return 1 if self.__remove((session, prefix)) else 0
+            keys = [
+                item for item in self.items
+                if item[0] == session and item[1].startswith(prefix)
+            ]
+            for item in keys:
+                self.__remove(item)
+            return len(keys)
+
+    def list(self, session: str, prefix: str) -> List[str]:
+        now = time.time()
+        with self.lock:
+            return sorted(
+                key for ((owner, key), (_, expiration)) in self.items.items()
+                if owner == session and key.startswith(prefix)
+                and (expiration is None or expiration >= now)
+            )
+
+    def __remove(self, item: Tuple[str, str]) -> bool:
+        entry = self.items.pop(item, None)
+        if entry is None:
+            return False
+        self.size -= get_size(item[0], item[1], entry[0])
+        return True
+
+
+class SqliteStorage(SessionStorage):
+    """Sessions in a SQLite database."""
+
+    def __init__(self, filename: str):
+        """Open the database, creating it if needed."""
+        super().__init__()
+        folder = os.path.dirname(filename)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.db = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            + "session TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expiration REAL, "
+            + "PRIMARY KEY (session, key)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS expirations ON items (expiration)")
+        self.lock = threading.Lock()
+        self.writes = 0
+
+    def get(self, session: str, key: str) -> Tuple[Optional[str], Optional[float]]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value, expiration FROM items WHERE session = ? AND key = ?"
+                + " AND (expiration IS NULL OR expiration >= ?)",
+                (session, key, time.time())
+            ).fetchone()
+        return (None, None) if row is None else row
+
+    def set(self, session: str, key: str, value: str, expiration: Optional[float]) -> None:
+        with self.update_lock, self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)",
+                (session, key, value, expiration)
+            )
+            self.writes += 1
+            if self.writes % PURGE_INTERVAL == 0:
+                self.db.execute("DELETE FROM items WHERE expiration < ?", (time.time(),))
+
+    def delete(self, session: str, prefix: str, exact: bool) -> int:
+        with self.update_lock, self.lock:
+            if exact:
+                cursor = self.db.execute(
+                    "DELETE FROM items WHERE session = ? AND key = ?", (session, prefix)
+                )
+            else:
+                cursor = self.db.execute(
+                    "DELETE FROM items WHERE session = ? AND substr(key, 1, ?) = ?",
+                    (session, len(prefix), prefix)
+                )
+            return cursor.rowcount
+
+    def list(self, session: str, prefix: str) -> List[str]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT key FROM items WHERE session = ? AND substr(key, 1, ?) = ?"
+                + " AND (expiration IS NULL OR expiration >= ?) ORDER BY key",
+                (session, len(prefix), prefix, time.time())
+            ).fetchall()
+        return [key for (key,) in rows]
+
+
+def get_size(session: str, key: str, value: str) -> int:
+    """Approximate number of bytes used by an item."""
+    return len(session) + len(key) + len(value)
+
+
+def create_storage(options: SessionStorageOptions) -> SessionStorage:
+    """Storage defined by the command line options."""
+    filename = options["session_storage_file"]
+    if filename:
+        return SqliteStorage(filename)
+    return MemoryStorage(options["session_storage_size"])
@@ -0,0 +1,159 @@
+"""Cache of the summaries computed from SONATA circuits and simulations.
+
+Parsing the configs of a big circuit and opening all its populations
+takes seconds, but these files rarely change. A summary is stored with
+the mtimes of all the files it has been computed from:
+
+* In memory, it is used without any syscall for `recheck` seconds after
+  the last time these mtimes have been checked.
+* On disk (one JSON file per config in the cache folder), it survives
+  restarts of the backend. A summary loaded from disk is always checked.
+
+Concurrent requests for the same missing summary share the same
+computation.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypedDict
+from fs_cache import LruCache
+
+# Bump this when the format of the summaries changes.
+FORMAT_VERSION = 1
+
+# A file modified less than this number of seconds before being read
+# can still change without its mtime changing (mtime granularity).
+MTIME_GRANULARITY = 1.0
+
+# Mtime recorded for the files that do not exist.
+MISSING = -1
+
+logger = logging.getLogger("sonata_cache")
+
+# Returns `(summary, files)`: the summary and the files it depends on.
+Compute = Callable[[], Awaitable[Tuple[Any, List[str]]]]
+
+
+class SonataCacheOptions(TypedDict):
+    # Folder of the persistent cache (empty string disables it).
+    sonata_cache_dir: str
+    # Maximum number of summaries kept in memory.
+    sonata_cache_size: int
+    # Seconds during which a summary in memory is used without checking its files.
+    sonata_cache_recheck: float
+
+
+def get_mtimes(files: List[str]) -> Dict[str, int]:
+    """Current mtime of each file, or `MISSING`."""
+    mtimes = {}
+    for path in files:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtimes[path] = MISSING
+    return mtimes
+
+
+def is_up_to_date(mtimes: Dict[str, int]) -> bool:
+    """Do all the files still have the recorded mtimes?"""
+    return get_mtimes(list(mtimes)) == mtimes
+
+
+def is_stable(mtimes: Dict[str, int]) -> bool:
+    """Are the recorded mtimes old enough to trust them?"""
+    limit = (time.time() - MTIME_GRANULARITY) * 1e9
+    return all(mtime < limit for mtime in mtimes.values())
+
+
+class SonataCache:
+    """Summaries keyed by the kind of summary and the absolute path of a config."""
+
+    def __init__(self, options: SonataCacheOptions):
+        """Set the folder of the persistent cache."""
+        self.folder = options["sonata_cache_dir"]
+        self.recheck = options["sonata_cache_recheck"]
+        # Items are `(record, time of the last check)`.
+        self.memory = LruCache(options["sonata_cache_size"], float("inf"))
+        self.pending: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def get(self, kind: str, path: str, compute: Compute) -> Any:
+        """Return the summary of `kind` for the config `path`.
+
+        `kind` must identify the summary and all the parameters it
+        depends on, e.g. "report-stats/soma/All".
+
+        If it is not cached or if its files changed, `compute()` is awaited
+        and its result is stored.
+        """
+        key = (kind, path)
+        cached = self.memory.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.recheck:
+            return cached[0]["summary"]
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.__load(key, cached, compute))
+            self.pending[key] = future
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+        # A client leaving must not cancel the computation of the others.
+        return await asyncio.shield(future)
+
+    async def __load(self, key: Tuple[str, str], cached: Optional[tuple], compute: Compute) -> Any:
+        loop = asyncio.get_running_loop()
+        record = cached[0] if cached is not None else None
+        if record is None:
+            record = await loop.run_in_executor(None, self.__read, key)
+        if record is not None and await loop.run_in_executor(None, is_up_to_date, record["files"]):
+            self.memory.put(key, (record, time.monotonic()))
+            return record["summary"]
+        (summary, files) = await compute()
+        mtimes = await loop.run_in_executor(None, get_mtimes, files)
+        if not is_stable(mtimes):
+            # Files are being written: do not cache what could be outdated.
+            self.memory.invalidate(key)
+            return summary
+        record = {
+            "version": FORMAT_VERSION,
+            "kind": key[0],
+            "path": key[1],
+            "files": mtimes,
+            "summary": summary
+        }
+        self.memory.put(key, (record, time.monotonic()))
+        await loop.run_in_executor(None, self.__write, key, record)
+        return summary
+
+    def __get_filename(self, key: Tuple[str, str]) -> str:
+        digest = hashlib.sha1("\0".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, f"{digest}.json")
+
+    def __read(self, key: Tuple[str, str]) -> Optional[dict]:
+        if not self.folder:
+            return None
+        try:
+            with open(self.__get_filename(key), "r") as fd:
+                record = json.load(fd)
+        except (OSError, ValueError):
+            return None
+        if (
+            record.get("version") != FORMAT_VERSION
+            or record.get("kind") != key[0]
+            or record.get("path") != key[1]
+        ):
+            return None
+        return record
+
+    def __write(self, key: Tuple[str, str], record: dict) -> None:
+        if not self.folder:
+            return
+        filename = self.__get_filename(key)
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(temp_filename, "w") as fd:
+                json.dump(record, fd)
+            os.replace(temp_filename, filename)
+        except OSError as ex:
+            logger.warning("Unable to write SONATA cache file %s: %s", filename, ex)
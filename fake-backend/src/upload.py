@@ -0,0 +1,104 @@
+"""Chunked uploads shared by the `fs-upload-*` entrypoints.
+
+An upload is identified by the path of the file to create. Chunks are
+appended to a temporary file next to it, and this file is renamed
+atomically when the upload is committed. Since the temporary file stays
+on disk, an interrupted upload can be resumed (even after a restart of
+the backend) from the size of this file, which is the last acknowledged
+offset.
+"""
+import asyncio
+import contextlib
+import os
+from typing import Dict
+from entrypoint import EntryPointException
+
+# Size of the chunks the client should send. Small enough to fit in a
+# websocket frame with the default `max_size` of 1 MB, even in base64.
+CHUNK_SIZE = 512 * 1024
+
+OFFSET_MISMATCH = 5
+NOT_STARTED = 6
+SIZE_MISMATCH = 7
+
+
+class Uploads:
+    """Serialize the operations on each upload."""
+
+    def __init__(self):
+        self.locks: Dict[str, asyncio.Lock] = {}
+        # Number of operations holding or waiting for each lock.
+        self.users: Dict[str, int] = {}
+
+    @contextlib.asynccontextmanager
+    async def lock(self, path: str):
+        """Hold the lock of the upload of `path` while reading or writing it.
+
+        The lock is forgotten once nobody holds or waits for it, so
+        abandoned uploads don't leave locks behind.
+        """
+        lock = self.locks.get(path)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.locks[path] = lock
+        self.users[path] = self.users.get(path, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self.users[path] -= 1
+            if self.users[path] == 0:
+                del self.users[path]
+                del self.locks[path]
+
+
+def get_temp_path(path: str) -> str:
+    """Temporary file in which the content of `path` is uploaded."""
+    folder, filename = os.path.split(path)
+    return os.path.join(folder, f".{filename}.upload")
+
+
+def begin(path: str) -> int:
+    """Create the temporary file of an upload if needed and return its current size."""
+    temp_path = get_temp_path(path)
+    with open(temp_path, "ab") as fd:
+        return fd.tell()
+
+
+def append(path: str, offset: int, data: bytes) -> int:
+    """Write `data` at `offset` of the temporary file and return its new size.
+
+    Writing before the end of the file (resending chunks that have already
+    been acknowledged) discards everything after `offset`.
+    """
+    temp_path = get_temp_path(path)
+    if not os.path.isfile(temp_path):
+        raise EntryPointException(NOT_STARTED, f"No upload in progress for \"{path}\"!")
+    with open(temp_path, "r+b") as fd:
+        size = fd.seek(0, os.SEEK_END)
+        if offset > size:
+            raise EntryPointException(
+                OFFSET_MISMATCH, f"Expected offset {size} or less, but got {offset}!"
+            )
+        fd.seek(offset)
+        fd.write(data)
+        fd.truncate()
+        return fd.tell()
+
+
+def commit(path: str, size: int = None) -> int:
+    """Move the temporary file to `path` and return its size.
+
+    If `size` is defined, the upload is not committed when the uploaded
+    size differs.
+    """
+    temp_path = get_temp_path(path)
+    if not os.path.isfile(temp_path):
+        raise EntryPointException(NOT_STARTED, f"No upload in progress for \"{path}\"!")
+    uploaded = os.path.getsize(temp_path)
+    if size is not None and size != uploaded:
+        raise EntryPointException(
+            SIZE_MISMATCH, f"Expected {size} bytes, but {uploaded} have been uploaded!"
+        )
+    os.replace(temp_path, path)
+    return uploaded
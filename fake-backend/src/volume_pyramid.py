@@ -0,0 +1,286 @@
+"""Multiresolution pyramids of NRRD volumes, for quick previews.
+
+Level 0 is the volume itself. Each next level halves the spatial sizes:
+a voxel is the reduction of a 2x2x2 block of the previous level, the
+mean for densities and the most frequent value (mode) for labels of
+annotation volumes. The levels are built once, in the background, by
+blocks of planes, so the volume is never loaded as a whole.
+
+The levels are stored as `.npy` files in a sidecar folder of the cache,
+with the mtimes of the volume's files: a volume that changed is built
+again on its next use.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypedDict
+import numpy as np
+from entrypoint import EntryPointException
+from nrrd import UNSUPPORTED, iter_blocks, read_header
+from sonata_cache import get_mtimes, is_up_to_date
+
+# Bump this when the format of the levels changes.
+FORMAT_VERSION = 1
+
+# No level is built once all the spatial sizes are this small.
+MIN_SIZE = 16
+
+# Approximate size of the blocks read while building a level.
+BLOCK_SIZE = 64 * 1024 * 1024
+
+LABELS = "labels"
+DENSITY = "density"
+
+logger = logging.getLogger("volume_pyramid")
+
+# Called with the fraction of the pyramid which has been built.
+Progress = Callable[[float], None]
+
+
+class PyramidOptions(TypedDict):
+    # Folder of the pyramids (empty string disables them).
+    volume_cache_dir: str
+
+
+def downsample(block: np.ndarray, reduction: str) -> np.ndarray:
+    """Halve the sizes of the 3 first axes of `block` (numpy order).
+
+    Odd sizes are padded by repeating the last plane.
+    A 4th axis holds the components of the voxels and is kept.
+    """
+    padding = [(0, size % 2) for size in block.shape[:3]] + [(0, 0)] * (block.ndim - 3)
+    if any(after for (_, after) in padding):
+        block = np.pad(block, padding, mode="edge")
+    if reduction == DENSITY:
+        (z, y, x) = block.shape[:3]
+        blocks = block.reshape((z // 2, 2, y // 2, 2, x // 2, 2) + block.shape[3:])
+        return blocks.mean(axis=(1, 3, 5)).astype(np.float32)
+    corners = np.stack([
+        block[i::2, j::2, k::2] for i in (0, 1) for j in (0, 1) for k in (0, 1)
+    ])
+    # For each corner, how many corners of the same block share its value.
+    counts = np.stack([(corners == corner).sum(axis=0, dtype=np.uint8) for corner in corners])
+    best = counts.argmax(axis=0)
+    return np.take_along_axis(corners, best[np.newaxis], axis=0)[0]
+
+
+def get_level_shapes(shape: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+    """Shapes of the levels 1 and more of a volume of `shape` (numpy order)."""
+    shapes = []
+    while max(shape[:3]) > MIN_SIZE:
+        shape = tuple((size + 1) // 2 for size in shape[:3]) + shape[3:]
+        shapes.append(shape)
+    return shapes
+
+
+def iter_array_blocks(array: np.ndarray, count: int) -> Iterator[np.ndarray]:
+    """Yield `array` by blocks of `count` planes."""
+    for first in range(0, array.shape[0], count):
+        yield np.array(array[first:first + count])
+
+
+def get_block_planes(shape: Tuple[int, ...], itemsize: int) -> int:
+    """Even number of planes in a block of about `BLOCK_SIZE` bytes."""
+    plane_size = int(np.prod(shape[1:])) * itemsize
+    return max(2, (BLOCK_SIZE // plane_size) // 2 * 2)
+
+
+def build_level(
+    blocks: Iterator[np.ndarray], shape: Tuple[int, ...], dtype: np.dtype, filename: str,
+    reduction: str, progress: Callable[[int], None]
+) -> None:
+    """Write the level of `shape` computed from the `blocks` of the previous level."""
+    level = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=shape)
+    position = 0
+    for block in blocks:
+        reduced = downsample(block, reduction)
+        level[position:position + reduced.shape[0]] = reduced
+        position += reduced.shape[0]
+        progress(block.shape[0])
+    level.flush()
+    del level
+
+
+def build_pyramid(path: str, reduction: str, folder: str, progress: Progress) -> dict:
+    """Build the levels of the volume `path` in `folder` and return their description."""
+    header = read_header(path)
+    files = get_mtimes([path] + header.data_files)
+    ensure_3d(header.sizes)
+    # With 4 dimensions, the fastest axis holds the components of the
+    # voxels: it is the last one in numpy's order.
+    shape = tuple(reversed(header.sizes))
+    dtype = header.dtype.newbyteorder("<")
+    level_dtype = np.dtype(np.float32) if reduction == DENSITY else dtype
+    shapes = get_level_shapes(shape)
+    # Each level reads all the planes of the previous one.
+    total = sum(previous[0] for previous in [shape] + shapes[:-1]) or 1
+    done = 0
+
+    def advance(planes: int) -> None:
+        nonlocal done
+        done += planes
+        progress(done / total)
+
+    temp_folder = f"{folder}.{os.getpid()}.tmp"
+    shutil.rmtree(temp_folder, ignore_errors=True)
+    os.makedirs(temp_folder)
+    try:
+        levels = [{ "sizes": header.sizes, "type": dtype.name }]
+        blocks = iter_blocks(header, get_block_planes(shape, dtype.itemsize))
+        for (index, level_shape) in enumerate(shapes):
+            filename = os.path.join(temp_folder, get_level_filename(index + 1))
+            build_level(blocks, level_shape, level_dtype, filename, reduction, advance)
+            levels.append({ "sizes": list(reversed(level_shape)), "type": level_dtype.name })
+            previous = np.load(filename, mmap_mode="r")
+            blocks = iter_array_blocks(previous, get_block_planes(level_shape, level_dtype.itemsize))
+        info = {
+            "version": FORMAT_VERSION,
+            "path": path,
+            "reduction": reduction,
+            "files": files,
+            "levels": levels
+        }
+        with open(os.path.join(temp_folder, "info.json"), "w") as fd:
+            json.dump(info, fd)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(temp_folder, folder)
+        return info
+    except BaseException:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+        raise
+
+
+def ensure_3d(sizes: List[int]) -> None:
+    """Raise an error unless the volume has 3 dimensions (4 with vectors)."""
+    if len(sizes) not in (3, 4):
+        raise EntryPointException(
+            UNSUPPORTED, f"Only 3D volumes can be previewed, not {len(sizes)}D ones!"
+        )
+
+
+def get_volume_mtimes(path: str) -> Dict[str, int]:
+    """Current mtimes of the files of the volume `path`."""
+    try:
+        data_files = read_header(path).data_files
+    except (Exception, EntryPointException):  # pylint: disable=broad-except
+        data_files = []
+    return get_mtimes([path] + data_files)
+
+
+def get_level_filename(level: int) -> str:
+    """Name of the file of a level in the folder of a pyramid."""
+    return f"level-{level}.npy"
+
+
+def read_info(folder: str, path: str, reduction: str) -> Optional[dict]:
+    """Description of the pyramid in `folder`, or `None` if it is missing or outdated."""
+    try:
+        with open(os.path.join(folder, "info.json"), "r") as fd:
+            info = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    if (
+        info.get("version") != FORMAT_VERSION
+        or info.get("path") != path
+        or info.get("reduction") != reduction
+        or not is_up_to_date(info["files"])
+    ):
+        return None
+    return info
+
+
+def read_level(folder: str, level: int) -> np.ndarray:
+    """Load a level of the pyramid in `folder` (level 0 is not stored)."""
+    return np.load(os.path.join(folder, get_level_filename(level)))
+
+
+class VolumePyramids:
+    """Build the pyramids in the background, at most one at a time."""
+
+    def __init__(self, options: PyramidOptions):
+        """Set the folder of the pyramids."""
+        self.folder = options["volume_cache_dir"]
+        self.builds: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.progress: Dict[Tuple[str, str], float] = {}
+        # Error of the last build of a volume, with the mtimes of its files
+        # then: it is raised again until the volume changes.
+        self.failures: Dict[Tuple[str, str], Tuple[Dict[str, int], BaseException]] = {}
+        self.lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Can pyramids be stored?"""
+        return bool(self.folder)
+
+    def get_folder(self, path: str, reduction: str) -> str:
+        """Folder of the pyramid of `path`."""
+        digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, f"{digest}-{reduction}")
+
+    async def get(self, path: str, reduction: str, wait: bool = True) -> Optional[dict]:
+        """Return the description of the pyramid of `path`, building it if needed.
+
+        If `wait` is False, return `None` instead of waiting for the build.
+        If the last build of this volume failed, and the volume has not
+        changed since, raise its error again.
+        """
+        folder = self.get_folder(path, reduction)
+        key = (path, reduction)
+        future = self.builds.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            info = await loop.run_in_executor(None, read_info, folder, path, reduction)
+            if info is not None:
+                return info
+            failure = self.failures.get(key)
+            if failure is not None:
+                (mtimes, error) = failure
+                if await loop.run_in_executor(None, is_up_to_date, mtimes):
+                    raise error
+                self.failures.pop(key, None)
+            future = self.builds.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.__build(key, folder))
+            self.builds[key] = future
+            self.progress[key] = 0.0
+            future.add_done_callback(lambda done: self.__forget(key, done))
+        if not wait:
+            return None
+        # A client leaving must not cancel the build.
+        return await asyncio.shield(future)
+
+    def get_progress(self, path: str, reduction: str) -> float:
+        """Fraction of the pyramid of `path` that has been built."""
+        return self.progress.get((path, reduction), 1.0)
+
+    async def __build(self, key: Tuple[str, str], folder: str) -> dict:
+        (path, reduction) = key
+        loop = asyncio.get_running_loop()
+
+        def progress(value: float) -> None:
+            self.progress[key] = value
+
+        async with self.lock:
+            logger.info("Building the pyramid of %s", path)
+            os.makedirs(self.folder, exist_ok=True)
+            try:
+                info = await loop.run_in_executor(
+                    None, build_pyramid, path, reduction, folder, progress
+                )
+            except (Exception, EntryPointException) as ex:
+                mtimes = await loop.run_in_executor(None, get_volume_mtimes, path)
+                self.failures[key] = (mtimes, ex)
+                logger.error("Pyramid of %s failed: %s", path, ex)
+                raise
+            logger.info("Pyramid of %s has %d levels", path, len(info["levels"]))
+            return info
+
+    def __forget(self, key: Tuple[str, str], future: asyncio.Future) -> None:
+        self.builds.pop(key, None)
+        self.progress.pop(key, None)
+        if not future.cancelled():
+            # The error is kept in `failures`: don't warn about it.
+            future.exception()
@@ -1,5 +1,6 @@
 #!/usr/bin/bash
 
 echo Starting Brayns on port $1
-sleep 15
-echo "Brayns has started!"
+sleep 5
+echo "Server started on port $1"
+sleep 3600
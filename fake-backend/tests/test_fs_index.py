@@ -0,0 +1,48 @@
+"""Background refresh of the sandbox index.
+
+Usage: python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# pylint: disable=wrong-import-position
+from fs_index import FsIndex, glob_to_regex
+
+
+async def wait_for_refresh(index: FsIndex, built_at: float) -> None:
+    while index.snapshot is None or index.snapshot.built_at == built_at:
+        assert not index.task.done(), index.task
+        await asyncio.sleep(0.01)
+
+
+def test_refreshes_the_index_periodically(tmp_path):
+    (tmp_path / "first.txt").write_text("")
+
+    async def run():
+        index = FsIndex(
+            str(tmp_path),
+            {"index_workers": 2, "index_interval": 0.05, "index_max_paths": 1000},
+        )
+        index.start()
+        try:
+            await asyncio.wait_for(wait_for_refresh(index, 0.0), 5)
+            first = index.snapshot
+            assert first.find(str(tmp_path / "first.txt")) is not None
+            (tmp_path / "second.txt").write_text("")
+            await asyncio.wait_for(wait_for_refresh(index, first.built_at), 5)
+            second = index.snapshot
+            assert second.find(str(tmp_path / "second.txt")) is not None
+            assert not index.task.done()
+        finally:
+            index.task.cancel()
+
+    asyncio.run(run())
+
+
+def test_negated_classes_match_single_names():
+    blob = "\0x\0yy\0xb\0xa\0"
+    for glob in ("x[!a]*", "x[^a]*"):
+        assert glob_to_regex(glob, True).findall(blob) == ["xb"]
@@ -9,6 +9,7 @@ import FileSystemServiceInterface from "@/_old_/contract/service/file-system"
 import NexusInterface from "@/_old_/contract/service/nexus"
 import CalcInterface, { Vector3, Vector4 } from "@/_old_/contract/tool/calc"
 import GenericEvent from "@/_old_/tool/event"
+import { BraynsServicePyFileContent } from "@/_old_/tool/brayns-agent"
 import { fillPlaceholders } from "@/_old_/tool/placeholders"
 import Color from "@/_old_/ui/color/color"
 import ResourceAllocate from "./resources/allocate.sh"
@@ -156,6 +157,7 @@ export default class PythonScriptMakerFeature extends PythonScriptMakerFeatureIn
             > = [
                 ["allocate.sh", ResourceAllocate, { ACCOUNT: options.account }],
                 ["brayns.py", ResourceBrayns],
+                ["brayns_service.py", BraynsServicePyFileContent],
                 [
                     "script.py",
                     ResourceScript,
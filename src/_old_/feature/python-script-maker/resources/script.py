@@ -1,6 +1,7 @@
 import asyncio
 import pathlib
-from brayns import log, wait_for_brayns_to_be_ready, BraynsService
+from brayns import log, wait_for_brayns_to_be_ready
+from brayns_service import BraynsService
 
 # Image size.
 WIDTH = {{WIDTH}}
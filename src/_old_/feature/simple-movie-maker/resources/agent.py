@@ -4,13 +4,19 @@ import json
 import asyncio
 import pathlib
 import traceback
-import websockets
 from PIL import Image, ImageDraw, ImageFont
 from painter import Painter
+from brayns_service import BraynsService, ConnectionLostError
+from frame_scheduler import create_scheduler
 
 # Turn "debug" to True to get more verbose output for debugging purpose.
 debug = False
 
+# How long we try to reconnect to Brayns before giving up, in seconds.
+RECONNECT_TIMEOUT = 600
+# Number of times we try to render a frame if the connection is lost.
+FRAME_ATTEMPTS = 3
+
 
 def usage():
     print()
@@ -34,10 +40,13 @@ def usage():
     print('  > python {} "r1i7n12.bbp.epfl.ch:5000" 1/2'.format(sys.argv[0]))
     print()
     print(
-        "  The first instance will generate all the frames whose index modulo 2 is equal 0 (the even ones),"
+        "  The instances take the frames to render from a shared queue (output/claims/),"
+    )
+    print(
+        '  unless "scheduling" is "static" in config.json: then the first instance generates'
     )
     print(
-        "  and the second instance will generate all the frames whose index modulo 2 is equal 1 (the odd ones)."
+        "  the frames whose index modulo 2 is equal 0 (the even ones), and the second one the odd ones."
     )
     print()
     sys.exit(1)
@@ -75,106 +84,6 @@ def fatal(*message):
     sys.exit(1)
 
 
-class BraynsService:
-    running = True
-    host_and_port: str
-    connection: websockets.WebSocketClientProtocol = None
-    counter = 0
-    pending_queries = dict()
-
-    def __init__(self, host_and_port: str) -> None:
-        self.host_and_port = host_and_port
-        self.connection = None
-
-    async def exec(self, entrypoint: str, params=None):
-        await self.connect()
-        if debug:
-            log(">>>", f"{entrypoint}({json.dumps(params, indent=4)})")
-        id = self.next_id()
-        future = asyncio.Future()
-        self.pending_queries[id] = future
-        if params is None:
-            await self.connection.send(
-                json.dumps({"jsonrpc": "2.0", "id": id, "method": entrypoint})
-            )
-        else:
-            await self.connection.send(
-                json.dumps(
-                    {"jsonrpc": "2.0", "id": id, "method": entrypoint, "params": params}
-                )
-            )
-        response = await future
-        if debug:
-            log("<<<", json.dumps(response, indent=4))
-        if "result" in response:
-            return response["result"]
-        raise Exception(
-            f"""Error while calling entrypoint "{entrypoint}"!
-Params: {json.dumps(params, indent=4)}
-Result: {json.dumps(response, indent=4)}
-------------------------------------------------------------
-{self.get_error_message(response)}
-"""
-        )
-
-    def get_error_message(self, response):
-        if "error" not in response:
-            return "Unknown error!"
-        error = response["error"]
-        if "message" not in error:
-            return "Invalid error format!"
-        return error["message"]
-
-    async def close(self):
-        log("Closing connection...")
-        self.running = False
-        await self.connection.close()
-
-    def next_id(self):
-        self.counter = self.counter + 1
-        return f"ID-{self.counter}"
-
-    async def process_responses(self):
-        while self.running:
-            try:
-                message = await self.connection.recv()
-                data = json.loads(message)
-                if "id" not in data:
-                    if "params" in data and debug:
-                        params = data["params"]
-                        percent = 100 * float(params["amount"])
-                        label = params["operation"]
-                        log(f"Progress {percent:.1f}% - {label}")
-                    continue
-                id = data["id"]
-                future = self.pending_queries[id]
-                if future is not None:
-                    future.set_result(data)
-                else:
-                    log(json.dumps(data, indent=4))
-            except UnicodeDecodeError:
-                # Just ignore binary messages.
-                # They are JPEG images of the current scene.
-                pass
-            except websockets.exceptions.ConnectionClosedError as ex:
-                msg = str(ex)
-                if "1000 (OK)" not in msg:
-                    # If the connection is closed with a 1000 (OK)
-                    # message, that's normal.
-                    fatal("We lost the connection:", msg)
-            except Exception as ex:
-                fatal(type(ex).__name__, ex)
-
-    async def connect(self):
-        if self.connection is not None:
-            return
-        log(f'Connecting Websocket to "{self.host_and_port}"...')
-        self.connection = await websockets.connect(
-            f"ws://{self.host_and_port}", ping_interval=None
-        )
-        asyncio.create_task(self.process_responses())
-
-
 # Snapshot frames names are 6-zero-padded numbers.
 def pad(num, size=6):
     txt = str(num)
@@ -184,25 +93,25 @@ def pad(num, size=6):
 
 
 class FrameDescription:
+    index: int
     path: str
     path_final: str
     step: int
 
-    def __init__(self, path: str, path_final: str, step: int) -> None:
+    def __init__(self, index: int, path: str, path_final: str, step: int) -> None:
+        self.index = index
         self.path = path
         self.step = step
         self.path_final = path_final
 
 
-def get_frame_descriptions(config, instance_index, instances_count):
+def get_frame_descriptions(config):
     frames_count = int(config["fps"] * config["duration"])
     log("Total frames to generate:", frames_count)
     frame_descriptions = []
     first_step = config.get("firstStep", 0)
     last_step = config.get("lastStep", frames_count - 1)
     for frame_index in range(frames_count):
-        if frame_index % instances_count != instance_index:
-            continue
         step = (
             first_step
             if frames_count < 2
@@ -212,13 +121,23 @@ def get_frame_descriptions(config, instance_index, instances_count):
         )
         path_brayns = os.path.abspath(f"./output/brayns/{pad(frame_index)}.png")
         path_final = os.path.abspath(f"./output/final/{pad(frame_index)}.jpg")
-        if os.path.exists(path_brayns) and os.path.exists(path_final):
-            # Skip frames that have already been rendered.
-            continue
-        frame_descriptions.append(FrameDescription(path_brayns, path_final, step))
+        frame_descriptions.append(
+            FrameDescription(frame_index, path_brayns, path_final, step)
+        )
     return frame_descriptions
 
 
+def is_frame_done(frame: FrameDescription):
+    return os.path.exists(frame.path) and os.path.exists(frame.path_final)
+
+
+def prefetch_simulation_frame(service: BraynsService, step: int):
+    """Let Brayns load the report frame `step` while we composite the current one."""
+    hint = service.call("set-simulation-parameters", {"current": step})
+    # This is only a hint: its errors don't matter.
+    hint.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+
 def load_config():
     try:
         with open("./config.json", "r") as fd:
@@ -271,12 +190,20 @@ async def start():
         await wait_for_brayns_to_be_ready(instance_index)
         config = load_config()
         has_simulation = config.get("firstStep") != None
-        frame_descriptions = get_frame_descriptions(
-            config, instance_index, instances_count
+        prefetch = config.get("prefetch", True)
+        scheduler = create_scheduler(
+            config,
+            get_frame_descriptions(config),
+            is_frame_done,
+            instance_index,
+            instances_count,
+        )
+        # Brayns does not accept JSON-RPC arrays: batches are pipelined.
+        service = BraynsService(
+            brayns_hostname, debug, arrays=False, reconnect_timeout=RECONNECT_TIMEOUT
         )
-        service = BraynsService(brayns_hostname)
         exec = service.exec
-        if len(frame_descriptions) == 0:
+        if not scheduler.pending():
             log("Nothing to do.")
             await exec("quit")
             return
@@ -284,173 +211,177 @@ async def start():
         log(
             f"Connected to Brayns Service version {version['major']}.{version['minor']}.{version['patch']} ({version['revision']})"
         )
-        log("Setting renderer...")
-        await exec(
-            "set-renderer-interactive",
-            {
-                "ao_samples": 8,
-                "enable_shadows": False,
-                "max_ray_bounces": 3,
-                "samples_per_pixel": 4,
-            },
-        )
-        await exec("clear-lights")
-        await exec("add-light-ambient", {"color": [1, 1, 1], "intensity": 0.8})
-        log("Loading models...")
-        for model in config["models"]:
-            loader_name = model["loader"]["name"]
-            loader_props = model["loader"]["properties"]
-            path = model["loader"]["path"]
-            data = await exec(
-                "add-model",
-                {
-                    "loader_name": loader_name,
-                    "loader_properties": loader_props,
-                    "path": path,
-                },
-            )
-            model_id = data[0]["model_id"]
-            if has_simulation and "transferFunction" in model:
-                transfer_func = model["transferFunction"]
-                if transfer_func is not None:
-                    await exec(
-                        "set-color-ramp",
-                        {
-                            "id": model_id,
-                            "color_ramp": {
-                                "colors": transfer_func["colors"],
-                                "range": [
-                                    transfer_func["range"]["min"],
-                                    transfer_func["range"]["max"],
-                                ],
-                            },
-                        },
-                    )
-                await exec("enable-simulation", {"model_id": model_id, "enabled": True})
-            else:
-                try:
-                    await exec(
-                        "enable-simulation", {"model_id": model_id, "enabled": False}
-                    )
-                except:
-                    # If you are here, that means that there is no simulation at all.
-                    pass
-                await exec("color-model", {**model["colors"], "id": model_id})
-        log("Loading meshes...")
-        meshes_path = pathlib.Path(__file__).parent.resolve()
-        for mesh in config["meshes"]:
-            id = mesh["id"]
-            name = f"mesh-{id}.obj"
-            log(f"    Loading {name}")
-            path = pathlib.Path.joinpath(meshes_path, name)
-            models = await exec(
-                "add-model",
-                {"loader_name": "mesh", "loader_properties": {}, "path": str(path)},
-            )
-            model = models[0]
-            model_id = model["model_id"]
-            log("    Setting material...")
-            await exec("set-material-ghost", {"model_id": model_id, "material": {}})
+        # If Brayns restarts, these calls are replayed to restore the scene.
+        with service.recording():
+            log("Setting renderer...")
             await exec(
-                "color-model",
+                "set-renderer-interactive",
                 {
-                    "id": model_id,
-                    "method": "solid",
-                    "values": {"color": mesh["color"]},
+                    "ao_samples": 8,
+                    "enable_shadows": False,
+                    "max_ray_bounces": 3,
+                    "samples_per_pixel": 4,
                 },
             )
-        log("Data loaded successfuly.")
-        epflLogoPath = os.path.abspath("./epfl-logo.png")
-        bbpLogoPath = os.path.abspath("./bbp-logo.png")
-        frame_index = 0
-        for frame in frame_descriptions:
-            log(f"Setting camera for step {frame.step}...")
-            cameras_count = len(config["lookat"]["position"])
-            idx = frame.step % cameras_count
-            frame_index += 1
-            position = config["lookat"]["position"][idx]
-            target = config["lookat"]["target"][idx]
-            up = config["lookat"]["up"][idx]
-            await exec(
-                "set-camera-view", {"position": position, "target": target, "up": up}
-            )
-            height = config["orthographic"]["height"][idx]
-            await exec("set-camera-orthographic", {"height": height})
-            log(f'Generating "{frame.path}"...')
-            if has_simulation:
-                await exec(
-                    "snapshot",
+            await exec("clear-lights")
+            await exec("add-light-ambient", {"color": [1, 1, 1], "intensity": 0.8})
+            log("Loading models...")
+            for model in config["models"]:
+                loader_name = model["loader"]["name"]
+                loader_props = model["loader"]["properties"]
+                path = model["loader"]["path"]
+                data = await exec(
+                    "add-model",
                     {
-                        "image_settings": {
-                            "size": config["resolution"],
-                            "quality": 100,
-                        },
-                        "simulation_frame": frame.step,
-                        "file_path": frame.path,
+                        "loader_name": loader_name,
+                        "loader_properties": loader_props,
+                        "path": path,
                     },
                 )
-            else:
-                # No simulation.
+                model_id = data[0]["model_id"]
+                if has_simulation and "transferFunction" in model:
+                    transfer_func = model["transferFunction"]
+                    if transfer_func is not None:
+                        await exec(
+                            "set-color-ramp",
+                            {
+                                "id": model_id,
+                                "color_ramp": {
+                                    "colors": transfer_func["colors"],
+                                    "range": [
+                                        transfer_func["range"]["min"],
+                                        transfer_func["range"]["max"],
+                                    ],
+                                },
+                            },
+                        )
+                    await exec("enable-simulation", {"model_id": model_id, "enabled": True})
+                else:
+                    try:
+                        await exec(
+                            "enable-simulation", {"model_id": model_id, "enabled": False}
+                        )
+                    except:
+                        # If you are here, that means that there is no simulation at all.
+                        pass
+                    await exec("color-model", {**model["colors"], "id": model_id})
+            log("Loading meshes...")
+            meshes_path = pathlib.Path(__file__).parent.resolve()
+            for mesh in config["meshes"]:
+                id = mesh["id"]
+                name = f"mesh-{id}.obj"
+                log(f"    Loading {name}")
+                path = pathlib.Path.joinpath(meshes_path, name)
+                models = await exec(
+                    "add-model",
+                    {"loader_name": "mesh", "loader_properties": {}, "path": str(path)},
+                )
+                model = models[0]
+                model_id = model["model_id"]
+                log("    Setting material...")
+                await exec("set-material-ghost", {"model_id": model_id, "material": {}})
                 await exec(
-                    "snapshot",
+                    "color-model",
                     {
-                        "image_settings": {
-                            "size": config["resolution"],
-                            "quality": 100,
-                        },
-                        "file_path": frame.path,
+                        "id": model_id,
+                        "method": "solid",
+                        "values": {"color": mesh["color"]},
                     },
                 )
-            # ============================================
-            log(f'Compositing "{frame.path_final}"...')
-            margin = 3
-            [width, height] = config["resolution"]
-            output = Image.new("RGBA", (width, height))
-            painter = Painter(output)
-            (red, green, blue, _) = config["background"]
-            painter.clear(int(red * 255), int(green * 255), int(blue * 255))
-            # EPFL Logo
-            painter.move(0, 100, margin)
-            painter.align = "LB"
-            painter.image(epflLogoPath, 10)
-            # BBP Logo
-            painter.move(100, 100, margin)
-            painter.align = "RB"
-            painter.image(bbpLogoPath, 20)
-            # Brayns' snapshot.
-            painter.move(0, 0)
-            painter.align = "LT"
-            painter.image(frame.path, 100)
-            # Scalebar
-            painter.move(100, 0, margin)
-            painter.align = "RT"
-            painter.scalebar(
-                20, 1, config["orthographic"]["height"][frame.step] / height
-            )
-            if (
-                config.get("firstStep") != None
-                and config.get("lastStep") != None
-                and config.get("simulationTime") != None
-            ):
-                # Timeline
-                percent = (frame.step - config["firstStep"]) / (
-                    config["lastStep"] - config["firstStep"]
-                )
+        log("Data loaded successfuly.")
+        epflLogoPath = os.path.abspath("./epfl-logo.png")
+        bbpLogoPath = os.path.abspath("./bbp-logo.png")
+        frame_index = 0
+        frame = await scheduler.next()
+        while frame is not None:
+            async with scheduler.rendering(frame):
+                log(f"Setting camera for step {frame.step}...")
+                cameras_count = len(config["lookat"]["position"])
+                idx = frame.step % cameras_count
+                frame_index += 1
+                position = config["lookat"]["position"][idx]
+                target = config["lookat"]["target"][idx]
+                up = config["lookat"]["up"][idx]
+                height = config["orthographic"]["height"][idx]
+                log(f'Generating "{frame.path}"...')
+                snapshot = {
+                    "image_settings": {
+                        "size": config["resolution"],
+                        "quality": 100,
+                    },
+                    "file_path": frame.path,
+                }
+                if has_simulation:
+                    snapshot["simulation_frame"] = frame.step
+                for attempt in range(FRAME_ATTEMPTS):
+                    try:
+                        # The camera and the snapshot cost a single round trip.
+                        async with service.batch() as batch:
+                            batch.call(
+                                "set-camera-view",
+                                {"position": position, "target": target, "up": up},
+                            )
+                            batch.call("set-camera-orthographic", {"height": height})
+                            batch.call("snapshot", snapshot)
+                        break
+                    except ConnectionLostError as ex:
+                        if attempt + 1 == FRAME_ATTEMPTS:
+                            raise
+                        # The service reconnects by itself: render this frame again.
+                        log(f"Connection lost while rendering the frame: {ex}")
+                upcoming = scheduler.upcoming()
+                if has_simulation and prefetch and upcoming is not None:
+                    prefetch_simulation_frame(service, upcoming.step)
+                # ============================================
+                log(f'Compositing "{frame.path_final}"...')
+                margin = 3
+                [width, height] = config["resolution"]
+                output = Image.new("RGBA", (width, height))
+                painter = Painter(output)
+                (red, green, blue, _) = config["background"]
+                painter.clear(int(red * 255), int(green * 255), int(blue * 255))
+                # EPFL Logo
+                painter.move(0, 100, margin)
+                painter.align = "LB"
+                painter.image(epflLogoPath, 10)
+                # BBP Logo
+                painter.move(100, 100, margin)
+                painter.align = "RB"
+                painter.image(bbpLogoPath, 20)
+                # Brayns' snapshot.
+                painter.move(0, 0)
                 painter.align = "LT"
-                painter.move(0, 0, margin)
-                painter.progress(percent, 20, 3)
-                painter.move(0, 3, margin)
-                time = config["simulationTime"] * percent
-                painter.text(f"{time:.1f} {config['simulationUnit']}")
-                # Color Ramp
-                painter.move(0, 50, margin)
-                painter.align = "L"
-                [min_value, max_value] = config["simulationRange"]
-                painter.colorramp(33, min_value, max_value)
-            # Output final image
-            image = output.convert("RGB")
-            image.save(frame.path_final)
-
+                painter.image(frame.path, 100)
+                # Scalebar
+                painter.move(100, 0, margin)
+                painter.align = "RT"
+                painter.scalebar(
+                    20, 1, config["orthographic"]["height"][frame.step] / height
+                )
+                if (
+                    config.get("firstStep") != None
+                    and config.get("lastStep") != None
+                    and config.get("simulationTime") != None
+                ):
+                    # Timeline
+                    percent = (frame.step - config["firstStep"]) / (
+                        config["lastStep"] - config["firstStep"]
+                    )
+                    painter.align = "LT"
+                    painter.move(0, 0, margin)
+                    painter.progress(percent, 20, 3)
+                    painter.move(0, 3, margin)
+                    time = config["simulationTime"] * percent
+                    painter.text(f"{time:.1f} {config['simulationUnit']}")
+                    # Color Ramp
+                    painter.move(0, 50, margin)
+                    painter.align = "L"
+                    [min_value, max_value] = config["simulationRange"]
+                    painter.colorramp(33, min_value, max_value)
+                # Output final image
+                image = output.convert("RGB")
+                image.save(frame.path_final)
+            frame = await scheduler.next()
     except Exception as ex:
         if debug:
             traceback.log_exc()
@@ -0,0 +1,276 @@
+"""Assignment of the frames of a movie to the agents rendering it.
+
+The frames are split in blocks of `blockSize` contiguous frames (1 by
+default), and each agent renders whole blocks. With a simulation, the
+frames of a block use successive report frames, which Brayns reads
+sequentially instead of seeking all over the report.
+
+With the "dynamic" scheduling, the agents take the blocks from a shared
+queue: the `output/claims/` folder on the shared filesystem. An agent
+claims a block by creating its claim file with O_CREAT | O_EXCL, which
+succeeds for one agent only. While the block is being rendered, the
+agent refreshes the modification time of its claim. A claim that has
+not been refreshed for `lease` seconds belongs to a dead agent: another
+agent takes it over by replacing it with its own claim. Each claim holds
+a token unique to it, and the agent taking it over first creates a
+marker named after this token with O_CREAT | O_EXCL, so only one agent
+can take over a given claim. An agent that finds another token in its
+claim has lost its block: it drops the frames it has not rendered yet,
+and leaves the claim alone. Fast agents render more blocks than slow
+ones, and the movie is done when the last block is.
+
+With the "static" scheduling, the agent `index` of `count` renders the
+blocks whose index modulo `count` is `index`.
+"""
+import asyncio
+import contextlib
+import os
+import socket
+import time
+from typing import Callable, List, Optional
+
+# Seconds without refreshing after which a claim is considered abandoned.
+LEASE = 120
+# Seconds between two scans of the claims, when all of them are held by other agents.
+POLL_INTERVAL = 5
+
+
+def log(*message: str):
+    print(*message, flush=True)
+
+
+def split_in_blocks(frames: list, block_size: int) -> List[list]:
+    return [frames[start:start + block_size] for start in range(0, len(frames), block_size)]
+
+
+class StaticScheduler:
+    def __init__(
+        self,
+        frames: list,
+        is_done: Callable[[object], bool],
+        instance_index: int,
+        instances_count: int,
+        block_size: int = 1,
+    ) -> None:
+        self.frames = [
+            frame
+            for (index, block) in enumerate(split_in_blocks(frames, block_size))
+            if index % instances_count == instance_index
+            for frame in block
+            if not is_done(frame)
+        ]
+
+    def pending(self) -> bool:
+        """Are there frames left to render?"""
+        return len(self.frames) > 0
+
+    async def next(self):
+        """Next frame to render, or `None` if we are done."""
+        return self.frames.pop(0) if len(self.frames) > 0 else None
+
+    def upcoming(self):
+        """Frame that `next()` will return after the current one, if we know it."""
+        return self.frames[0] if len(self.frames) > 0 else None
+
+    @contextlib.asynccontextmanager
+    async def rendering(self, frame):
+        yield
+
+
+class DynamicScheduler:
+    def __init__(
+        self,
+        frames: list,
+        folder: str,
+        is_done: Callable[[object], bool],
+        owner: str,
+        lease: float = LEASE,
+        block_size: int = 1,
+    ) -> None:
+        """Share `frames` (objects with an `index`) through the claims of `folder`.
+
+        `is_done(frame)` tells if a frame has already been rendered.
+        `owner` is written in the claims, to know who is rendering what.
+        """
+        self.blocks = split_in_blocks(frames, block_size)
+        self.folder = folder
+        self.is_done = is_done
+        self.owner = owner
+        self.lease = lease
+        # Frames left in the block we hold, its claim, the token written
+        # in the claim and the task refreshing it.
+        self.frames: list = []
+        self.claim: Optional[int] = None
+        self.token = ""
+        self.heartbeat: Optional[asyncio.Task] = None
+        self.claims_count = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def pending(self) -> bool:
+        """Are there frames left to render (by us or by other agents)?"""
+        return any(not self.is_done(frame) for block in self.blocks for frame in block)
+
+    async def next(self):
+        """Next frame to render, or `None` once all the frames are done.
+
+        Once the frames of our block are done, release it and claim the
+        next one. If the remaining blocks are all being rendered by other
+        agents, wait: we will take over the ones of the agents that die.
+        """
+        self.frames = [frame for frame in self.frames if not self.is_done(frame)]
+        if len(self.frames) > 0:
+            return self.frames.pop(0)
+        self.__release()
+        while True:
+            remaining = []
+            for (position, block) in enumerate(self.blocks):
+                frames = [frame for frame in block if not self.is_done(frame)]
+                if len(frames) == 0:
+                    continue
+                remaining.append(block)
+                index = block[0].index
+                if not self.__claim(index):
+                    continue
+                # Frames can have been rendered between our check and our claim.
+                frames = [frame for frame in frames if not self.is_done(frame)]
+                if len(frames) == 0:
+                    remaining.pop()
+                    self.__unlink(index, self.token)
+                    continue
+                self.blocks = remaining[:-1] + self.blocks[position + 1:]
+                self.claim = index
+                self.heartbeat = asyncio.ensure_future(self.__refresh(index, self.token))
+                self.frames = frames[1:]
+                return frames[0]
+            self.blocks = remaining
+            if len(remaining) == 0:
+                return None
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def upcoming(self):
+        """Frame that `next()` will return after the current one, if it is in our block."""
+        return self.frames[0] if len(self.frames) > 0 else None
+
+    @contextlib.asynccontextmanager
+    async def rendering(self, frame):
+        """Give our block back to the queue if the rendering of `frame` fails."""
+        try:
+            yield
+        except BaseException:
+            self.frames = []
+            self.__release()
+            raise
+
+    def __claim(self, index: int) -> bool:
+        path = self.__get_path(index)
+        self.claims_count += 1
+        self.token = f"{self.owner}-{self.claims_count}"
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return self.__take_over(index)
+        with os.fdopen(fd, "w") as claim:
+            claim.write(f"{self.token}\n")
+        return True
+
+    def __take_over(self, index: int) -> bool:
+        """Replace the claim of `index` by ours if it is abandoned."""
+        path = self.__get_path(index)
+        token = self.__read_token(path)
+        if token is None or not self.__is_abandoned(path):
+            return False
+        marker = f"{path}.{token}.takeover"
+        try:
+            # Only one agent can create the marker of this claim.
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+        except FileExistsError:
+            return False
+        try:
+            # The marker can have been removed by an agent which has already
+            # taken over this claim: check that it is still the abandoned one.
+            if self.__read_token(path) != token or not self.__is_abandoned(path):
+                return False
+            log(f"Taking over the abandoned claim of the block of frame #{index}.")
+            replacement = f"{path}.{self.token}.new"
+            with open(replacement, "w") as claim:
+                claim.write(f"{self.token}\n")
+            os.replace(replacement, path)
+            return True
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(marker)
+
+    def __release(self):
+        """Drop the claim of our block, if we hold one."""
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+            self.heartbeat = None
+        if self.claim is not None:
+            self.__unlink(self.claim, self.token)
+            self.claim = None
+
+    def __unlink(self, index: int, token: str):
+        """Remove the claim of `index`, unless another agent has taken it over."""
+        path = self.__get_path(index)
+        if self.__read_token(path) != token:
+            return
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+
+    def __read_token(self, path: str) -> Optional[str]:
+        try:
+            with open(path) as claim:
+                return claim.readline().strip()
+        except FileNotFoundError:
+            return None
+
+    def __is_abandoned(self, path: str) -> bool:
+        try:
+            return time.time() - os.stat(path).st_mtime > self.lease
+        except FileNotFoundError:
+            # Released in the meantime: the block is probably done.
+            return False
+
+    async def __refresh(self, index: int, token: str):
+        path = self.__get_path(index)
+        while True:
+            await asyncio.sleep(self.lease / 4)
+            if self.__read_token(path) == token:
+                with contextlib.suppress(FileNotFoundError):
+                    os.utime(path)
+                    continue
+            log(f"The claim of the block of frame #{index} has been taken over by another agent!")
+            # Leave the rest of the block to its new owner.
+            self.frames = []
+            self.claim = None
+            self.heartbeat = None
+            return
+
+    def __get_path(self, index: int) -> str:
+        return os.path.join(self.folder, f"{index:06d}")
+
+
+def create_scheduler(
+    config: dict,
+    frames: list,
+    is_done: Callable[[object], bool],
+    instance_index: int,
+    instances_count: int,
+):
+    """Scheduler of the frames, according to `config["scheduling"]` ("dynamic" by default)."""
+    scheduling = config.get("scheduling", "dynamic")
+    block_size = max(1, int(config.get("blockSize", 1)))
+    if scheduling == "static":
+        return StaticScheduler(
+            frames, is_done, instance_index, instances_count, block_size
+        )
+    if scheduling != "dynamic":
+        raise Exception(f'Unknown scheduling "{scheduling}"!')
+    return DynamicScheduler(
+        frames,
+        os.path.abspath("./output/claims"),
+        is_done,
+        f"{socket.gethostname()}-{instance_index}-{os.getpid()}",
+        config.get("claimLease", LEASE),
+        block_size,
+    )
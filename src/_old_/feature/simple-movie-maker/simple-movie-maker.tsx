@@ -11,12 +11,14 @@ import FileSystemServiceInterface from "@/_old_/contract/service/file-system"
 import NexusInterface from "@/_old_/contract/service/nexus"
 import CalcInterface, { Vector3, Vector4 } from "@/_old_/contract/tool/calc"
 import GenericEvent from "@/_old_/tool/event"
+import { BraynsServicePyFileContent } from "@/_old_/tool/brayns-agent"
 import { fillPlaceholders } from "@/_old_/tool/placeholders"
 import Color from "@/_old_/ui/color/color"
 import { KeyFrame } from "@/_old_/view/page/main/sections/movie/KeyFramesEditor"
 import { makeColorRamp } from "./color-ramp"
 import ActivateShFileContent from "./resources/activate.sh"
 import AgentPyFileContent from "./resources/agent.py"
+import FrameSchedulerPyFileContent from "./resources/frame_scheduler.py"
 import BbpLogoURL from "./resources/bbp-logo.png"
 import EpflLogoURL from "./resources/epfl-logo.png"
 import FontURL from "./resources/font.ttf.bin"
@@ -26,6 +28,12 @@ import RequirementsTxtFileContent from "./resources/requirements.txt"
 import ScalebarPyFileContent from "./resources/scalebar.py"
 import StartShFileContent from "./resources/start.sh"
 
+/**
+ * Number of contiguous frames rendered by the same agent when there is
+ * a simulation (see "frame_scheduler.py").
+ */
+const SIMULATION_BLOCK_SIZE = 16
+
 export default class SimpleMovieMakerFeature extends SimpleMovieMakerFeatureInterface {
     public readonly eventProgress = new GenericEvent<string>()
 
@@ -77,6 +85,8 @@ export default class SimpleMovieMakerFeature extends SimpleMovieMakerFeatureInte
                     },
                 ],
                 ["agent.py", AgentPyFileContent],
+                ["brayns_service.py", BraynsServicePyFileContent],
+                ["frame_scheduler.py", FrameSchedulerPyFileContent],
                 ["make-movie.py", MakeMoviePyFileContent],
                 ["painter.py", PainterPyFileContent],
                 ["requirements.txt", RequirementsTxtFileContent],
@@ -144,6 +154,7 @@ export default class SimpleMovieMakerFeature extends SimpleMovieMakerFeatureInte
             lastStep: options.lastStep,
             duration: options.duration,
             ...this.makeSimulationRange(options),
+            ...this.makeSchedulingConfig(options),
             background: await this.makeBackgroundColor(),
             models: await this.makeModelsConfig(),
             meshes: meshes.map((mesh) => ({
@@ -173,6 +184,19 @@ export default class SimpleMovieMakerFeature extends SimpleMovieMakerFeatureInte
         }
     }
 
+    /**
+     * The agents share the frames dynamically. With a simulation, they
+     * render blocks of contiguous frames, to read the report sequentially.
+     */
+    private makeSchedulingConfig(options: SimpleMovieMakerFeatureOptions) {
+        const hasSimulation = options.mainModelId > -1 && options.reportRange
+        return {
+            scheduling: "dynamic",
+            blockSize: hasSimulation ? SIMULATION_BLOCK_SIZE : 1,
+            prefetch: true,
+        }
+    }
+
     private async makeBackgroundColor() {
         return await this.braynsService.getSceneBackgroundColor()
     }
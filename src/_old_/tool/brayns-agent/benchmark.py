@@ -0,0 +1,110 @@
+"""Throughput of BraynsService against a local mock of Brayns.
+
+The mock answers each request (or array of requests) after `--latency`
+milliseconds, in the order of the requests, like Brayns behind a cluster
+link. We compare sequential calls (one round trip per call), pipelined
+calls and batches of 3 calls (like the camera and snapshot of a frame).
+Batches are measured twice: against a mock accepting JSON-RPC arrays,
+and against one rejecting them like Brayns does, where the service
+falls back to pipelining the calls of the batches.
+
+    python benchmark.py --calls 500 --latency 2
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import websockets
+
+from brayns_service import BraynsService
+
+
+def answer(request: dict) -> dict:
+    return {"jsonrpc": "2.0", "id": request["id"], "result": request.get("params")}
+
+
+def reject(_requests: list) -> dict:
+    return {"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid request"}}
+
+
+async def mock_brayns(websocket, _path=None, latency: float = 0.002, arrays: bool = True):
+    """Answer every request with its params, after `latency` seconds.
+
+    Without `arrays`, arrays of requests get an error without id.
+    """
+    async def reply(message: str, due: float, previous: asyncio.Task):
+        await asyncio.sleep(max(0, due - time.monotonic()))
+        if previous is not None:
+            # Keep the responses in order.
+            await previous
+        request = json.loads(message)
+        if isinstance(request, list) and not arrays:
+            await websocket.send(json.dumps(reject(request)))
+        elif isinstance(request, list):
+            await websocket.send(json.dumps([answer(item) for item in request]))
+        else:
+            await websocket.send(json.dumps(answer(request)))
+
+    previous = None
+    async for message in websocket:
+        previous = asyncio.create_task(reply(message, time.monotonic() + latency, previous))
+
+
+async def measure(label: str, calls: int, run):
+    start = time.perf_counter()
+    await run()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>10}: {calls} calls in {elapsed:.3f} s ({calls / elapsed:.0f} calls/s)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=2, help="In milliseconds.")
+    parser.add_argument("--port", type=int, default=5999)
+    args = parser.parse_args()
+    latency = args.latency / 1000
+
+    async def handler(websocket, path=None):
+        await mock_brayns(websocket, path, latency)
+
+    async def strict_handler(websocket, path=None):
+        await mock_brayns(websocket, path, latency, arrays=False)
+
+    async with websockets.serve(handler, "127.0.0.1", args.port), \
+            websockets.serve(strict_handler, "127.0.0.1", args.port + 1):
+        service = BraynsService(f"127.0.0.1:{args.port}")
+        await service.connect()
+
+        async def sequential():
+            for index in range(args.calls):
+                await service.exec("set-camera-view", {"index": index})
+
+        async def pipelined():
+            calls = [
+                service.call("set-camera-view", {"index": index})
+                for index in range(args.calls)
+            ]
+            await asyncio.gather(*calls)
+
+        async def batched(service: BraynsService):
+            for index in range(0, args.calls, 3):
+                async with service.batch() as batch:
+                    for offset in range(min(3, args.calls - index)):
+                        batch.call("set-camera-view", {"index": index + offset})
+
+        await measure("sequential", args.calls, sequential)
+        await measure("pipelined", args.calls, pipelined)
+        await measure("arrays", args.calls, lambda: batched(service))
+        await service.close()
+        # Detects that arrays are rejected with its first batch, like with Brayns.
+        strict = BraynsService(f"127.0.0.1:{args.port + 1}")
+        await strict.connect()
+        await measure("no arrays", args.calls, lambda: batched(strict))
+        assert strict.arrays is False
+        await strict.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
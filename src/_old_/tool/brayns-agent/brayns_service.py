@@ -0,0 +1,511 @@
+"""Client of the Brayns JSON-RPC websocket API, shared by the agents.
+
+Requests are pipelined: `call()` queues a request and returns at once,
+so many requests can be in flight on the same connection. They are sent
+in the order of the calls, and each call resolves with the result of
+its own request:
+
+    view = service.call("set-camera-view", {...})
+    height = service.call("set-camera-orthographic", {...})
+    await service.exec("snapshot", {...})  # Waits for the snapshot only.
+
+`exec()` is the usual "send and wait for the result" call.
+
+Calls that go together can be sent in a batch, in a single message (a
+JSON-RPC array) if the server supports it, otherwise pipelined:
+
+    async with service.batch() as batch:
+        batch.call("set-camera-view", {...})
+        batch.call("set-camera-orthographic", {...})
+        batch.call("snapshot", {...})
+    [_, _, snapshot] = batch.results
+
+Whether the server supports arrays is detected with the first batch:
+a server that answers an array with an error gets its requests again,
+one by one, and will never receive arrays.
+
+Every call can have a timeout (the `timeout` of the service by default).
+A call that times out or is cancelled asks Brayns to cancel its request.
+If the connection is lost, all the pending calls fail with
+`ConnectionLostError`, and the next call opens a new connection.
+
+With a `reconnect_timeout`, the service reconnects by itself instead,
+with a growing delay between the attempts (1 s to 30 s), and gives up
+after `reconnect_timeout` seconds. The calls made in the meantime are
+sent once the connection is back. To restore the scene of a Brayns
+instance that has been restarted, the calls made in a `recording()`
+block are replayed after reconnecting, unless the scene still has its
+models (the connection was lost, not Brayns). The models loaded again
+get new ids, which replace the old ones in the "id" and "model_id"
+params of the calls that follow. A replayed call that gets no answer
+in time (`timeout`, or `REPLAY_TIMEOUT` without one) closes the
+connection, to try again with a new one. A connection opened again by
+a call, after the service has given up reconnecting, also replays them.
+
+    with service.recording():
+        await service.exec("set-renderer-interactive", {...})
+        await service.exec("add-model", {...})
+"""
+import asyncio
+import contextlib
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import websockets
+
+
+# Delays between reconnection attempts, in seconds.
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+# Timeout of the replayed calls, in seconds, if the service has none.
+# Loading a big circuit again can take a while.
+REPLAY_TIMEOUT = 1800
+
+
+def log(*message: str):
+    print(*message, flush=True)
+
+
+class BraynsError(Exception):
+    """Brayns answered a request with an error."""
+
+    def __init__(self, entrypoint: str, params: Any, response: dict) -> None:
+        self.entrypoint = entrypoint
+        self.params = params
+        self.response = response
+        super().__init__(
+            f"""Error while calling entrypoint "{entrypoint}"!
+Params: {json.dumps(params, indent=4)}
+Result: {json.dumps(response, indent=4)}
+------------------------------------------------------------
+{get_error_message(response)}
+"""
+        )
+
+
+class ConnectionLostError(Exception):
+    """The connection was closed before the response arrived."""
+
+
+class BraynsService:
+    def __init__(
+        self,
+        host_and_port: str,
+        debug: bool = False,
+        timeout: Optional[float] = None,
+        arrays: Optional[bool] = None,
+        reconnect_timeout: Optional[float] = None,
+    ) -> None:
+        """Set the address of Brayns and the default timeout of the calls, in seconds.
+
+        `None` means no timeout.
+        `arrays` tells if batches can be sent as JSON-RPC arrays (`None`
+        means "detect it"). A server can run the requests of an array
+        concurrently: use `False` with a server that does not keep them
+        in order, if the calls of the batches depend on each other.
+        `reconnect_timeout` is how long we try to reconnect after losing
+        the connection, in seconds (`None` means we don't).
+        """
+        self.host_and_port = host_and_port
+        self.debug = debug
+        self.timeout = timeout
+        self.arrays = arrays
+        # Messages of the array sent to detect if the server supports arrays.
+        self.probe: Optional[List[str]] = None
+        self.connection: Optional[websockets.WebSocketClientProtocol] = None
+        self.counter = 0
+        # Futures of the requests waiting for a response, by id.
+        self.pending: Dict[str, asyncio.Future] = {}
+        # Messages waiting to be sent, in order.
+        self.outgoing: Optional[asyncio.Queue] = None
+        # Task owning the connection, and future resolved once it is open.
+        self.runner: Optional[asyncio.Task] = None
+        self.ready: Optional[asyncio.Future] = None
+        self.closing = False
+        self.reconnect_timeout = reconnect_timeout
+        # Calls replayed after a reconnection: (entrypoint, params, task).
+        self.replay_log: List[Tuple[str, Any, asyncio.Task]] = []
+        self.recording_calls = False
+        # Has the connection been lost since the scene was last restored?
+        # This survives the runners: a connection opened again after giving
+        # up also restores the scene.
+        self.restoring = False
+
+    def call(
+        self, entrypoint: str, params=None, timeout: Optional[float] = -1
+    ) -> asyncio.Task:
+        """Queue a request and return a task resolved with its result.
+
+        The request is sent after the ones already queued, without waiting
+        for their responses. The task raises `BraynsError` if Brayns
+        answers with an error, `asyncio.TimeoutError` after `timeout`
+        seconds (-1 means the timeout of the service) and
+        `ConnectionLostError` if the connection is lost.
+        Cancelling the task cancels the request.
+        """
+        [task] = self.call_many([(entrypoint, params)], timeout)
+        return task
+
+    def call_many(
+        self, calls: List[Tuple[str, Any]], timeout: Optional[float] = -1
+    ) -> List[asyncio.Task]:
+        """Queue `(entrypoint, params)` requests to be sent together.
+
+        Return a task per request (see `call()`).
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        self.__start()
+        loop = asyncio.get_running_loop()
+        messages = []
+        tasks = []
+        for (entrypoint, params) in calls:
+            query_id = self.next_id()
+            message = {"jsonrpc": "2.0", "id": query_id, "method": entrypoint}
+            if params is not None:
+                message["params"] = params
+            if self.debug:
+                log(">>>", f"{entrypoint}({json.dumps(params, indent=4)})")
+            future = loop.create_future()
+            self.pending[query_id] = future
+            messages.append(json.dumps(message))
+            task = asyncio.ensure_future(
+                self.__wait(query_id, future, entrypoint, params, timeout)
+            )
+            if self.recording_calls:
+                self.replay_log.append((entrypoint, params, task))
+            tasks.append(task)
+        if len(messages) > 1 and (
+            self.arrays or (self.arrays is None and self.probe is None)
+        ):
+            if self.arrays is None:
+                self.probe = messages
+            self.outgoing.put_nowait("[" + ",".join(messages) + "]")
+        else:
+            for message in messages:
+                self.outgoing.put_nowait(message)
+        return tasks
+
+    def batch(self, timeout: Optional[float] = -1) -> "Batch":
+        """Context manager sending the calls made in its block together.
+
+        `timeout` applies to each call (-1 means the timeout of the service).
+        """
+        return Batch(self, timeout)
+
+    @contextlib.contextmanager
+    def recording(self):
+        """Record the calls of this block, to replay them after a reconnection."""
+        self.recording_calls = True
+        try:
+            yield
+        finally:
+            self.recording_calls = False
+
+    async def exec(self, entrypoint: str, params=None, timeout: Optional[float] = -1):
+        """Send a request and wait for its result (see `call()`)."""
+        return await self.call(entrypoint, params, timeout)
+
+    async def connect(self):
+        """Open the connection, if it is not already open."""
+        self.__start()
+        await asyncio.shield(self.ready)
+
+    async def close(self):
+        log("Closing connection...")
+        self.closing = True
+        if self.connection is not None:
+            await self.connection.close()
+        if self.runner is not None:
+            await self.runner
+
+    def next_id(self):
+        self.counter = self.counter + 1
+        return f"ID-{self.counter}"
+
+    def __start(self):
+        """Start the task owning the connection, unless it is running."""
+        if self.runner is not None and not self.runner.done():
+            return
+        self.closing = False
+        self.outgoing = asyncio.Queue()
+        self.ready = asyncio.get_running_loop().create_future()
+        self.runner = asyncio.ensure_future(self.__run())
+
+    async def __run(self):
+        reason = "Connection closed."
+        # Time when the connection was lost, if we are reconnecting.
+        lost = None
+        delay = RECONNECT_DELAY
+        try:
+            while True:
+                connected = False
+                try:
+                    log(f'Connecting Websocket to "{self.host_and_port}"...')
+                    self.connection = await websockets.connect(
+                        f"ws://{self.host_and_port}", ping_interval=None
+                    )
+                    connected = True
+                    reader = asyncio.ensure_future(self.__read(self.connection))
+                    if self.restoring:
+                        await self.__restore(reader)
+                        self.restoring = False
+                    if lost is not None:
+                        log(f"Reconnected after {time.monotonic() - lost:.1f} s.")
+                    if not self.ready.done():
+                        self.ready.set_result(None)
+                    writer = asyncio.create_task(self.__write(self.connection))
+                    try:
+                        reason = await reader
+                    finally:
+                        writer.cancel()
+                    # The next loss is measured from its own time.
+                    lost = None
+                    delay = RECONNECT_DELAY
+                except (OSError, websockets.exceptions.WebSocketException) as ex:
+                    reason = f"Unable to connect to {self.host_and_port}: {ex}"
+                except ConnectionLostError as ex:
+                    reason = str(ex)
+                self.connection = None
+                if connected:
+                    # The calls made while reconnecting wait for the next connection.
+                    self.__fail_pending(reason)
+                    if not self.closing:
+                        self.restoring = True
+                if self.closing or self.reconnect_timeout is None or not self.ready.done():
+                    return
+                if lost is None:
+                    lost = time.monotonic()
+                elif time.monotonic() - lost > self.reconnect_timeout:
+                    log(f"Giving up after {self.reconnect_timeout} s without connection.")
+                    return
+                log(reason)
+                log(f"Reconnecting in {delay} s...")
+                await asyncio.sleep(delay)
+                delay = min(MAX_RECONNECT_DELAY, delay * 2)
+        finally:
+            self.connection = None
+            if not self.ready.done():
+                self.ready.set_exception(ConnectionLostError(reason))
+            self.__fail_pending(reason)
+
+    async def __restore(self, reader: asyncio.Task):
+        """Replay the recorded calls, unless Brayns has kept its scene."""
+        if len(self.replay_log) == 0:
+            return
+        try:
+            scene = await self.__request(reader, "get-scene")
+        except BraynsError:
+            scene = {}
+        if len(scene.get("models", [])) > 0:
+            log("Brayns has kept its scene.")
+            return
+        log(f"Restoring the scene ({len(self.replay_log)} calls)...")
+        # The models get new ids: use them in the calls that follow.
+        model_ids: Dict[int, int] = {}
+        for (entrypoint, params, task) in self.replay_log:
+            if not task.done() or task.cancelled() or task.exception() is not None:
+                # This call had no effect.
+                continue
+            params = remap_model_ids(params, model_ids)
+            try:
+                result = await self.__request(reader, entrypoint, params)
+            except BraynsError as ex:
+                log(f'Replay of "{entrypoint}" failed:', get_error_message(ex.response))
+                continue
+            if entrypoint == "add-model":
+                for (old, new) in zip(task.result(), result):
+                    model_ids[old["model_id"]] = new["model_id"]
+
+    async def __request(self, reader: asyncio.Task, entrypoint: str, params=None):
+        """Send a request before any queued one, and wait for its result.
+
+        If Brayns does not answer in time, close the connection to try again
+        with a new one.
+        """
+        query_id = self.next_id()
+        message = {"jsonrpc": "2.0", "id": query_id, "method": entrypoint}
+        if params is not None:
+            message["params"] = params
+        future = asyncio.get_running_loop().create_future()
+        self.pending[query_id] = future
+        timeout = self.timeout if self.timeout is not None else REPLAY_TIMEOUT
+        try:
+            await self.connection.send(json.dumps(message))
+            await asyncio.wait(
+                {future, reader}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            del self.pending[query_id]
+        if not future.done() and not reader.done():
+            await self.connection.close()
+            raise ConnectionLostError(f'No answer to "{entrypoint}" after {timeout} s.')
+        if not future.done():
+            raise ConnectionLostError(reader.result())
+        response = future.result()
+        if "result" in response:
+            return response["result"]
+        raise BraynsError(entrypoint, params, response)
+
+    async def __read(self, connection) -> str:
+        """Dispatch the responses until the connection is closed, and return why."""
+        try:
+            async for message in connection:
+                if isinstance(message, bytes):
+                    # Binary messages are JPEG images of the current scene.
+                    continue
+                self.__dispatch(json.loads(message))
+        except websockets.exceptions.ConnectionClosed as ex:
+            return f"We lost the connection: {ex}"
+        return "Connection closed."
+
+    async def __write(self, connection):
+        while True:
+            message = await self.outgoing.get()
+            await connection.send(message)
+
+    def __dispatch(self, data):
+        if isinstance(data, list):
+            # Response to a batch.
+            if self.arrays is None:
+                self.arrays = True
+                self.probe = None
+            for item in data:
+                self.__dispatch(item)
+            return
+        if self.probe is not None and data.get("id") is None and "error" in data:
+            # An error without id (or with a null one) while the array is
+            # unanswered: the server rejected it. Send its requests again,
+            # one by one.
+            log("Brayns does not support batches:", get_error_message(data))
+            self.arrays = False
+            for message in self.probe:
+                self.outgoing.put_nowait(message)
+            self.probe = None
+            return
+        if "id" not in data:
+            if "params" in data and self.debug:
+                params = data["params"]
+                percent = 100 * float(params.get("amount", 0))
+                label = params.get("operation", data.get("method"))
+                log(f"Progress {percent:.1f}% - {label}")
+            return
+        future = self.pending.get(data["id"])
+        if future is None:
+            # Response of a cancelled request.
+            if self.debug:
+                log(json.dumps(data, indent=4))
+        elif not future.done():
+            future.set_result(data)
+
+    async def __wait(
+        self,
+        query_id: str,
+        future: asyncio.Future,
+        entrypoint: str,
+        params,
+        timeout: Optional[float],
+    ):
+        try:
+            response = await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self.__cancel(query_id)
+            raise
+        finally:
+            del self.pending[query_id]
+        if self.debug:
+            log("<<<", json.dumps(response, indent=4))
+        if "result" in response:
+            return response["result"]
+        raise BraynsError(entrypoint, params, response)
+
+    def __cancel(self, query_id: str):
+        """Ask Brayns to cancel a request, without waiting for the answer."""
+        if self.connection is None or self.closing:
+            return
+        self.outgoing.put_nowait(json.dumps({
+            "jsonrpc": "2.0",
+            "id": self.next_id(),
+            "method": "cancel",
+            "params": {"id": query_id},
+        }))
+
+    def __fail_pending(self, reason: str):
+        self.probe = None
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionLostError(reason))
+        # Requests that have not been sent yet are dropped with their futures.
+        while self.outgoing is not None and not self.outgoing.empty():
+            self.outgoing.get_nowait()
+
+
+class Batch:
+    """Calls sent together when the `async with` block ends.
+
+    `call()` returns a future of the result of the call, and `results`
+    holds all the results, in order, once the block is done. If some
+    calls fail, the error of the first one is raised at the end of the
+    block, once all the calls are done. Nothing is sent if the block
+    raises an exception.
+    """
+
+    def __init__(self, service: BraynsService, timeout: Optional[float]) -> None:
+        self.service = service
+        self.timeout = timeout
+        self.calls: List[Tuple[str, Any, asyncio.Future]] = []
+        self.results: List[Any] = []
+
+    def call(self, entrypoint: str, params=None) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.calls.append((entrypoint, params, future))
+        return future
+
+    async def __aenter__(self) -> "Batch":
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            for (_, _, future) in self.calls:
+                future.cancel()
+            return False
+        if len(self.calls) == 0:
+            return False
+        tasks = self.service.call_many(
+            [(entrypoint, params) for (entrypoint, params, _) in self.calls], self.timeout
+        )
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        error = None
+        for ((_, _, future), outcome) in zip(self.calls, outcomes):
+            if isinstance(outcome, BaseException):
+                future.set_exception(outcome)
+                # The error is raised below: don't warn about unretrieved futures.
+                future.exception()
+                error = error or outcome
+            else:
+                future.set_result(outcome)
+        self.results = [None if isinstance(o, BaseException) else o for o in outcomes]
+        if error is not None:
+            raise error
+        return False
+
+
+def remap_model_ids(params, model_ids: Dict[int, int]):
+    """Replace the old model ids of `params` by the new ones."""
+    if not isinstance(params, dict) or len(model_ids) == 0:
+        return params
+    params = dict(params)
+    for key in ("id", "model_id"):
+        if params.get(key) in model_ids:
+            params[key] = model_ids[params[key]]
+    return params
+
+
+def get_error_message(response):
+    if "error" not in response:
+        return "Unknown error!"
+    error = response["error"]
+    if "message" not in error:
+        return "Invalid error format!"
+    return error["message"]
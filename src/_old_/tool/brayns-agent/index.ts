@@ -0,0 +1,8 @@
+import BraynsServicePyFileContent from "./brayns_service.py"
+
+/**
+ * Python client of Brayns shared by the agents we generate scripts for
+ * (movies, collages, Python scripts). Save it as "brayns_service.py"
+ * next to the agent.
+ */
+export { BraynsServicePyFileContent }
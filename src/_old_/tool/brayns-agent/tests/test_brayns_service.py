@@ -0,0 +1,63 @@
+"""Reconnection of BraynsService to a mock of Brayns.
+
+Usage: python -m pytest tests
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from brayns_service import BraynsService
+
+
+async def mock_brayns(websocket, _path=None):
+    """Answer every request with its params."""
+    async for message in websocket:
+        request = json.loads(message)
+        await websocket.send(json.dumps(
+            {"jsonrpc": "2.0", "id": request["id"], "result": request.get("params")}
+        ))
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_reconnects_after_each_drop():
+    port = get_free_port()
+
+    async def drop(server, service: BraynsService, index: int):
+        """Restart the server with a call made while it is down."""
+        server.close()
+        await server.wait_closed()
+        # Let the service notice the drop before calling.
+        await asyncio.sleep(0.1)
+        call = service.call("echo", {"call": index})
+        await asyncio.sleep(0.3)
+        server = await websockets.serve(mock_brayns, "127.0.0.1", port)
+        assert await asyncio.wait_for(call, 5) == {"call": index}
+        return server
+
+    async def run():
+        server = await websockets.serve(mock_brayns, "127.0.0.1", port)
+        service = BraynsService(f"127.0.0.1:{port}", reconnect_timeout=1)
+        try:
+            assert await service.exec("echo", {"call": 1}) == {"call": 1}
+            server = await drop(server, service, 2)
+            # Longer than `reconnect_timeout` after the first drop.
+            await asyncio.sleep(1.5)
+            server = await drop(server, service, 3)
+        finally:
+            await service.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
@@ -6,7 +6,7 @@ import traceback
 
 import log
 import cells
-from brayns import BraynsService
+from brayns_service import BraynsService
 from calc import get_axis_from_quaternion, add_vector, scale_vector
 
 # Turn "debug" to True to get more verbose output for debugging purpose.
@@ -112,7 +112,8 @@ async def start():
             log.info("Don't wait for Brayns to be ready.")
         else:
             await wait_for_brayns_to_be_ready(instance_index)
-        service = BraynsService(brayns_hostname, debug)
+        # Brayns does not accept JSON-RPC arrays: batches are pipelined.
+        service = BraynsService(brayns_hostname, debug, arrays=False)
         exec = service.exec
         slices = config["slices"]
         if len(slices) == 0:
@@ -142,55 +143,61 @@ async def start():
             width = slice["width"]
             height = slice["height"]
             depth = slice["depth"]
-            log.info("Setting camera...")
-            await exec("set-camera-view", {
-                "position": add_vector(
-                    center,
-                    scale_vector(axisZ, 2*depth)
-                ),
-                "target": center,
-                "up": axisY
-            })
-            await exec("set-camera-orthographic", {
-                "height": slice["height"]
-            })
-            await exec("clear-models")
-            await exec("clear-clip-planes")
-            for model in models:
-                path = model["loader"]["path"]
-                log.info("Loading model from", path)
-                loader_name = model["loader"]["name"]
-                loader_props = model["loader"]["properties"]
-                if loader_name == "BBP loader":
-                    gids = cells.clip_gids(
-                        model["cells"],
+            log.info("Setting camera and loading models...")
+            # The camera, the clearing and the models cost a single round trip.
+            async with service.batch() as batch:
+                batch.call("set-camera-view", {
+                    "position": add_vector(
                         center,
-                        [axisX, axisY, axisZ],
-                        [width, height, depth],
-                        config["cellsPerSlice"]
-                    )
-                    log.info("We keep", len(gids), "cells on a total of", len(model["cells"]))
-                    loader_props["gids"] = gids
-                    loader_props["percentage"] = 1
-                    log.info(f"GIDS: {gids}")
-                data = await exec("add-model", {
-                    "loader_name": loader_name,
-                    "loader_properties": loader_props,
-                    "path": path
+                        scale_vector(axisZ, 2*depth)
+                    ),
+                    "target": center,
+                    "up": axisY
+                })
+                batch.call("set-camera-orthographic", {
+                    "height": slice["height"]
                 })
-                if "transferFunction" in model:
-                    log.info("Applying transfer function...")
-                    transfer_func = model["transferFunction"]
-                    await exec("set-color-ramp", {
-                        "id": data[0]["model_id"],
-                        "color_ramp": {
-                            "colors": transfer_func["colors"],
-                            "range": [
-                                transfer_func["range"]["min"],
-                                transfer_func["range"]["max"]
-                            ]
-                        }
-                    })
+                batch.call("clear-models")
+                batch.call("clear-clip-planes")
+                added_models = []
+                for model in models:
+                    path = model["loader"]["path"]
+                    log.info("Loading model from", path)
+                    loader_name = model["loader"]["name"]
+                    loader_props = model["loader"]["properties"]
+                    if loader_name == "BBP loader":
+                        gids = cells.clip_gids(
+                            model["cells"],
+                            center,
+                            [axisX, axisY, axisZ],
+                            [width, height, depth],
+                            config["cellsPerSlice"]
+                        )
+                        log.info("We keep", len(gids), "cells on a total of", len(model["cells"]))
+                        loader_props["gids"] = gids
+                        loader_props["percentage"] = 1
+                        log.info(f"GIDS: {gids}")
+                    added_models.append((model, batch.call("add-model", {
+                        "loader_name": loader_name,
+                        "loader_properties": loader_props,
+                        "path": path
+                    })))
+            async with service.batch() as batch:
+                for (model, added) in added_models:
+                    if "transferFunction" in model:
+                        log.info("Applying transfer function...")
+                        transfer_func = model["transferFunction"]
+                        data = added.result()
+                        batch.call("set-color-ramp", {
+                            "id": data[0]["model_id"],
+                            "color_ramp": {
+                                "colors": transfer_func["colors"],
+                                "range": [
+                                    transfer_func["range"]["min"],
+                                    transfer_func["range"]["max"]
+                                ]
+                            }
+                        })
             log.info("Data loaded successfuly.")
             path = os.path.abspath(f"./output/final/{pad(slice_index)}")
             log.info(f"Taking snapshot: {path}")
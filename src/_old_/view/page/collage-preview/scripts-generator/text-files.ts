@@ -3,11 +3,11 @@ import ActivateShFileContent from "./resources/activate.sh"
 import AgentPyFileContent from "./resources/agent.py"
 import CalcPyFileContent from "./resources/calc.py"
 import CellsPyFileContent from "./resources/cells.py"
-import BraynsPyFileContent from "./resources/brayns.py"
 import LogPyFileContent from "./resources/log.py"
 import MakeSlicesPyFileContent from "./resources/make-slices.py"
 import RequirementsTxtFileContent from "./resources/requirements.txt"
 import StartShFileContent from "./resources/start.sh"
+import { BraynsServicePyFileContent } from "@/_old_/tool/brayns-agent"
 import { fillPlaceholders } from "@/_old_/tool/placeholders"
 import {
     GenerateScriptsForMorphologyCollageOptions,
@@ -22,7 +22,7 @@ export async function saveTextFiles(
         [
             ["activate.sh", ActivateShFileContent],
             ["agent.py", AgentPyFileContent],
-            ["brayns.py", BraynsPyFileContent],
+            ["brayns_service.py", BraynsServicePyFileContent],
             ["calc.py", CalcPyFileContent],
             ["cells.py", CellsPyFileContent],
             ["log.py", LogPyFileContent],